@@ -0,0 +1,393 @@
+// Local job service of the cashflow model: projection jobs are submitted over HTTP on localhost, queued and run by
+// warm Python workers (scripts/worker.py), so that scripts and other tools on the same machine can drive runs without
+// the GUI.
+//
+// Start with:  npm run serve  (or: node job_server.js --port 5005 --concurrency 2)
+//
+// Endpoints:
+//   POST /jobs                 submit a job (body = user input, same keys as the JSON file written by the app, with
+//                              absolute file paths)
+//   GET  /jobs                 list the jobs
+//   GET  /jobs/:id             job status
+//   GET  /jobs/:id/progress    job progress (batch i of n, policies/s, ETA for model point file runs) and log entries
+//                              (?since=<number of entries already received>)
+//   POST /jobs/:id/cancel      cancel a queued or running job (also: DELETE /jobs/:id). A running job stops after its
+//                              current model point batch and keeps the completed batches; it is stopped after
+//                              CANCEL_TIMEOUT if it does not respond
+//   GET  /jobs/:id/result      PV results, equivalence check, stage times and output location of a completed (or
+//                              cancelled, or equivalence_failed) job
+
+const express = require("express");
+const bodyParser = require("body-parser");
+const { spawn } = require("child_process");
+const readline = require("readline");
+const crypto = require("crypto");
+const path = require("path");
+const fs = require("fs");
+const os = require("os");
+
+// Settings (command line arguments, then environment variables)
+function getSetting(name, envName, defaultValue) {
+  const index = process.argv.indexOf(`--${name}`);
+  if (index > -1 && process.argv[index + 1] !== undefined) {
+    return process.argv[index + 1];
+  }
+  return process.env[envName] || defaultValue;
+}
+
+const HOST = "127.0.0.1";
+const PORT = parseInt(getSetting("port", "CF_PROJ_PORT", "5005"), 10);
+const CONCURRENCY = Math.max(
+  1,
+  parseInt(getSetting("concurrency", "CF_PROJ_CONCURRENCY", "2"), 10)
+);
+const JOBS_DIR = path.join(os.tmpdir(), "cf_proj_jobs");
+const WORKER_RESTART_DELAY = 1000; // milliseconds, doubled after each failed start
+const WORKER_MAX_RESTART_DELAY = 30000; // milliseconds
+const WORKER_MAX_FAILURES = 5; // failed starts in a row before the workers are given up
+const WORKER_STARTUP_TIME = 10000; // milliseconds: a worker closed after this time (or after a message) had started
+const CANCEL_TIMEOUT = parseInt(
+  getSetting("cancel-timeout", "CF_PROJ_CANCEL_TIMEOUT", "30000"),
+  10
+); // milliseconds
+
+// Python worker command: the packaged executable if it exists, otherwise main.py with the Python interpreter
+function getWorkerCommand() {
+  const executablePath = path.join(__dirname, "scripts", "dist", "cf_proj.exe");
+  const pythonPath = process.env.CF_PROJ_PYTHON;
+  if (!pythonPath && fs.existsSync(executablePath)) {
+    return { command: executablePath, args: ["--worker"] };
+  }
+  return {
+    command: pythonPath || "python",
+    args: [path.join(__dirname, "scripts", "main.py"), "--worker"],
+  };
+}
+
+const jobs = new Map();
+const queue = [];
+const workers = [];
+
+// Failed worker starts in a row, and the error once the workers are given up (the queued jobs are then failed)
+let workerFailures = 0;
+let workerError = null;
+
+// ---------------------------------------------------------------------
+// Workers
+// ---------------------------------------------------------------------
+
+function startWorker() {
+  const { command, args } = getWorkerCommand();
+  const worker = {
+    process: spawn(command, args, { cwd: path.join(__dirname, "scripts") }),
+    job: null,
+    startedAt: Date.now(),
+    spawned: false,
+    started: false,
+    error: null,
+  };
+
+  // One JSON message per line (see scripts/worker.py)
+  readline
+    .createInterface({ input: worker.process.stdout })
+    .on("line", (line) => handleWorkerMessage(worker, line));
+
+  worker.process.stderr.on("data", (data) => {
+    console.error(`[worker ${worker.process.pid}] ${data.toString()}`);
+  });
+
+  // Jobs are only sent to a worker once its process exists
+  worker.process.on("spawn", () => {
+    worker.spawned = true;
+    dispatchJobs();
+  });
+
+  worker.process.on("error", (error) => {
+    worker.error = error.message;
+    console.error(`Python worker could not be started: ${error.message}`);
+  });
+
+  worker.process.on("close", (code) => {
+    workers.splice(workers.indexOf(worker), 1);
+    const job = worker.job;
+    if (job && job.status === "running") {
+      finishJob(job, "failed", { error: `Python worker exited with code ${code}` });
+    } else if (job && job.status === "cancelling") {
+      finishJob(job, "cancelled", {});
+    }
+
+    // A worker that closes before it has started (e.g. Python not found, or failing at import) counts as a failed
+    // start: it is restarted with an exponential backoff, and given up after WORKER_MAX_FAILURES failures in a row
+    if (worker.started || Date.now() - worker.startedAt >= WORKER_STARTUP_TIME) {
+      workerFailures = 0;
+    } else {
+      workerFailures += 1;
+    }
+    if (workerFailures >= WORKER_MAX_FAILURES) {
+      workerError =
+        `Python worker could not be started (${workerFailures} attempts): ` +
+        (worker.error || `exited with code ${code}`);
+      console.error(workerError);
+      dispatchJobs();
+      return;
+    }
+
+    // Replace the worker (e.g. after a cancellation) and continue with the queue
+    const delay = Math.min(
+      WORKER_RESTART_DELAY * 2 ** Math.max(workerFailures - 1, 0),
+      WORKER_MAX_RESTART_DELAY
+    );
+    setTimeout(() => {
+      startWorker();
+      dispatchJobs();
+    }, delay);
+  });
+
+  workers.push(worker);
+  return worker;
+}
+
+function handleWorkerMessage(worker, line) {
+  // The worker is running (see the close handler of startWorker)
+  worker.started = true;
+  workerFailures = 0;
+  workerError = null;
+
+  let message;
+  try {
+    message = JSON.parse(line);
+  } catch (error) {
+    console.log(line);
+    return;
+  }
+
+  const job = jobs.get(message.id);
+  if (!job || (job.status !== "running" && job.status !== "cancelling")) {
+    return;
+  }
+
+  if (message.event === "log") {
+    job.log.push(message.message);
+  } else if (message.event === "progress") {
+    job.progress = message;
+  } else if (
+    message.event === "completed" ||
+    message.event === "cancelled" ||
+    message.event === "equivalence_failed"
+  ) {
+    // A run failing the equivalence check has written its output: its results are kept with the check summary
+    worker.job = null;
+    finishJob(job, message.event, {
+      error: message.error,
+      result: {
+        pvResults: message.pvResults,
+        equivalence: message.equivalence,
+        stages: message.stages,
+        workbookCached: message.workbookCached,
+        wallTime: message.wallTime,
+        cpuTime: message.cpuTime,
+        outputFilePath: job.userInput.outputFilePath,
+        outputFileName: job.userInput.outputFileName,
+        outputFormat: job.userInput.outputFormat,
+      },
+    });
+    dispatchJobs();
+  } else if (message.event === "failed") {
+    worker.job = null;
+    finishJob(job, "failed", { error: message.error });
+    dispatchJobs();
+  }
+}
+
+// Send the queued jobs to the idle workers, or fail them if no worker can be started
+function dispatchJobs() {
+  if (workerError && workers.length === 0) {
+    while (queue.length > 0) {
+      finishJob(queue.shift(), "failed", { error: workerError });
+    }
+    return;
+  }
+
+  for (const worker of workers) {
+    if (queue.length === 0) {
+      return;
+    }
+    if (worker.job || !worker.spawned) {
+      continue;
+    }
+
+    const job = queue.shift();
+    job.status = "running";
+    job.startedAt = new Date().toISOString();
+    worker.job = job;
+    worker.process.stdin.write(
+      JSON.stringify({ id: job.id, jsonPath: job.jsonPath }) + "\n"
+    );
+  }
+}
+
+// ---------------------------------------------------------------------
+// Jobs
+// ---------------------------------------------------------------------
+
+function finishJob(job, status, fields) {
+  Object.assign(job, fields);
+  job.status = status;
+  job.finishedAt = new Date().toISOString();
+
+  // The worker deletes the JSON file after a successful run
+  for (const filePath of [job.jsonPath, `${job.jsonPath}.cancel`]) {
+    if (fs.existsSync(filePath)) {
+      fs.unlinkSync(filePath);
+    }
+  }
+}
+
+function getJobStatus(job) {
+  return {
+    id: job.id,
+    status: job.status,
+    submittedAt: job.submittedAt,
+    startedAt: job.startedAt,
+    finishedAt: job.finishedAt,
+    queuePosition: job.status === "queued" ? queue.indexOf(job) + 1 : null,
+    error: job.error,
+  };
+}
+
+function cancelJob(job) {
+  if (job.status === "queued") {
+    queue.splice(queue.indexOf(job), 1);
+    finishJob(job, "cancelled", {});
+  } else if (job.status === "running") {
+    // Ask the worker to stop after the current model point batch (cancel file, see scripts/progress.py)
+    job.status = "cancelling";
+    fs.writeFileSync(`${job.jsonPath}.cancel`, "");
+
+    // Stop the worker if the job does not respond (e.g. a single model point run), it is replaced by a new worker
+    setTimeout(() => {
+      const worker = workers.find((w) => w.job === job);
+      if (job.status === "cancelling" && worker) {
+        worker.process.kill();
+      }
+    }, CANCEL_TIMEOUT);
+  }
+}
+
+// ---------------------------------------------------------------------
+// HTTP API
+// ---------------------------------------------------------------------
+
+const app = express();
+app.use(bodyParser.json({ limit: "10mb" }));
+
+app.post("/jobs", (req, res) => {
+  const userInput = req.body;
+  if (!userInput || !userInput.filePath || !userInput.outputFilePath) {
+    return res
+      .status(400)
+      .json({ error: "The job must contain 'filePath' and 'outputFilePath'." });
+  }
+
+  // Write the user input as the temporary JSON file of the run
+  const id = crypto.randomUUID();
+  const jsonPath = path.join(JOBS_DIR, `${id}.json`);
+  fs.writeFileSync(jsonPath, JSON.stringify(userInput));
+
+  const job = {
+    id: id,
+    status: "queued",
+    submittedAt: new Date().toISOString(),
+    startedAt: null,
+    finishedAt: null,
+    userInput: userInput,
+    jsonPath: jsonPath,
+    log: [],
+    progress: null,
+    result: null,
+    error: null,
+  };
+  jobs.set(id, job);
+  queue.push(job);
+  dispatchJobs();
+
+  res.status(202).json(getJobStatus(job));
+});
+
+app.get("/jobs", (req, res) => {
+  res.json(Array.from(jobs.values(), getJobStatus));
+});
+
+// Find the job of the request, or answer 404
+function findJob(req, res) {
+  const job = jobs.get(req.params.id);
+  if (!job) {
+    res.status(404).json({ error: `Job not found: ${req.params.id}` });
+  }
+  return job;
+}
+
+app.get("/jobs/:id", (req, res) => {
+  const job = findJob(req, res);
+  if (job) {
+    res.json(getJobStatus(job));
+  }
+});
+
+app.get("/jobs/:id/progress", (req, res) => {
+  const job = findJob(req, res);
+  if (job) {
+    const since = parseInt(req.query.since || "0", 10) || 0;
+    res.json({
+      ...getJobStatus(job),
+      progress: job.progress,
+      logEntries: job.log.length,
+      lastLog: job.log.length > 0 ? job.log[job.log.length - 1] : null,
+      log: job.log.slice(since),
+    });
+  }
+});
+
+function handleCancel(req, res) {
+  const job = findJob(req, res);
+  if (!job) {
+    return;
+  }
+  if (job.status !== "queued" && job.status !== "running") {
+    return res
+      .status(409)
+      .json({ ...getJobStatus(job), error: `Job already ${job.status}.` });
+  }
+  cancelJob(job);
+  res.json(getJobStatus(job));
+}
+
+app.post("/jobs/:id/cancel", handleCancel);
+app.delete("/jobs/:id", handleCancel);
+
+app.get("/jobs/:id/result", (req, res) => {
+  const job = findJob(req, res);
+  if (!job) {
+    return;
+  }
+  // A cancelled model point file run has the results of its completed batches
+  if (!job.result) {
+    return res.status(409).json(getJobStatus(job));
+  }
+  res.json({ ...getJobStatus(job), result: job.result });
+});
+
+// ---------------------------------------------------------------------
+// Start the service
+// ---------------------------------------------------------------------
+
+fs.mkdirSync(JOBS_DIR, { recursive: true });
+for (let i = 0; i < CONCURRENCY; i++) {
+  startWorker();
+}
+
+app.listen(PORT, HOST, () => {
+  console.log(
+    `Job service listening on http://${HOST}:${PORT} (${CONCURRENCY} Python workers).`
+  );
+});
@@ -3,6 +3,9 @@ const { execFile } = require("child_process");
 const path = require("path");
 const fs = require("fs");
 
+// Exit code of a cancelled python run (see scripts/progress.py)
+const EXIT_CANCELLED = 3;
+
 function createWindow() {
   const mainWindow = new BrowserWindow({
     width: 800,
@@ -30,6 +33,12 @@ ipcMain.handle("run-python-script", async (event, jsonFilePath) => {
     "cf_proj.exe"
   );
 
+  // Remove a cancel file left over from an earlier run
+  const cancelFilePath = `${jsonFilePath}.cancel`;
+  if (fs.existsSync(cancelFilePath)) {
+    fs.unlinkSync(cancelFilePath);
+  }
+
   try {
     // run the .exe
     process = execFile(pythonExecutablePath, [jsonFilePath]);
@@ -49,6 +58,12 @@ ipcMain.handle("run-python-script", async (event, jsonFilePath) => {
       process.on("close", (code) => {
         if (code === 0) {
           resolve({ success: true });
+        } else if (code === EXIT_CANCELLED) {
+          resolve({
+            success: false,
+            cancelled: true,
+            error: "Run cancelled. The completed model point batches have been exported.",
+          });
         } else {
           reject(new Error(`Python script exited with code ${code}`));
         }
@@ -61,6 +76,12 @@ ipcMain.handle("run-python-script", async (event, jsonFilePath) => {
   }
 });
 
+// Function to cancel the python run: the run stops after the current model point batch
+ipcMain.handle("cancel-python-script", (event, jsonFilePath) => {
+  fs.writeFileSync(`${jsonFilePath}.cancel`, "");
+  return { success: true };
+});
+
 // Function to write JSON file (using fs module)
 ipcMain.handle("write-json-file", (event, filePath, data) => {
   fs.writeFileSync(filePath, data);
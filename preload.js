@@ -6,6 +6,10 @@ contextBridge.exposeInMainWorld("electronAPI", {
   runPythonScript: (jsonFilePath) =>
     ipcRenderer.invoke("run-python-script", jsonFilePath),
 
+  // exposing python script cancellation
+  cancelPythonScript: (jsonFilePath) =>
+    ipcRenderer.invoke("cancel-python-script", jsonFilePath),
+
   // exposing fs module called from main.js
   writeJsonFile: (filePath, data) =>
     ipcRenderer.invoke("write-json-file", filePath, data),
@@ -45,7 +45,9 @@ function testFillInput() {
   };
 
   inputsElement.forEach((input) => {
-    input.value = testInput[input.id];
+    if (input.id in testInput) {
+      input.value = testInput[input.id];
+    }
   });
 }
 
@@ -53,12 +55,25 @@ document.addEventListener("DOMContentLoaded", async () => {
   const runButton = document.querySelector("#run-script-icon");
   const dirname = await window.electronAPI.getDirname();
 
+  const cancelButton = document.querySelector(".cancel-run-button");
+  const runProgress = document.querySelector(".run-progress");
+  const jsonFilePath = `${dirname}/user_input.json`;
+
   // Display python log messages received from main-process via 'python-log' channel.
   window.electronAPI.onPythonLog((event, log) => {
     const logWrapper = document.querySelector(".log-wrapper");
-    const logLines = log.split("\r\n");
+    const logLines = log.split(/\r?\n/);
     logLines.forEach((line) => {
-      if (line.trim() !== "") {
+      if (line.startsWith("PROGRESS ")) {
+        // Structured progress event of a model point file run (see scripts/progress.py)
+        const progress = JSON.parse(line.slice("PROGRESS ".length));
+        runProgress.textContent =
+          `Batch ${progress.batch} of ${progress.batches} - ` +
+          `${progress.policies} of ${progress.totalPolicies} policies` +
+          (progress.etaSeconds !== null
+            ? ` - ${Math.round(progress.policiesPerSecond)} policies/s, ETA ${Math.round(progress.etaSeconds)} s`
+            : "");
+      } else if (line.trim() !== "") {
         // Ignore empty lines
         const logDiv = document.createElement("div");
         logDiv.classList.add("py-log");
@@ -70,13 +85,16 @@ document.addEventListener("DOMContentLoaded", async () => {
 
   // Add event listener to run python script
   // Approach: Get user input in html -> create json file -> python read json file
+  // Add event listener to cancel the python run (it stops after the current model point batch)
+  cancelButton.addEventListener("click", async () => {
+    await window.electronAPI.cancelPythonScript(jsonFilePath);
+    runProgress.textContent = "Cancelling ...";
+  });
+
   runButton.addEventListener("click", async () => {
     // Get user input
     const user_input = getUserInput();
 
-    // Define JSON path
-    const jsonFilePath = `${dirname}/user_input.json`;
-
     // Write user input to JSON file
     await window.electronAPI.writeJsonFile(
       jsonFilePath,
@@ -86,6 +104,7 @@ document.addEventListener("DOMContentLoaded", async () => {
     // Initialise log section for logging
     const logWrapper = document.querySelector(".log-wrapper");
     logWrapper.textContent = "Running Python ...";
+    runProgress.textContent = "";
 
     // Run python script
     try {
@@ -0,0 +1,627 @@
+"""
+array_store.py
+
+This module handles the memory-mapped NumPy result store. The projection output is kept on disk as one `.npy` file per
+column group (e.g. reference columns, decrements, per-policy and inforce cashflows), each with the shape
+(policies x months x columns). A small JSON index ("index.json") describes the layout of the store.
+
+The engine writes into the store directly by policy slice: the batches of a model point file run (padded layout) are
+written as they are projected, so the per-policy projection never needs to be assembled in memory. Later analysis opens the store in read-only mode and slices the memory-mapped arrays lazily, without copying the data.
+
+The per-policy results of model point file runs are kept in a ragged store instead (see `proj_result.RaggedResult`): one
+flat `.npy` file per column holding the periods in cover of every policy, policy after policy, plus the offset
+("offsets.npy") and number of periods ("lengths.npy") of each policy. Its size grows with the sum of the policy terms,
+and it can be exported to Parquet (one list column per cashflow) when pyarrow is installed.
+"""
+
+import numpy as np
+import json
+import os
+import data_read as read
+import engine as eng
+
+INDEX_FILE_NAME = "index.json"
+RAGGED_LAYOUT = "ragged"
+
+# Column groups of the store, following the projection stages of `engine.py`
+STORE_GROUPS = {
+    "reference": ["reference"],
+    "economic": ["economic"],
+    "decrement": ["decrement"],
+    "per_policy": ["unit_pp", "risk_pp", "shf_pp"],
+    "inforce": ["unit_if", "risk_if", "shf_if"],
+}
+
+
+def get_store_groups(columns):
+    """
+    Get the columns of each column group of the store.
+
+    Parameters
+    ----------
+    columns : container
+        The columns to be stored (e.g. a list of column names or a ProjectionResult).
+
+    Returns
+    -------
+    dict
+        A dictionary of {column group name: list of column names}, without the empty groups.
+
+    Notes
+    -----
+    Columns shared by several tables (e.g. Insurance_Charge_PP) are stored once, in the first group they appear in.
+    """
+
+    group_columns = {}
+    stored = set()
+    for group, stages in STORE_GROUPS.items():
+        cols = [
+            col
+            for stage in stages
+            for col in eng.COLUMN_GROUPS[stage]
+            if col in columns and col not in stored
+        ]
+        cols = list(dict.fromkeys(cols))
+        stored.update(cols)
+        if cols:
+            group_columns[group] = cols
+
+    return group_columns
+
+
+def create_array_store(
+    store_dir, n_policies, n_months, group_columns, dtype="float64", reuse=False
+):
+    """
+    Create an empty memory-mapped array store on disk.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory where the store will be created.
+
+    n_policies : int
+        The number of model points (policies) held in the store.
+
+    n_months : int
+        The number of projection months.
+
+    group_columns : dict
+        A dictionary of {column group name: list of column names}.
+
+    dtype : str
+        The NumPy data type of the stored values.
+
+    reuse : bool
+        Whether an existing store with the same layout is opened instead (e.g. to resume a checkpointed run, whose
+        completed batches are already written).
+
+    Returns
+    -------
+    dict
+        The store dictionary with keys "dir", "index" and "arrays" (a memory-mapped array for each column group).
+    """
+
+    index = {
+        "n_policies": int(n_policies),
+        "n_months": int(n_months),
+        "dtype": str(np.dtype(dtype)),
+        "groups": {
+            group: {"file": f"{group}.npy", "columns": list(columns)}
+            for group, columns in group_columns.items()
+        },
+    }
+
+    if reuse and os.path.exists(os.path.join(store_dir, INDEX_FILE_NAME)):
+        store = open_array_store(store_dir, mode="r+")
+        if store["index"] == index:
+            return store
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    arrays = {}
+    for group, columns in group_columns.items():
+        file_name = index["groups"][group]["file"]
+        arrays[group] = np.lib.format.open_memmap(
+            os.path.join(store_dir, file_name),
+            mode="w+",
+            dtype=dtype,
+            shape=(n_policies, n_months, len(columns)),
+        )
+
+    with open(os.path.join(store_dir, INDEX_FILE_NAME), "w") as f:
+        json.dump(index, f, indent=4)
+
+    return {"dir": store_dir, "index": index, "arrays": arrays}
+
+
+def open_array_store(store_dir, mode="r"):
+    """
+    Open an existing memory-mapped array store.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory of the store.
+
+    mode : str
+        The memory-map mode: "r" (read-only, default) or "r+" (read and write).
+
+    Returns
+    -------
+    dict
+        The store dictionary with keys "dir", "index" and "arrays".
+
+    Notes
+    -----
+    No data is read at this point. The arrays are memory-mapped and pages are only loaded when a slice is accessed.
+    """
+
+    with open(os.path.join(store_dir, INDEX_FILE_NAME), "r") as f:
+        index = json.load(f)
+
+    arrays = {
+        group: np.load(os.path.join(store_dir, info["file"]), mmap_mode=mode)
+        for group, info in index["groups"].items()
+    }
+
+    return {"dir": store_dir, "index": index, "arrays": arrays}
+
+
+def write_policy_slice(store, group, start, values):
+    """
+    Write the projection values of a block of policies into a column group of the store.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary returned by create_array_store or open_array_store (mode "r+").
+
+    group : str
+        The column group name.
+
+    start : int
+        The index of the first policy in the block.
+
+    values : ndarray
+        The values to be written, with shape (policies x months x columns) or (months x columns) for a single policy.
+        Values of fewer months than the store (e.g. a batch projected to the end of its longest policy) are written to
+        the first months.
+
+    Returns
+    -------
+    None
+    """
+
+    values = np.asarray(values)
+    if values.ndim == 2:
+        values = values[np.newaxis, :, :]
+
+    store["arrays"][group][start : start + values.shape[0], : values.shape[1]] = values
+
+
+def write_padded_policies(store, result, first_policy):
+    """
+    Write the padded projection result of a batch of policies into the store.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary returned by create_array_store (every column of the store must be in the result).
+
+    result : ProjectionResult
+        The projection result of the batch.
+
+    first_policy : int
+        The index of the first policy of the batch in the store.
+
+    Returns
+    -------
+    None
+    """
+
+    for group, info in store["index"]["groups"].items():
+        write_policy_slice(
+            store,
+            group,
+            first_policy,
+            np.stack([result[col] for col in info["columns"]], axis=-1),
+        )
+
+
+def flush_array_store(store):
+    """
+    Flush all the memory-mapped arrays of the store to disk.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary.
+
+    Returns
+    -------
+    None
+    """
+
+    for array in store["arrays"].values():
+        if isinstance(array, np.memmap):
+            array.flush()
+
+
+def get_column(store, column, policies=slice(None)):
+    """
+    Get a zero-copy view of a column for the selected policies.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary.
+
+    column : str
+        The column name (e.g. "Profit_IF").
+
+    policies : slice or int
+        The policies to select. All policies by default.
+
+    Returns
+    -------
+    ndarray
+        A memory-mapped view with shape (policies x months), or (months,) when a single policy is selected.
+    """
+
+    for group, info in store["index"]["groups"].items():
+        if column in info["columns"]:
+            col_id = info["columns"].index(column)
+            return store["arrays"][group][policies, :, col_id]
+
+    raise KeyError(f"Column '{column}' not found in the array store.")
+
+
+def write_projection_store(
+    store_dir, result, log_list, dtype="float64", chunk_size=1000
+):
+    """
+    Create an array store for a projection result and write it by policy slices.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory where the store will be created.
+
+    result : ProjectionResult
+        The projection result to be stored.
+
+    log_list : list
+        The list that stores all log entries.
+
+    dtype : str
+        The NumPy data type of the stored values.
+
+    chunk_size : int
+        The number of policies written per slice.
+
+    Returns
+    -------
+    list
+        The updated log list.
+    """
+
+    group_columns = get_store_groups(result)
+    store = create_array_store(
+        store_dir, result.n_policies, result.n_months, group_columns, dtype=dtype
+    )
+
+    for group, cols in group_columns.items():
+        for start in range(0, result.n_policies, chunk_size):
+            stop = min(start + chunk_size, result.n_policies)
+            write_policy_slice(
+                store,
+                group,
+                start,
+                np.stack([result[col][start:stop] for col in cols], axis=-1),
+            )
+    flush_array_store(store)
+
+    log_list = read.log_message(
+        f"Projection written to memory-mapped array store in: {store_dir}", log_list
+    )
+
+    return log_list
+
+
+def get_policy_lengths(pol_year, n_months=1200, time_step="monthly", elapsed_months=0):
+    """
+    Get the number of periods in cover of each model point (the periods held in the ragged layout).
+
+    Parameters
+    ----------
+    pol_year : array-like
+        The number of years each policy is covered.
+
+    n_months : int
+        The number of projection months.
+
+    time_step : str
+        The projection time step: "monthly" or "annual".
+
+    elapsed_months : int or array-like
+        The number of months each policy has been in force at the start of the projection (in-force model points).
+
+    Returns
+    -------
+    ndarray
+        The number of periods of each policy.
+    """
+
+    steps_per_year = eng.TIME_STEPS[time_step]
+    remaining_months = np.asarray(pol_year, dtype=np.int64).ravel() * 12 - np.asarray(
+        elapsed_months, dtype=np.int64
+    )
+
+    return np.clip(
+        remaining_months * steps_per_year // 12, 0, n_months * steps_per_year // 12
+    )
+
+
+def create_ragged_store(
+    store_dir, lengths, columns, n_months, dtype="float64", reuse=False
+):
+    """
+    Create an empty ragged store on disk for the per-policy results of a run.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory where the store will be created.
+
+    lengths : array-like
+        The number of periods of each policy (see get_policy_lengths).
+
+    columns : List
+        The column names held in the store.
+
+    n_months : int
+        The number of projection periods of the padded layout.
+
+    dtype : str
+        The NumPy data type of the stored values.
+
+    reuse : bool
+        Whether an existing store with the same layout is opened instead (e.g. to resume a checkpointed run, whose
+        completed batches are already written).
+
+    Returns
+    -------
+    dict
+        The store dictionary with keys "dir", "index", "offsets", "lengths" and "arrays" (a flat memory-mapped array
+        for each column).
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    index = {
+        "layout": RAGGED_LAYOUT,
+        "n_policies": int(lengths.size),
+        "n_months": int(n_months),
+        "n_rows": int(lengths.sum()),
+        "dtype": str(np.dtype(dtype)),
+        "columns": {col: f"{col}.npy" for col in columns},
+    }
+
+    if reuse and os.path.exists(os.path.join(store_dir, INDEX_FILE_NAME)):
+        store = open_ragged_store(store_dir, mode="r+")
+        if store["index"] == index and np.array_equal(store["lengths"], lengths):
+            return store
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    offsets = np.zeros(lengths.size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(store_dir, "lengths.npy"), lengths)
+    np.save(os.path.join(store_dir, "offsets.npy"), offsets)
+    arrays = {
+        col: np.lib.format.open_memmap(
+            os.path.join(store_dir, file_name),
+            mode="w+",
+            dtype=dtype,
+            shape=(index["n_rows"],),
+        )
+        for col, file_name in index["columns"].items()
+    }
+
+    with open(os.path.join(store_dir, INDEX_FILE_NAME), "w") as f:
+        json.dump(index, f, indent=4)
+
+    return {
+        "dir": store_dir,
+        "index": index,
+        "offsets": offsets,
+        "lengths": lengths,
+        "arrays": arrays,
+    }
+
+
+def open_ragged_store(store_dir, mode="r"):
+    """
+    Open an existing ragged store.
+
+    Parameters
+    ----------
+    store_dir : str
+        The directory of the store.
+
+    mode : str
+        The memory-map mode: "r" (read-only, default) or "r+" (read and write).
+
+    Returns
+    -------
+    dict
+        The store dictionary with keys "dir", "index", "offsets", "lengths" and "arrays".
+    """
+
+    with open(os.path.join(store_dir, INDEX_FILE_NAME), "r") as f:
+        index = json.load(f)
+
+    if index.get("layout") != RAGGED_LAYOUT:
+        raise ValueError(f"The store in {store_dir} is not a ragged store.")
+
+    arrays = {
+        col: np.load(os.path.join(store_dir, file_name), mmap_mode=mode)
+        for col, file_name in index["columns"].items()
+    }
+
+    return {
+        "dir": store_dir,
+        "index": index,
+        "offsets": np.load(os.path.join(store_dir, "offsets.npy")),
+        "lengths": np.load(os.path.join(store_dir, "lengths.npy")),
+        "arrays": arrays,
+    }
+
+
+def write_ragged_policies(store, result, first_policy):
+    """
+    Write the results of a contiguous range of policies into a ragged store.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary returned by create_ragged_store or open_ragged_store (mode "r+").
+
+    result : RaggedResult
+        The ragged result of the policies. It must hold the same number of periods per policy as the store.
+
+    first_policy : int
+        The index of the first policy of the result in the store.
+
+    Returns
+    -------
+    None
+    """
+
+    stop = first_policy + result.n_policies
+    if not np.array_equal(store["lengths"][first_policy:stop], result.lengths):
+        raise ValueError(
+            f"The policies {first_policy:,} to {stop - 1:,} do not have the number of periods of the store."
+        )
+
+    rows = slice(store["offsets"][first_policy], store["offsets"][stop])
+    for col, array in store["arrays"].items():
+        array[rows] = result[col]
+
+
+def get_policy_values(store, column, policies=slice(None), padded=False):
+    """
+    Get the values of a column for the selected policies of a ragged store.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary.
+
+    column : str
+        The column name (e.g. "Profit_IF").
+
+    policies : slice or int
+        The policies to select (a single policy or a contiguous range). All policies by default.
+
+    padded : bool
+        Whether the values are returned in the padded layout.
+
+    Returns
+    -------
+    ndarray
+        A zero-copy memory-mapped view of the periods of the policies held in the store (flat), or a zero-filled
+        (policies x months) array if padded is True ((months,) for a single policy).
+    """
+
+    if column not in store["arrays"]:
+        raise KeyError(f"Column '{column}' not found in the ragged store.")
+
+    if isinstance(policies, slice):
+        start, stop, step = policies.indices(store["index"]["n_policies"])
+        if step != 1:
+            raise ValueError(
+                "The policies of a ragged store must be a contiguous range."
+            )
+    else:
+        start, stop = policies, policies + 1
+
+    values = store["arrays"][column][store["offsets"][start] : store["offsets"][stop]]
+    if not padded:
+        return values
+
+    lengths = store["lengths"][start:stop]
+    padded_values = np.zeros(
+        (stop - start, store["index"]["n_months"]), dtype=values.dtype
+    )
+    padded_values[np.arange(padded_values.shape[1]) < lengths[:, np.newaxis]] = values
+
+    return padded_values if isinstance(policies, slice) else padded_values[0]
+
+
+def export_ragged_parquet(store, file_path, log_list, row_group_size=10000):
+    """
+    Export a ragged store to a Parquet file with one row per policy and one list column per stored column.
+
+    Parameters
+    ----------
+    store : dict
+        The store dictionary.
+
+    file_path : str
+        The path of the Parquet file.
+
+    log_list : list
+        The list that stores all log entries.
+
+    row_group_size : int
+        The number of policies per row group (each row group is read from the store and written on its own).
+
+    Returns
+    -------
+    list
+        The updated log list.
+
+    Notes
+    -----
+    The list columns are built from the flat values and the offsets of the store without copying them into per-policy
+    arrays. Parquet export requires the optional pyarrow package.
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "The Parquet export of the per-policy results requires the pyarrow package (pip install pyarrow)."
+        )
+
+    columns = list(store["arrays"])
+    value_type = pa.from_numpy_dtype(np.dtype(store["index"]["dtype"]))
+    schema = pa.schema(
+        [("Policy_ID", pa.int64())] + [(col, pa.list_(value_type)) for col in columns]
+    )
+    n_policies = store["index"]["n_policies"]
+
+    with pq.ParquetWriter(file_path, schema) as writer:
+        for start in range(0, n_policies, row_group_size):
+            stop = min(start + row_group_size, n_policies)
+            offsets = store["offsets"][start : stop + 1]
+            list_offsets = pa.array(offsets - offsets[0], type=pa.int32())
+            rows = slice(offsets[0], offsets[-1])
+            arrays = [pa.array(np.arange(start, stop, dtype=np.int64))] + [
+                pa.ListArray.from_arrays(
+                    list_offsets, pa.array(np.asarray(store["arrays"][col][rows]))
+                )
+                for col in columns
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    log_list = read.log_message(
+        f"Per-policy results of {n_policies:,} policies exported to Parquet: {file_path}",
+        log_list,
+    )
+
+    return log_list
@@ -0,0 +1,426 @@
+"""
+batch.py
+
+This module contains the headless batch runner of the pricing model, for nightly jobs processing many user input JSON
+files. The runs are executed in one Python process (or in a pool of worker processes with `--jobs`):
+- the modules are imported once,
+- the pricing model data (parameters and assumption tables) is read once per workbook and shared by all the runs whose
+  JSON points at the same "filePath" and named ranges (each worker process keeps its own cache),
+- each run writes its output files, run metrics and log as a `main.py` run would, but the JSON files are kept unless
+  `--delete-inputs` is given,
+- each run is checked against the reference model (equivalence gate, see `equivalence.py`) unless
+  `--no-equivalence-check` is given, with the tolerances of its user input ("equivalenceAtol", "equivalenceRtol").
+  Runs that the reference model cannot project (model point files, new business cohorts, dynamic lapse, annual time
+  step) are not checked, and a run failing the check has the status "equivalence_failed".
+
+The inputs can be given as directories (all the *.json files), glob patterns or manifest files (a .txt file with one
+JSON path per line, or a .json file with a list of paths; relative paths are relative to the manifest).
+
+A consolidated summary is written to the summary directory:
+- "batch_summary.json" : the status, error, equivalence check, wall time, CPU time, stage times and PV results of every
+                         run,
+- "batch_pv_results.csv" : the PV results of all the successful runs, with the input file of each line.
+
+Usage:
+
+    python batch.py nightly_inputs --jobs 4 --summary nightly_summary
+    python batch.py "inputs/*.json" manifest.txt
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import functools
+import glob
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import data_read as read
+import main as mn
+
+SUMMARY_FILE_NAME = "batch_summary.json"
+PV_SUMMARY_FILE_NAME = "batch_pv_results.csv"
+
+MANIFEST_EXTENSIONS = [".txt", ".lst"]
+
+# Pricing model data already read by this process, by workbook (see `data_read.get_pricing_model_key`)
+_workbook_cache = {}
+
+
+def collect_input_files(sources):
+    """
+    Get the list of user input JSON files from directories, glob patterns and manifest files.
+
+    Parameters
+    ----------
+    sources : List
+        The directories, glob patterns or manifest files.
+
+    Returns
+    -------
+    List
+        The absolute paths of the JSON files, in the order of the sources (sorted within a directory or pattern),
+        without duplicates.
+    """
+
+    json_paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            json_paths += sorted(glob.glob(os.path.join(source, "*.json")))
+        elif os.path.isfile(source):
+            json_paths += _read_manifest(source)
+        else:
+            matches = sorted(glob.glob(source))
+            if not matches:
+                raise FileNotFoundError(f"No input JSON file found for: {source}")
+            json_paths += matches
+
+    return list(dict.fromkeys(os.path.abspath(path) for path in json_paths))
+
+
+def _read_manifest(file_path):
+    """
+    Get the JSON files listed in a manifest file, or the file itself if it is a user input JSON file.
+    """
+
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+
+    if os.path.splitext(file_path)[1].lower() in MANIFEST_EXTENSIONS:
+        with open(file_path, "r") as f:
+            paths = [
+                line.strip()
+                for line in f
+                if line.strip() and not line.strip().startswith("#")
+            ]
+    else:
+        with open(file_path, "r") as f:
+            content = json.load(f)
+        if not isinstance(content, list):
+            return [file_path]
+        paths = content
+
+    return [os.path.join(base_dir, path) for path in paths]
+
+
+def run_input(
+    json_path,
+    delete_json=False,
+    verbose=False,
+    log_list=None,
+    progress_callback=None,
+    handle_signals=True,
+    equivalence_check=None,
+):
+    """
+    Run the pricing model for one user input JSON file, sharing the pricing model data of this process.
+
+    Parameters
+    ----------
+    json_path : str
+        The path to the user input JSON file.
+
+    delete_json : bool
+        Whether the JSON file is deleted after a successful run.
+
+    verbose : bool
+        Whether the run log is printed. By default only the batch progress is printed.
+
+    log_list : list
+        Optional list that stores the log entries of the run (e.g. a list streaming them to the job server, see
+        `worker.py`). By default a new list is used.
+
+    progress_callback : callable
+        Optional function receiving the progress events of a model point file run (see `progress.py`).
+
+    handle_signals : bool
+        Whether SIGINT and SIGTERM cancel a model point file run between batches (see `main.run`).
+
+    equivalence_check : bool
+        Whether the run is checked against the reference model (see `main.run`). By default the "equivalenceCheck"
+        setting of the user input.
+
+    Returns
+    -------
+    dict
+        The run summary with keys "input", "status" ("ok", "cancelled", "equivalence_failed" or "failed"), "error",
+        "equivalence" (summary of the equivalence check, None if not run), "workbook_cached", "wall_time_s",
+        "cpu_time_s", "stages" (wall time of each stage) and "pv_results" (DataFrame, None if the run failed).
+    """
+
+    if log_list is None:
+        log_list = []
+    summary = {
+        "input": json_path,
+        "status": "ok",
+        "error": None,
+        "equivalence": None,
+        "workbook_cached": False,
+        "wall_time_s": None,
+        "cpu_time_s": None,
+        "stages": {},
+        "pv_results": None,
+    }
+
+    output = (
+        contextlib.nullcontext()
+        if verbose
+        else contextlib.redirect_stdout(io.StringIO())
+    )
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with output:
+            pv_results, metrics, log_list = mn.run(
+                json_path,
+                log_list,
+                _workbook_cache,
+                delete_json,
+                progress_callback,
+                handle_signals=handle_signals,
+                equivalence_check=equivalence_check,
+            )
+        summary["pv_results"] = pv_results
+        summary["equivalence"] = metrics["equivalence"]
+        if metrics["cancelled"]:
+            summary["status"] = "cancelled"
+        elif (
+            metrics["equivalence"] is not None and not metrics["equivalence"]["passed"]
+        ):
+            equivalence = metrics["equivalence"]
+            summary["status"] = "equivalence_failed"
+            summary["error"] = (
+                f"Equivalence check failed: max abs diff = {equivalence['max_abs_diff']:.6g}, max rel diff = "
+                f"{equivalence['max_rel_diff']:.3g} (atol = {equivalence['atol']:g}, rtol = {equivalence['rtol']:g})"
+            )
+        summary["stages"] = {
+            stage["stage"]: stage["wall_time_s"] for stage in metrics["stages"]
+        }
+        summary["workbook_cached"] = "read_pricing_model_data" not in summary["stages"]
+    except (Exception, SystemExit) as error:
+        summary["status"] = "failed"
+        summary["error"] = (
+            f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        )
+        if log_list:
+            summary["error"] += f" (last log entry: {log_list[-1]})"
+    finally:
+        # A failed run does not reach write_run_metrics, which stops the memory tracing, nor the end of main.run, which
+        # stops the profiler (and puts back the profiled functions)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if "profiler" in sys.modules:
+            sys.modules["profiler"].stop_active_profiler()
+
+    summary["wall_time_s"] = time.perf_counter() - wall_start
+    summary["cpu_time_s"] = time.process_time() - cpu_start
+
+    return summary
+
+
+def run_batch(
+    json_paths,
+    log_list,
+    jobs=1,
+    delete_json=False,
+    verbose=False,
+    equivalence_check=True,
+):
+    """
+    Run the pricing model for a list of user input JSON files.
+
+    Parameters
+    ----------
+    json_paths : List
+        The paths to the user input JSON files.
+
+    log_list : list
+        The list that stores all log entries.
+
+    jobs : int
+        The number of worker processes. With 1 (default), the runs are executed one after the other in this process.
+
+    delete_json : bool
+        Whether the JSON files are deleted after a successful run.
+
+    verbose : bool
+        Whether the log of each run is printed.
+
+    equivalence_check : bool
+        Whether each run is checked against the reference model (see run_input). None = the "equivalenceCheck"
+        setting of each user input.
+
+    Returns
+    -------
+    List, list
+        The run summaries (see run_input), in the order of json_paths, and the updated log list.
+    """
+
+    n_runs = len(json_paths)
+    log_list = read.log_message(
+        f"Batch of {n_runs} runs started ({jobs} worker{'s' if jobs > 1 else ''}).",
+        log_list,
+    )
+
+    run = functools.partial(
+        run_input,
+        delete_json=delete_json,
+        verbose=verbose,
+        equivalence_check=equivalence_check,
+    )
+    if jobs > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        summaries = executor.map(run, json_paths)
+    else:
+        executor = contextlib.nullcontext()
+        summaries = (run(path) for path in json_paths)
+
+    runs = []
+    with executor:
+        for i, summary in enumerate(summaries, start=1):
+            runs.append(summary)
+            message = (
+                f"Run {i}/{n_runs} {summary['status']} in {summary['wall_time_s']:.4f} s"
+                f"{' (workbook shared)' if summary['workbook_cached'] else ''}: {summary['input']}"
+            )
+            if summary["error"]:
+                message += f". {summary['error']}"
+            log_list = read.log_message(message, log_list)
+
+    return runs, log_list
+
+
+def write_batch_summary(runs, summary_path, log_list):
+    """
+    Write the consolidated summary of a batch: "batch_summary.json" (status, timings and PV results of every run)
+    and "batch_pv_results.csv" (PV results of all the successful runs).
+
+    Parameters
+    ----------
+    runs : List
+        The run summaries from run_batch.
+
+    summary_path : str
+        The directory where the summary files are written.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    list
+        The updated log list.
+    """
+
+    import pandas as pd
+
+    if not os.path.exists(summary_path):
+        os.makedirs(summary_path)
+
+    n_failed = sum(run["status"] != "ok" for run in runs)
+    batch_summary = {
+        "run_timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "runs": len(runs),
+        "failed": n_failed,
+        "equivalence_failed": sum(
+            run["status"] == "equivalence_failed" for run in runs
+        ),
+        "total_run_time_s": sum(run["wall_time_s"] for run in runs),
+        "workbooks_read": sum(
+            not run["workbook_cached"] for run in runs if run["status"] != "failed"
+        ),
+        "run_summaries": [
+            {
+                **{key: value for key, value in run.items() if key != "pv_results"},
+                "pv_results": (
+                    run["pv_results"].to_dict("records")
+                    if run["pv_results"] is not None
+                    else None
+                ),
+            }
+            for run in runs
+        ],
+    }
+
+    summary_file = os.path.join(summary_path, SUMMARY_FILE_NAME)
+    with open(summary_file, "w") as f:
+        json.dump(batch_summary, f, indent=4)
+    log_list = read.log_message(
+        f"Batch summary file has been created successfully in: {summary_file}",
+        log_list,
+    )
+
+    pv_tables = [
+        run["pv_results"].assign(Input=os.path.basename(run["input"]))
+        for run in runs
+        if run["pv_results"] is not None
+    ]
+    if pv_tables:
+        pv_summary = pd.concat(pv_tables, ignore_index=True)
+        pv_summary.insert(0, "Input", pv_summary.pop("Input"))
+        pv_file = os.path.join(summary_path, PV_SUMMARY_FILE_NAME)
+        pv_summary.to_csv(pv_file, index=False)
+        log_list = read.log_message(
+            f"Batch PV results file has been created successfully in: {pv_file}",
+            log_list,
+        )
+
+    log_list = read.log_message(
+        f"Batch completed: {len(runs) - n_failed} runs succeeded, {n_failed} failed, "
+        f"{batch_summary['workbooks_read']} workbook reads.",
+        log_list,
+    )
+
+    return log_list
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the pricing model for many user input JSON files."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="directories, glob patterns or manifest files of user input JSON files",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--summary", default=".", help="directory of the batch summary files"
+    )
+    parser.add_argument(
+        "--delete-inputs",
+        action="store_true",
+        help="delete each JSON file after a successful run",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the log of each run"
+    )
+    parser.add_argument(
+        "--no-equivalence-check",
+        action="store_true",
+        help="do not check the runs against the reference model",
+    )
+    args = parser.parse_args(argv)
+
+    log_list = []
+    json_paths = collect_input_files(args.inputs)
+    runs, log_list = run_batch(
+        json_paths,
+        log_list,
+        jobs=max(1, args.jobs),
+        delete_json=args.delete_inputs,
+        verbose=args.verbose,
+        equivalence_check=not args.no_equivalence_check,
+    )
+    log_list = write_batch_summary(runs, args.summary, log_list)
+
+    return 1 if any(run["status"] != "ok" for run in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,368 @@
+"""
+bench_e2e.py
+
+This module contains the end-to-end benchmark of a `main.py` run, to measure the time spent outside the projection
+kernels (see `bench_kernels.py` for the kernels). Each run is executed in a fresh Python process and broken down into
+phases:
+- interpreter : start-up of an empty Python interpreter (`python -c pass`),
+- import      : import of the modules used by `main.py` (numpy, pandas, openpyxl and the model modules), with the
+                import time of each module in "import_<module>",
+- read_json   : `data_read.read_json_file`,
+- read_model  : `data_read.read_pricing_model_data` on `resources/pricing_model.xlsx`,
+- projection  : `engine.run_projection`,
+- to_frame    : preparation of the output table,
+- write_<fmt> : writing of the output table and PV results for each output format (xlsx, csv, pickle).
+
+The full `main.py` path is also timed as a subprocess for each output format.
+
+The warm import time is checked against an import-time budget (`--import-budget`, in seconds): the benchmark exits with
+a non-zero code if the budget is exceeded, so that a new top-level import of a heavy module is caught before release.
+
+Cold runs start without the compiled bytecode of the model modules (`__pycache__` is removed) and, where the OS allows
+it (`os.posix_fadvise`), with the workbook and model files dropped from the page cache. Warm runs follow immediately
+after, with the bytecode and files cached.
+
+Usage:
+
+    python bench_e2e.py --repeat 5 --output bench_e2e.json --import-budget 1.0
+"""
+
+import argparse
+import datetime
+import glob
+import importlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESOURCES_DIR = os.path.join(SCRIPTS_DIR, "..", "resources")
+DEFAULT_WORKBOOK = os.path.join(RESOURCES_DIR, "pricing_model.xlsx")
+DEFAULT_USER_INPUT = os.path.join(RESOURCES_DIR, "user_input_test copy.json")
+
+OUTPUT_FORMATS = ["xlsx", "csv", "pickle"]
+
+# Default budget of the warm import phase, in seconds
+DEFAULT_IMPORT_BUDGET = 1.0
+
+
+def make_user_input(workbook_path, output_dir, output_format):
+    """
+    Create the user input of a benchmark run from the sample user input.
+
+    Parameters
+    ----------
+    workbook_path : str
+        The file path to the pricing model workbook.
+
+    output_dir : str
+        The output directory of the run.
+
+    output_format : str
+        The output format ("xlsx", "csv" or "pickle").
+
+    Returns
+    -------
+    dict
+        The user input dictionary.
+    """
+
+    with open(DEFAULT_USER_INPUT, "r") as f:
+        user_input = json.load(f)
+
+    user_input.update(
+        filePath=workbook_path,
+        outputFilePath=output_dir,
+        outputFormat=output_format,
+        generateRunLog=False,
+        traceMemory=False,
+    )
+
+    return user_input
+
+
+def drop_file_cache(workbook_path):
+    """
+    Remove the compiled bytecode of the model modules and drop the workbook and model files from the OS page cache.
+
+    Parameters
+    ----------
+    workbook_path : str
+        The file path to the pricing model workbook.
+
+    Returns
+    -------
+    bool
+        True if the page cache could be dropped (Linux/Unix only), False if only the bytecode was removed.
+    """
+
+    shutil.rmtree(os.path.join(SCRIPTS_DIR, "__pycache__"), ignore_errors=True)
+
+    if not hasattr(os, "posix_fadvise"):
+        return False
+
+    for path in [workbook_path] + glob.glob(os.path.join(SCRIPTS_DIR, "*.py")):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    return True
+
+
+def run_phases(json_path, output_dir, formats):
+    """
+    Run the phases of `main.py` in the current process and time each of them (child process of the benchmark).
+
+    Parameters
+    ----------
+    json_path : str
+        The path to the user input JSON file.
+
+    output_dir : str
+        The output directory.
+
+    formats : List
+        The output formats to be written.
+
+    Returns
+    -------
+    dict
+        The wall time (in seconds) of each phase.
+    """
+
+    phases = {}
+
+    import contextlib
+    import io
+    from main import STARTUP_MODULES
+
+    # Same import order as main.py (after data_read and run_metrics, imported with main), so that the time of each
+    # module only includes its own dependencies
+    for name in STARTUP_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        phases[f"import_{name}"] = time.perf_counter() - start
+    phases["import"] = sum(phases.values())
+
+    import pandas as pd
+    import data_read as read
+    import engine as eng
+
+    log_list = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        user_input, log_list = read.read_json_file(json_path, log_list)
+        phases["read_json"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pricing_model_data, log_list = read.read_pricing_model_data(
+            user_input, log_list
+        )
+        phases["read_model"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result, pv_results, log_list = eng.run_projection(pricing_model_data, log_list)
+        phases["projection"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cf_proj_table = result.to_frame()
+    phases["to_frame"] = time.perf_counter() - start
+
+    for output_format in formats:
+        output_file = os.path.join(output_dir, f"bench_output.{output_format}")
+        start = time.perf_counter()
+        if output_format == "xlsx":
+            with pd.ExcelWriter(output_file) as writer:
+                cf_proj_table.to_excel(writer, sheet_name="Cashflow_Proj", index=False)
+                pv_results.to_excel(writer, sheet_name="PV_Results", index=False)
+        elif output_format == "csv":
+            cf_proj_table.to_csv(output_file, index=False)
+            pv_results.to_csv(
+                output_file.replace(".csv", "_pv_results.csv"), index=False
+            )
+        elif output_format == "pickle":
+            cf_proj_table.to_pickle(output_file.replace(".pickle", ".pkl"))
+            pv_results.to_pickle(output_file.replace(".pickle", "_pv_results.pkl"))
+        phases[f"write_{output_format}"] = time.perf_counter() - start
+
+    return phases
+
+
+def time_interpreter():
+    """
+    Time the start-up of an empty Python interpreter.
+    """
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+
+    return time.perf_counter() - start
+
+
+def time_phase_run(workbook_path, work_dir, formats):
+    """
+    Time the phases of a run in a fresh Python process.
+
+    Returns
+    -------
+    dict
+        The phase times, with the process wall time ("process") and the interpreter start-up ("interpreter").
+    """
+
+    json_path = os.path.join(work_dir, "bench_input.json")
+    with open(json_path, "w") as f:
+        json.dump(make_user_input(workbook_path, work_dir, formats[0]), f)
+
+    interpreter = time_interpreter()
+
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json_path, work_dir]
+        + formats,
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=SCRIPTS_DIR,
+    )
+    process = time.perf_counter() - start
+
+    phases = {"interpreter": interpreter}
+    phases.update(json.loads(completed.stdout.strip().splitlines()[-1]))
+    phases["process"] = process
+
+    return phases
+
+
+def time_main_run(workbook_path, work_dir, output_format):
+    """
+    Time a full `main.py` run (subprocess) for an output format.
+    """
+
+    # main.py joins the output path and file name with a backslash, so the output directory is kept inside the
+    # working directory on every OS
+    json_path = os.path.join(work_dir, f"bench_main_{output_format}.json")
+    with open(json_path, "w") as f:
+        json.dump(
+            make_user_input(
+                workbook_path, os.path.join(work_dir, "out"), output_format
+            ),
+            f,
+        )
+
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, "main.py"), json_path],
+        check=True,
+        capture_output=True,
+        cwd=work_dir,
+    )
+
+    return time.perf_counter() - start
+
+
+def summarise(runs):
+    """
+    Get the median time of each phase over a list of runs.
+    """
+
+    phases = list(dict.fromkeys(phase for run in runs for phase in run))
+
+    return {
+        phase: statistics.median(run[phase] for run in runs if phase in run)
+        for phase in phases
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="End-to-end start-up and I/O benchmark of main.py."
+    )
+    parser.add_argument("--workbook", default=DEFAULT_WORKBOOK)
+    parser.add_argument("--formats", nargs="+", default=OUTPUT_FORMATS)
+    parser.add_argument("--repeat", type=int, default=3, help="number of warm runs")
+    parser.add_argument("--output", default="bench_e2e.json")
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=DEFAULT_IMPORT_BUDGET,
+        help="maximum warm import time in seconds (0 = no check)",
+    )
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Child process: run the phases and print their times as JSON
+    if args.child:
+        json_path, output_dir, *formats = args.child
+        print(json.dumps(run_phases(json_path, output_dir, formats)))
+        return 0
+
+    workbook_path = os.path.abspath(args.workbook)
+    results = {
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workbook": os.path.basename(workbook_path),
+        "formats": args.formats,
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Cold run, then warm runs
+        results["page_cache_dropped"] = drop_file_cache(workbook_path)
+        cold = time_phase_run(workbook_path, work_dir, args.formats)
+        warm = [
+            time_phase_run(workbook_path, work_dir, args.formats)
+            for _ in range(args.repeat)
+        ]
+
+        # Full main.py path for each output format
+        main_runs = {}
+        for output_format in args.formats:
+            drop_file_cache(workbook_path)
+            main_cold = time_main_run(workbook_path, work_dir, output_format)
+            main_warm = [
+                time_main_run(workbook_path, work_dir, output_format)
+                for _ in range(args.repeat)
+            ]
+            main_runs[output_format] = {
+                "cold_s": main_cold,
+                "warm_median_s": statistics.median(main_warm),
+                "warm_s": main_warm,
+            }
+
+    results["phases"] = {"cold": cold, "warm_median": summarise(warm), "warm": warm}
+    results["main"] = main_runs
+    results["import_budget_s"] = args.import_budget
+
+    print(f"{'phase':<18}{'cold (s)':>12}{'warm (s)':>12}")
+    for phase, warm_time in results["phases"]["warm_median"].items():
+        print(f"{phase:<18}{cold[phase]:>12.4f}{warm_time:>12.4f}")
+    for output_format, times in main_runs.items():
+        print(
+            f"{'main ' + output_format:<18}{times['cold_s']:>12.4f}{times['warm_median_s']:>12.4f}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Benchmark results written to: {args.output}")
+
+    # Check the warm import time against the budget
+    import_time = results["phases"]["warm_median"]["import"]
+    if args.import_budget > 0 and import_time > args.import_budget:
+        print(
+            f"Import-time budget exceeded: {import_time:.4f} s > {args.import_budget:.4f} s."
+        )
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
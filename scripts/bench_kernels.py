@@ -0,0 +1,525 @@
+"""
+bench_kernels.py
+
+This module contains the scaling benchmark of the projection kernels. Each stage of the vectorized engine (`engine.py`) is
+timed separately:
+- lookups           : generate_reference_columns, generate_rfr_columns, generate_mortality_rate_columns and
+                      generate_lapse_rate_columns (table lookups by age and policy year), plus the discount factors,
+- policy count      : generate_policy_count_columns,
+- unit fund         : generate_unit_fund_columns,
+- risk fund         : generate_risk_fund_columns,
+- SHF               : generate_shf_columns,
+- in-force          : generate_inforce_columns,
+- PV                : generate_pv_table.
+
+These are the same calculations as the loop-based functions of `projection.py`, run for a batch of model points. The
+benchmark grows the number of model points, the projection horizon and the number of economic scenarios, and records the
+wall time, CPU time, throughput (rows and policies per second) and peak memory of each stage.
+
+The model points are synthetic: ages, policy terms, genders, sums assured and contributions are drawn (with a fixed seed)
+around the model point of `resources/pricing_model.xlsx`, within the range of its mortality table. The scenarios are
+parallel shifts of the risk-free rate table of the workbook.
+
+Usage:
+
+    python bench_kernels.py --policies 1 100 10000 --months 1200 --scenarios 1 --output bench_results.json
+    python bench_kernels.py --output bench_new.json --baseline bench_results.json --tolerance 0.2
+
+With --baseline, every stage slower than the baseline by more than the tolerance is reported as a regression and the
+exit code is 1. Cases whose projection result would not fit in --max-memory-gb are skipped.
+
+Each case is also checked against the loop-based reference model of `projection.py` (see `equivalence.py`) on a few of
+its model points, with --atol / --rtol (defaults by precision mode). A failed check also gives exit code 1. Use
+--no-check to skip it.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import numpy as np
+import data_read as read
+import engine as eng
+import equivalence as eq
+import run_metrics as rm
+
+RESOURCES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "resources"
+)
+DEFAULT_WORKBOOK = os.path.join(RESOURCES_DIR, "pricing_model.xlsx")
+DEFAULT_USER_INPUT = os.path.join(RESOURCES_DIR, "user_input_test copy.json")
+
+# Stages shorter than this (in seconds) are too noisy to be flagged as regressions
+MIN_COMPARED_TIME = 0.001
+
+
+def load_pricing_model(workbook_path=DEFAULT_WORKBOOK):
+    """
+    Read the pricing model data (parameters and tables) of a workbook, using the names of the sample user input.
+
+    Parameters
+    ----------
+    workbook_path : str
+        The file path to the pricing model workbook.
+
+    Returns
+    -------
+    dict
+        The pricing model data dictionary (see `data_read.read_pricing_model_data`).
+    """
+
+    with open(DEFAULT_USER_INPUT, "r") as f:
+        user_input = json.load(f)
+    user_input["filePath"] = workbook_path
+
+    # the run log of the workbook read is not needed here
+    with contextlib.redirect_stdout(io.StringIO()):
+        pricing_model_data, _ = read.read_pricing_model_data(user_input, [])
+
+    return pricing_model_data
+
+
+def generate_model_points(pricing_model_data, n_policies, seed=0):
+    """
+    Generate synthetic model points around the model point of the pricing model.
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        The pricing model data dictionary.
+
+    n_policies : int
+        The number of model points.
+
+    seed : int
+        The random seed.
+
+    Returns
+    -------
+    dict
+        The model points, with one array per key of `engine.MODEL_POINT_KEYS`.
+
+    Notes
+    -----
+    The first model point is the model point of the workbook. Entry ages and policy terms are drawn so that the policy
+    expires within the mortality table; sums assured and contributions are scaled from the workbook model point.
+    """
+
+    rng = np.random.default_rng(seed)
+    max_age = int(pricing_model_data["Table_Mortality"]["Age"].max())
+    max_term = int(pricing_model_data["Pol_Year"])
+
+    age = rng.integers(18, 61, n_policies)
+    pol_year = rng.integers(5, np.minimum(max_term, max_age - age) + 1)
+    gender = rng.choice(np.array(["Male", "Female"]), n_policies)
+    scale = rng.lognormal(0.0, 0.5, n_policies)
+    sum_assured = np.round(pricing_model_data["SumAssured"] * scale, 0)
+    contribution = np.round(
+        pricing_model_data["Contribution_perYear"]
+        * scale
+        * rng.uniform(0.8, 1.2, n_policies),
+        2,
+    )
+
+    model_points = {
+        "Age": age,
+        "Gender": gender,
+        "Pol_Year": pol_year,
+        "SumAssured": sum_assured,
+        "Contribution_perYear": contribution,
+    }
+    for key in eng.MODEL_POINT_KEYS:
+        model_points[key][0] = pricing_model_data[key]
+
+    return model_points
+
+
+def generate_scenarios(pricing_model_data, n_scenarios, seed=0, shift_sd=0.005):
+    """
+    Generate risk-free rate scenarios as parallel shifts of the workbook risk-free rate table.
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        The pricing model data dictionary.
+
+    n_scenarios : int
+        The number of scenarios. Scenario 0 is the workbook table.
+
+    seed : int
+        The random seed.
+
+    shift_sd : float
+        The standard deviation of the parallel shift.
+
+    Returns
+    -------
+    List
+        One risk-free rate table (DataFrame) per scenario.
+    """
+
+    rng = np.random.default_rng(seed)
+    rfr_table = pricing_model_data["Table_RiskFreeRate"]
+    shifts = np.concatenate([[0.0], rng.normal(0.0, shift_sd, n_scenarios - 1)])
+
+    scenarios = []
+    for shift in shifts:
+        scenario_table = rfr_table.copy()
+        scenario_table["rfr p.a."] = np.maximum(
+            scenario_table["rfr p.a."] + shift, -0.01
+        )
+        scenarios.append(scenario_table)
+
+    return scenarios
+
+
+def estimate_result_gb(n_policies, n_months, precision="double"):
+    """
+    Estimate the memory (in GB) of the projection result of a case.
+    """
+
+    itemsize = np.dtype(eng.PRECISION_DTYPES[precision]).itemsize
+
+    return n_policies * n_months * len(eng.PROJECTION_COLUMNS) * itemsize / 1024**3
+
+
+def run_case(
+    pricing_model_data,
+    n_policies,
+    n_months,
+    n_scenarios,
+    precision="double",
+    repeat=3,
+    trace_memory=True,
+    seed=0,
+    check=True,
+    atol=None,
+    rtol=None,
+):
+    """
+    Benchmark the projection stages for one case (number of model points, horizon and number of scenarios).
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        The pricing model data dictionary.
+
+    n_policies : int
+        The number of model points.
+
+    n_months : int
+        The projection horizon in months.
+
+    n_scenarios : int
+        The number of risk-free rate scenarios (each scenario is a full projection of the model points).
+
+    precision : str
+        The precision mode of the engine.
+
+    repeat : int
+        The number of timed runs. The fastest run of each stage is kept.
+
+    trace_memory : bool
+        Whether an additional run is traced with tracemalloc to record the peak memory of each stage.
+
+    seed : int
+        The random seed of the model points and scenarios.
+
+    check : bool
+        Whether the case is checked against the reference model (first scenario, a few model points).
+
+    atol : float
+        The absolute tolerance of the check (default by precision mode).
+
+    rtol : float
+        The relative tolerance of the check (default by precision mode).
+
+    Returns
+    -------
+    dict
+        The case results, with the per-stage metrics summed over the scenarios.
+    """
+
+    model_points = generate_model_points(pricing_model_data, n_policies, seed)
+    scenarios = generate_scenarios(pricing_model_data, n_scenarios, seed)
+
+    def run_scenarios(trace):
+        metrics = rm.start_run_metrics(trace_memory=trace)
+        for rfr_table in scenarios:
+            scenario_data = dict(pricing_model_data, Table_RiskFreeRate=rfr_table)
+            with contextlib.redirect_stdout(io.StringIO()):
+                eng.run_projection(
+                    scenario_data,
+                    [],
+                    model_points,
+                    n_months,
+                    precision=precision,
+                    columns=[],
+                    metrics=metrics,
+                )
+        if trace:
+            import tracemalloc
+
+            tracemalloc.stop()
+
+        stages = {}
+        for stage in metrics["stages"]:
+            total = stages.setdefault(
+                stage["stage"],
+                {"wall_time_s": 0.0, "cpu_time_s": 0.0, "peak_memory_mb": 0.0},
+            )
+            total["wall_time_s"] += stage["wall_time_s"]
+            total["cpu_time_s"] += stage["cpu_time_s"]
+            if trace:
+                total["peak_memory_mb"] = max(
+                    total["peak_memory_mb"], stage["stage_peak_memory_mb"]
+                )
+
+        return stages
+
+    stages = None
+    for _ in range(repeat):
+        run_stages = run_scenarios(False)
+        if stages is None:
+            stages = run_stages
+            continue
+        for stage, values in run_stages.items():
+            if values["wall_time_s"] < stages[stage]["wall_time_s"]:
+                stages[stage].update(
+                    wall_time_s=values["wall_time_s"], cpu_time_s=values["cpu_time_s"]
+                )
+
+    if trace_memory:
+        for stage, values in run_scenarios(True).items():
+            stages[stage]["peak_memory_mb"] = values["peak_memory_mb"]
+    else:
+        for values in stages.values():
+            values["peak_memory_mb"] = None
+
+    n_rows = n_policies * n_months * n_scenarios
+    for values in stages.values():
+        wall_time = values["wall_time_s"]
+        values["rows_per_second"] = n_rows / wall_time if wall_time > 0 else None
+        values["policies_per_second"] = (
+            n_policies * n_scenarios / wall_time if wall_time > 0 else None
+        )
+
+    total_time = sum(values["wall_time_s"] for values in stages.values())
+
+    equivalence = None
+    if check:
+        with contextlib.redirect_stdout(io.StringIO()):
+            report, _ = eq.check_equivalence(
+                dict(pricing_model_data, Table_RiskFreeRate=scenarios[0]),
+                [],
+                model_points=model_points,
+                n_months=n_months,
+                precision=precision,
+                atol=atol,
+                rtol=rtol,
+            )
+        equivalence = {
+            key: report[key]
+            for key in [
+                "passed",
+                "atol",
+                "rtol",
+                "policies_checked",
+                "max_abs_diff",
+                "max_rel_diff",
+            ]
+        }
+
+    return {
+        "case": case_name(n_policies, n_months, n_scenarios, precision),
+        "n_policies": n_policies,
+        "n_months": n_months,
+        "n_scenarios": n_scenarios,
+        "precision": precision,
+        "total_wall_time_s": total_time,
+        "rows_per_second": n_rows / total_time if total_time > 0 else None,
+        "stages": stages,
+        "equivalence": equivalence,
+    }
+
+
+def case_name(n_policies, n_months, n_scenarios, precision):
+    """
+    Get the key of a benchmark case, used to match cases against the baseline.
+    """
+
+    return f"policies={n_policies},months={n_months},scenarios={n_scenarios},precision={precision}"
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results against a baseline and list the regressions.
+
+    Parameters
+    ----------
+    results : dict
+        The benchmark results.
+
+    baseline : dict
+        The baseline benchmark results (same layout).
+
+    tolerance : float
+        The relative slowdown allowed before a stage is flagged (0.2 = 20% slower).
+
+    Returns
+    -------
+    List
+        One dictionary per compared stage with keys "case", "stage", "baseline_s", "current_s", "ratio" and
+        "regression".
+    """
+
+    baseline_cases = {case["case"]: case for case in baseline["cases"]}
+    comparison = []
+
+    for case in results["cases"]:
+        base_case = baseline_cases.get(case["case"])
+        if base_case is None:
+            continue
+        for stage, values in case["stages"].items():
+            if stage not in base_case["stages"]:
+                continue
+            base_time = base_case["stages"][stage]["wall_time_s"]
+            current_time = values["wall_time_s"]
+            ratio = current_time / base_time if base_time > 0 else None
+            comparison.append(
+                {
+                    "case": case["case"],
+                    "stage": stage,
+                    "baseline_s": base_time,
+                    "current_s": current_time,
+                    "ratio": ratio,
+                    "regression": bool(
+                        ratio is not None
+                        and base_time >= MIN_COMPARED_TIME
+                        and ratio > 1 + tolerance
+                    ),
+                }
+            )
+
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Scaling benchmark of the projection kernels."
+    )
+    parser.add_argument(
+        "--workbook", default=DEFAULT_WORKBOOK, help="pricing model workbook"
+    )
+    parser.add_argument(
+        "--policies", type=int, nargs="+", default=[1, 10, 100, 1000, 10000]
+    )
+    parser.add_argument("--months", type=int, nargs="+", default=[1200])
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--precision", nargs="+", default=["double"], choices=list(eng.PRECISION_DTYPES)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the tracemalloc run"
+    )
+    parser.add_argument("--max-memory-gb", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--no-check", action="store_true", help="skip the reference model check"
+    )
+    parser.add_argument("--atol", type=float, help="absolute tolerance of the check")
+    parser.add_argument("--rtol", type=float, help="relative tolerance of the check")
+    args = parser.parse_args(argv)
+
+    pricing_model_data = load_pricing_model(args.workbook)
+
+    results = {
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "workbook": os.path.basename(args.workbook),
+        "cases": [],
+        "skipped": [],
+    }
+
+    for precision in args.precision:
+        for n_months in args.months:
+            for n_scenarios in args.scenarios:
+                for n_policies in args.policies:
+                    name = case_name(n_policies, n_months, n_scenarios, precision)
+                    if (
+                        estimate_result_gb(n_policies, n_months, precision)
+                        > args.max_memory_gb
+                    ):
+                        print(f"{name}: skipped (result above {args.max_memory_gb} GB)")
+                        results["skipped"].append(name)
+                        continue
+                    case = run_case(
+                        pricing_model_data,
+                        n_policies,
+                        n_months,
+                        n_scenarios,
+                        precision,
+                        args.repeat,
+                        not args.no_memory,
+                        args.seed,
+                        not args.no_check,
+                        args.atol,
+                        args.rtol,
+                    )
+                    results["cases"].append(case)
+                    message = (
+                        f"{name}: {case['total_wall_time_s']:.4f} s, "
+                        f"{case['rows_per_second']:,.0f} rows/s"
+                    )
+                    if case["equivalence"] is not None:
+                        message += (
+                            ", equivalence "
+                            f"{'passed' if case['equivalence']['passed'] else 'FAILED'} "
+                            f"(max abs diff {case['equivalence']['max_abs_diff']:.3g})"
+                        )
+                    print(message)
+
+    exit_code = 0
+    if any(
+        case["equivalence"] is not None and not case["equivalence"]["passed"]
+        for case in results["cases"]
+    ):
+        exit_code = 1
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        comparison = compare_results(results, baseline, args.tolerance)
+        results["comparison"] = {
+            "baseline": args.baseline,
+            "tolerance": args.tolerance,
+            "stages": comparison,
+        }
+        regressions = [row for row in comparison if row["regression"]]
+        for row in regressions:
+            print(
+                f"REGRESSION {row['case']} {row['stage']}: "
+                f"{row['baseline_s']:.4f} s -> {row['current_s']:.4f} s (x{row['ratio']:.2f})"
+            )
+        print(f"{len(comparison)} stage(s) compared, {len(regressions)} regression(s).")
+        if regressions:
+            exit_code = 1
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Benchmark results written to: {args.output}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,11 @@ a = Analysis(
         ('data_read.py', '.'),  
         ('projection.py', '.'),
     ],
-    hiddenimports=[],
+    hiddenimports=['cProfile', 'pstats', 'projection'],  # profiler hooks (profiler.py)
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'matplotlib', 'IPython', 'scipy', 'pytest'],  # not used, keeps the bundle (and start-up) small
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,291 @@
+"""
+checkpoint.py
+
+This module contains the checkpoints of model point file runs ("checkpointDir" in the user input), so that a run that
+dies or is cancelled part way can be restarted without projecting the completed batches again.
+
+Each completed model point batch is written to the checkpoint directory of the run, with:
+- the partial aggregates of the batch (policy counts and inforce cashflows summed over the policies of the batch, as
+  the nodes of the reduction tree of the batch, see `reduction.py`),
+- the PV results of the policies of the batch,
+- the profit metrics of the policies of the batch (when requested, see `engine.generate_profit_table`).
+
+The manifest ("manifest.json") lists the completed batches and is only updated once the batch file has been written,
+so that an interrupted write is never read back. The checkpoint directory of a run is named after the input hash: the
+user input settings that change the results and the content of the workbook and model point files. A restarted run
+with the same input hash skips the completed batches. The batch aggregates are merged in batch order whether they are
+projected or read back, so the final aggregates are bit-identical to an uninterrupted run.
+
+The checkpoint is removed once the output has been written, unless "keepCheckpoint" is set.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import data_read as read
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+# Version of the batch files (checkpoints written with another version are not read back)
+CHECKPOINT_VERSION = 3
+
+# User input keys that do not change the projection results (not included in the input hash)
+NON_RESULT_KEYS = [
+    "outputFilePath",
+    "outputFileName",
+    "outputFormat",
+    "outputGranularity",
+    "generateRunLog",
+    "traceMemory",
+    "profile",
+    "profileStages",
+    "profileFunctions",
+    "resultsDbPath",
+    "arrayStorePath",
+    "progressInterval",
+    "cancelFile",
+    "checkpointDir",
+    "keepCheckpoint",
+]
+
+
+def _update_file_digest(digest, file_path, block_size=1024**2):
+    """
+    Add the content of a file to a hash.
+    """
+
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+
+def compute_input_hash(user_input):
+    """
+    Get the input hash of a run: the user input settings that change the results and the content of the workbook and
+    model point files.
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    Returns
+    -------
+    str
+        The SHA-256 hash (hexadecimal).
+    """
+
+    settings = {
+        key: value for key, value in user_input.items() if key not in NON_RESULT_KEYS
+    }
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    for key in ["filePath", "modelPointFile"]:
+        if user_input.get(key, ""):
+            _update_file_digest(digest, user_input[key])
+
+    return digest.hexdigest()
+
+
+class RunCheckpoint:
+    """
+    Checkpoint of a model point file run: completed batches and their partial aggregates and PV results.
+
+    Parameters
+    ----------
+    checkpoint_dir : str
+        The checkpoint directory. The checkpoint of the run is written in a sub-directory named after the input hash.
+
+    input_hash : str
+        The input hash of the run (see compute_input_hash).
+
+    n_batches : int
+        The number of model point batches of the run.
+    """
+
+    def __init__(self, checkpoint_dir, input_hash, n_batches):
+        self.input_hash = input_hash
+        self.n_batches = n_batches
+        self.path = os.path.join(checkpoint_dir, input_hash)
+        self.manifest_file = os.path.join(self.path, MANIFEST_FILE_NAME)
+        self.completed = set()
+
+    def open(self, log_list):
+        """
+        Read the manifest of an earlier run with the same input hash, or start a new checkpoint.
+
+        Parameters
+        ----------
+        log_list : list
+            The list that stores all log entries.
+
+        Returns
+        -------
+        list
+            The updated log list.
+        """
+
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, "r") as f:
+                manifest = json.load(f)
+            if (
+                manifest["input_hash"] == self.input_hash
+                and manifest["n_batches"] == self.n_batches
+                and manifest.get("version") == CHECKPOINT_VERSION
+            ):
+                self.completed = {
+                    batch
+                    for batch in manifest["completed_batches"]
+                    if os.path.exists(self._batch_file(batch))
+                }
+
+        if self.completed:
+            log_list = read.log_message(
+                f"Resuming from checkpoint {self.path}: {len(self.completed)}/{self.n_batches} batches already "
+                f"completed.",
+                log_list,
+            )
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_manifest()
+            log_list = read.log_message(
+                f"Checkpoint of the run created in: {self.path}", log_list
+            )
+
+        return log_list
+
+    def _batch_file(self, batch):
+        return os.path.join(self.path, f"batch_{batch:06d}.pkl")
+
+    def _write_manifest(self):
+        manifest = {
+            "version": CHECKPOINT_VERSION,
+            "input_hash": self.input_hash,
+            "n_batches": self.n_batches,
+            "completed_batches": sorted(self.completed),
+            "updated": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_file, self.manifest_file)
+
+    def load(self, batch):
+        """
+        Get a completed batch.
+
+        Parameters
+        ----------
+        batch : int
+            The batch number (1-based).
+
+        Returns
+        -------
+        tuple or None
+            The partial aggregates (reduction tree nodes), the PV results and the profit metrics (or None) of the batch,
+            or None if the batch has not been completed.
+        """
+
+        if batch not in self.completed:
+            return None
+
+        with open(self._batch_file(batch), "rb") as f:
+            batch_data = pickle.load(f)
+
+        return (
+            batch_data["aggregates"],
+            batch_data["pv_results"],
+            batch_data["profit_results"],
+        )
+
+    def save(self, batch, aggregates, pv_results, profit_results=None):
+        """
+        Write a completed batch, then add it to the manifest.
+
+        Parameters
+        ----------
+        batch : int
+            The batch number (1-based).
+
+        aggregates : List
+            The partial aggregates of the batch (reduction tree nodes, see `reduction.BlockReduction`).
+
+        pv_results : DataFrame
+            The PV results of the policies of the batch.
+
+        profit_results : DataFrame
+            Optional profit metrics of the policies of the batch.
+        """
+
+        batch_file = self._batch_file(batch)
+        temp_file = batch_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump(
+                {
+                    "aggregates": aggregates,
+                    "pv_results": pv_results,
+                    "profit_results": profit_results,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temp_file, batch_file)
+
+        self.completed.add(batch)
+        self._write_manifest()
+
+    def remove(self, log_list):
+        """
+        Remove the checkpoint of the run (once the output has been written).
+
+        Parameters
+        ----------
+        log_list : list
+            The list that stores all log entries.
+
+        Returns
+        -------
+        list
+            The updated log list.
+        """
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        log_list = read.log_message(f"Checkpoint removed: {self.path}", log_list)
+
+        return log_list
+
+
+def open_checkpoint(checkpoint_dir, user_input, n_batches, log_list):
+    """
+    Open the checkpoint of a model point file run.
+
+    Parameters
+    ----------
+    checkpoint_dir : str
+        The checkpoint directory.
+
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    n_batches : int
+        The number of model point batches of the run.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    RunCheckpoint, list
+        The checkpoint of the run and the updated log list.
+    """
+
+    checkpoint = RunCheckpoint(
+        checkpoint_dir, compute_input_hash(user_input), n_batches
+    )
+    log_list = checkpoint.open(log_list)
+
+    return checkpoint, log_list
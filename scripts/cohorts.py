@@ -0,0 +1,208 @@
+"""
+cohorts.py
+
+This module contains the new business cohort projection for business planning: the cashflows of the policies sold every
+month of the plan ("salesVolumeFile" of the user input), by calendar month.
+
+Every cohort of a product cell has the same cashflows per policy sold, only shifted by its month of sale. So each
+product cell (model point) is projected once, for one policy sold, and the calendar month cashflows are the convolution
+of its inforce cashflows with its monthly sales volumes:
+
+    Calendar Cashflow (month t) = Sum over cells and months of sale s of Sales (s) * Cashflow per Policy Sold (t - s + 1)
+
+The convolution is computed directly for short vectors, and with real FFTs (NumPy) for long horizons, where it is
+O(n log n) instead of O(n^2). Policy counts and inforce cashflows are additive, so they are all convolved; the PV results
+are the present values of the calendar cashflows at the start of the plan, discounted with the risk-free rates by year
+of the plan.
+"""
+
+import numpy as np
+import data_read as read
+import engine as eng
+
+CONVOLUTION_METHODS = ["auto", "direct", "fft"]
+
+# The "auto" method uses the FFT when both the sales vector and the cashflow profile are longer than this
+FFT_MIN_LENGTH = 64
+
+
+def convolve_sales(profiles, sales, n_periods, method="auto"):
+    """
+    Combine the cashflow profiles per policy sold with the sales volumes of each product cell.
+
+    Parameters
+    ----------
+    profiles : ndarray
+        The (cells x columns x months) cashflows of one policy sold, from its month of sale.
+
+    sales : ndarray
+        The (cells x months) number of policies sold each month.
+
+    n_periods : int
+        The number of calendar months returned (the months after them are dropped).
+
+    method : str
+        The convolution method: "auto" (default), "direct" or "fft".
+
+    Returns
+    -------
+    ndarray, int
+        The (columns x n_periods) float64 calendar month cashflows summed over the cells, and the number of calendar
+        months with cashflows (which can be above n_periods).
+
+    Notes
+    -----
+    The FFT is exact up to the floating-point rounding of the transforms (relative to the largest cashflow), and the
+    months after the last possible cashflow are set to zero.
+    """
+
+    if method not in CONVOLUTION_METHODS:
+        raise ValueError(
+            f"Unsupported convolution method: {method}. Use one of {CONVOLUTION_METHODS}."
+        )
+
+    n_cells, n_columns, n_profile = profiles.shape
+    n_full = n_profile + sales.shape[1] - 1
+    if method == "auto":
+        method = "fft" if min(n_profile, sales.shape[1]) > FFT_MIN_LENGTH else "direct"
+
+    # last calendar month (excluded) with cashflows: last sale of a cell plus the length of its profile
+    sold = sales > 0
+    last_sale = np.where(
+        sold.any(axis=1), sales.shape[1] - np.argmax(sold[:, ::-1], axis=1), 0
+    )
+    profile_held = np.any(profiles != 0, axis=1)
+    profile_length = np.where(
+        profile_held.any(axis=1),
+        n_profile - np.argmax(profile_held[:, ::-1], axis=1),
+        0,
+    )
+    n_support = int(np.max(np.where(last_sale > 0, last_sale + profile_length - 1, 0)))
+
+    calendar = np.zeros((n_columns, n_periods))
+    n_kept = min(n_support, n_periods)
+    if method == "direct":
+        for cell in range(n_cells):
+            for k in range(n_columns):
+                calendar[k, :n_kept] += np.convolve(profiles[cell, k], sales[cell])[
+                    :n_kept
+                ]
+    else:
+        # one transform of the sales per cell, then one product summed over the cells per column
+        n_fft = 1 << (n_full - 1).bit_length()
+        sales_spectrum = np.fft.rfft(sales, n_fft)
+        for k in range(n_columns):
+            spectrum = np.einsum(
+                "cf,cf->f", np.fft.rfft(profiles[:, k], n_fft), sales_spectrum
+            )
+            calendar[k, :n_kept] = np.fft.irfft(spectrum, n_fft)[:n_kept]
+
+    return calendar, n_support
+
+
+def run_cohort_projection(
+    pricing_model_data,
+    log_list,
+    model_points,
+    sales,
+    n_months=1200,
+    precision="double",
+    columns=None,
+    dynamic_lapse=None,
+    method="auto",
+    profit_metrics=False,
+):
+    """
+    Project the new business cohorts of a sales plan by calendar month.
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        A dictionary containing the data extracted from the pricing model (parameters and assumption tables).
+
+    log_list : list
+        The list that stores all log entries.
+
+    model_points : dict
+        Dictionary of per-policy arrays (see `engine.run_projection`), one model point per product cell.
+
+    sales : ndarray
+        The (cells x months) number of policies sold each month of the plan (see `data_read.read_sales_volumes`).
+
+    n_months : int
+        The number of calendar months of the output (from the start of the plan).
+
+    precision : str
+        The precision mode of the projection of the cells: "double" (default) or "single". The convolution is
+        computed in float64.
+
+    columns : List
+        Optional list of the columns required in the output (see `engine.get_aggregate_columns`).
+
+    dynamic_lapse : dict
+        Optional dynamic lapse settings (see `engine.run_projection`).
+
+    method : str
+        The convolution method: "auto" (default), "direct" or "fft" (see convolve_sales).
+
+    profit_metrics : bool
+        Whether the profit metrics of the plan are calculated (see `engine.generate_profit_table`).
+
+    Returns
+    -------
+    ProjectionResult, DataFrame, DataFrame, list
+        The calendar month projection (policy counts and inforce cashflows summed over the cohorts), the PV results of
+        the plan, the profit metrics of the plan (None if profit_metrics is False) and the updated log list.
+    """
+
+    if any(key in model_points for key in read.INFORCE_MODEL_POINT_COLUMNS):
+        raise ValueError(
+            "The product cells of a new business cohort run cannot have in-force columns "
+            f"({read.INFORCE_MODEL_POINT_COLUMNS})."
+        )
+
+    # Cashflows of one policy sold in each cell (all the aggregate columns, as they are all needed for the PVs)
+    all_columns = eng.get_aggregate_columns()
+    profile, _, log_list = eng.run_projection(
+        pricing_model_data,
+        log_list,
+        model_points,
+        n_months,
+        precision,
+        columns=all_columns,
+        dynamic_lapse=dynamic_lapse,
+        horizon=int(np.max(model_points["Pol_Year"])) * 12,
+    )
+    profiles = np.stack([profile[col] for col in all_columns[1:]], axis=1)
+    calendar_values, n_support = convolve_sales(profiles, sales, n_months, method)
+    if n_support > n_months:
+        log_list = read.log_message(
+            f"WARNING! The cohorts have cashflows up to calendar month {n_support:,}: the cashflows after month "
+            f"{n_months:,} are not in the output.",
+            log_list,
+        )
+
+    # Calendar months from the start of the plan, with the risk-free rates and discount factors by year of the plan
+    calendar = eng.create_projection_result(1, n_months, columns=all_columns)
+    eng.generate_reference_columns(calendar, 0, n_months // 12)
+    eng.generate_rfr_columns(calendar, pricing_model_data["Table_RiskFreeRate"])
+    eng.generate_discount_factor_columns(calendar)
+    for k, col in enumerate(all_columns[1:]):
+        calendar[col] = calendar_values[k]
+    pv_results = eng.generate_pv_table(calendar)
+    profit_results = (
+        eng.generate_profit_table(calendar, pv_results) if profit_metrics else None
+    )
+
+    agg_columns = eng.get_aggregate_columns(columns)
+    aggregate = eng.create_aggregate_result(agg_columns, n_months)
+    for col in agg_columns[1:]:
+        aggregate[col] = calendar[col]
+
+    log_list = read.log_message(
+        f"New business cohorts of {sales.shape[1]:,} months of sales projected by convolution of {sales.shape[0]:,} "
+        f"product cells ({sales.sum():,.0f} policies sold).",
+        log_list,
+    )
+
+    return aggregate, pv_results, profit_results, log_list
@@ -7,15 +7,47 @@ tables into pandas DataFrames.
 
 This module supports the main calculations and projections performed in the `projection.py` module, providing the 
 necessary data inputs for further processing.
+
+pandas and openpyxl are only imported by the functions reading the Excel workbook, so that logging and reading the JSON
+input do not wait for them.
 """
 
-import pandas as pd
-from openpyxl import load_workbook
 import json
 import sys
 import os
 import datetime
 
+# User input keys holding the named ranges read from the pricing model workbook
+PRICING_MODEL_NAMED_RANGES = [
+    "age",
+    "gender",
+    "polYear",
+    "sumAssured",
+    "contributionPerYear",
+    "surplusShareToShf",
+    "surplusShareToParticipant",
+    "tabWakalahFee",
+    "wakalahFmc",
+    "coiLoading",
+    "expensePerContributionPerYear",
+    "expensePerFundPerYear",
+    "tabMortalityRates",
+    "tabLapseRate",
+    "tabRiskFreeRates",
+]
+
+# Columns of a model point file (same keys as the model point of the pricing model data, see engine.MODEL_POINT_KEYS)
+MODEL_POINT_COLUMNS = [
+    "Age",
+    "Gender",
+    "Pol_Year",
+    "SumAssured",
+    "Contribution_perYear",
+]
+
+# Optional columns of an in-force model point file: months elapsed since issue and unit fund value at the valuation date
+INFORCE_MODEL_POINT_COLUMNS = ["Elapsed_Months", "Unit_Fund_Value"]
+
 
 def log_message(message, log_list):
     """
@@ -158,6 +190,8 @@ def extract_table_from_reference(file_path, table_reference):
         A pandas DataFrame containing the extracted table.
     """
 
+    import pandas as pd
+
     # Extract the sheet name and cell range from the cell ranges reference
 
     sheet_name, cell_range = table_reference.split("!")
@@ -183,6 +217,61 @@ def extract_table_from_reference(file_path, table_reference):
     return table_df
 
 
+def get_pricing_model_key(user_input):
+    """
+    Get the key identifying the pricing model data read for a user input: the workbook file (path and modification
+    time) and the named ranges read from it.
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    Returns
+    -------
+    tuple
+        The key of the pricing model data, used to share the data between runs on the same workbook.
+    """
+
+    file_path = os.path.abspath(user_input["filePath"])
+    modified_time = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+    named_ranges = tuple(user_input.get(key) for key in PRICING_MODEL_NAMED_RANGES)
+
+    return file_path, modified_time, named_ranges
+
+
+def get_dynamic_lapse_settings(user_input):
+    """
+    Get the dynamic lapse rules of a run (see `engine.generate_dynamic_lapse_columns`):
+    - "lapseOnFundExhaustion" : the policies lapse in the first period where the unit fund cannot pay the insurance
+                                charge,
+    - "lapseRateSensitivity"  : the table lapse rates are multiplied by 1 + sensitivity * (annual risk-free rate -
+                                "lapseReferenceRate"), bounded by "lapseMultiplierMin" and "lapseMultiplierMax".
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    Returns
+    -------
+    dict or None
+        The dynamic lapse settings, or None if no dynamic lapse rule is used (table lapse rates only).
+    """
+
+    settings = {
+        "fund_exhaustion": bool(user_input.get("lapseOnFundExhaustion", False)),
+        "rate_sensitivity": float(user_input.get("lapseRateSensitivity", 0) or 0),
+        "reference_rate": float(user_input.get("lapseReferenceRate", 0) or 0),
+        "multiplier_min": float(user_input.get("lapseMultiplierMin", 0) or 0),
+        "multiplier_max": float(user_input.get("lapseMultiplierMax", 2) or 2),
+    }
+    if not settings["fund_exhaustion"] and settings["rate_sensitivity"] == 0:
+        return None
+
+    return settings
+
+
 def read_pricing_model_data(user_input, log_list):
     """
     Read and extract data from an Excel-based pricing model using input parameters.
@@ -219,6 +308,8 @@ def read_pricing_model_data(user_input, log_list):
     # Extract specific named ranges
     # ------------------------------------------------------
     # Load the workbook
+    from openpyxl import load_workbook
+
     wb = load_workbook(filename=file_path, data_only=True)
 
     #   Person Covered's Profile
@@ -307,3 +398,134 @@ def read_pricing_model_data(user_input, log_list):
         "COI_Loading": coi_loading_value,
     }
     return data, log_list
+
+
+def read_model_points(file_path, log_list):
+    """
+    Read a model point file for a seriatim run: one row per policy with the columns Age, Gender, Pol_Year,
+    SumAssured and Contribution_perYear.
+
+    For the valuation of an in-force block, the file can also give the months elapsed since issue (Elapsed_Months)
+    and the unit fund value (Unit_Fund_Value) of each policy at the valuation date. Age and Pol_Year remain the age at
+    entry and the policy term: the projection starts at the attained age Age + Elapsed_Months // 12 (see
+    `engine.generate_reference_columns`).
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the model point file (.csv or .xlsx, first sheet).
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    dict, list
+        A dictionary with one array per model point column and the updated log list.
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    file_columns = MODEL_POINT_COLUMNS + INFORCE_MODEL_POINT_COLUMNS
+    if file_path.lower().endswith(".xlsx"):
+        model_point_df = pd.read_excel(
+            file_path, usecols=lambda col: col in file_columns
+        )
+    else:
+        model_point_df = pd.read_csv(file_path)
+
+    missing = [col for col in MODEL_POINT_COLUMNS if col not in model_point_df.columns]
+    if missing:
+        raise ValueError(
+            f"Model point file {file_path} is missing the columns: {missing}."
+        )
+
+    model_points = {
+        col: model_point_df[col].to_numpy()
+        for col in file_columns
+        if col in model_point_df.columns
+    }
+    if "Elapsed_Months" in model_points:
+        elapsed_months = model_points["Elapsed_Months"]
+        if np.any(elapsed_months < 0) or np.any(elapsed_months % 1 != 0):
+            raise ValueError(
+                f"Model point file {file_path}: Elapsed_Months must be whole numbers of months, not negative."
+            )
+        model_points["Elapsed_Months"] = elapsed_months.astype(np.int64)
+    if "Unit_Fund_Value" in model_points and np.any(
+        np.isnan(model_points["Unit_Fund_Value"])
+    ):
+        raise ValueError(
+            f"Model point file {file_path}: Unit_Fund_Value is missing for some policies."
+        )
+
+    log_list = log_message(
+        f"{len(model_point_df):,} model points read from: {file_path}.", log_list
+    )
+    inforce_columns = [
+        col for col in INFORCE_MODEL_POINT_COLUMNS if col in model_points
+    ]
+    if inforce_columns:
+        log_list = log_message(
+            f"In-force model points: the policies are projected from the valuation date ({', '.join(inforce_columns)} "
+            f"given).",
+            log_list,
+        )
+
+    return model_points, log_list
+
+
+def read_sales_volumes(file_path, n_cells, log_list):
+    """
+    Read a sales volume file for a new business cohort run: one row per month of sales (in month order, with an
+    optional "Month" column) and the number of policies sold each month in one column per product cell (the model
+    points, in order), or in a single column used for every cell.
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the sales volume file (.csv or .xlsx, first sheet).
+
+    n_cells : int
+        The number of product cells (model points) of the run.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    ndarray, list
+        The (cells x months) float64 array of sales volumes and the updated log list.
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    if file_path.lower().endswith(".xlsx"):
+        sales_df = pd.read_excel(file_path)
+    else:
+        sales_df = pd.read_csv(file_path)
+
+    if "Month" in sales_df.columns:
+        sales_df = sales_df.sort_values("Month").drop(columns="Month")
+    if sales_df.shape[1] not in (1, n_cells):
+        raise ValueError(
+            f"Sales volume file {file_path} has {sales_df.shape[1]} sales columns: expected one column per product "
+            f"cell ({n_cells}) or a single column."
+        )
+
+    sales = sales_df.to_numpy(dtype=np.float64).T
+    if np.any(np.isnan(sales)) or np.any(sales < 0):
+        raise ValueError(
+            f"Sales volume file {file_path}: the sales volumes must be given and not negative."
+        )
+    sales = np.broadcast_to(sales, (n_cells, sales.shape[1])).copy()
+
+    log_list = log_message(
+        f"Sales volumes of {sales.shape[1]:,} months read from: {file_path} ({sales.sum():,.0f} policies sold "
+        f"over {n_cells:,} product cells).",
+        log_list,
+    )
+
+    return sales, log_list
@@ -0,0 +1,1943 @@
+"""
+engine.py
+
+This module contains the vectorized projection engine. It performs the same calculations as the loop-based functions in
+`projection.py` (reference columns, economic rates, decrements, unit fund, risk fund, shareholders' fund, inforce
+cashflows and present values), but for a batch of model points at once using NumPy arrays of shape (policies x months).
+
+Each stage writes its columns in place into a ProjectionResult (see `proj_result.py`), so no intermediate dataframe is
+created. Per-policy inputs (age, gender, policy term, sum assured, contribution) can be given as scalars or as arrays with
+one value per model point; product parameters and assumption tables are shared by all model points.
+
+Model points of an in-force block can start at any duration: each policy is projected from the valuation date with its
+elapsed months (policy month, policy year and attained age follow from them) and its unit fund value at that date. The
+risk-free rates and discount factors run from the valuation date, so every policy is valued at the same date.
+
+The engine runs on monthly time steps by default. An annual time step can be used for quick indicative runs: decrements,
+rates, contributions, charges and fund roll-forwards are then applied per year, giving 12 times fewer steps. In that mode
+the "_perMonth" columns hold the rates per time step (i.e. per year) and T_Index counts years.
+
+The inforce and PV stages can also run on the ragged layout (see `proj_result.RaggedResult`), which only holds the
+periods in cover of each policy, so mixed-term portfolios do not carry the zero tail of their short policies.
+"""
+
+import numpy as np
+import data_read as read
+import run_metrics as rm
+import reduction as red
+from proj_result import ProjectionResult, RaggedResult
+
+
+# ================================
+#  PROJECTION LAYOUT
+# ================================
+# - column groups in the same order as the tables produced by `projection.py`.
+# - columns shared by several tables (e.g. Insurance_Charge_PP) are listed in each group, but stored once in the result.
+
+COLUMN_GROUPS = {
+    "reference": ["T_Index", "is_Cover", "Pol_Month", "Pol_Year", "Age"],
+    "economic": [
+        "RiskFree_perYear",
+        "RiskFree_perMonth",
+        "disc_factor_bop",
+        "disc_factor_eop",
+    ],
+    "decrement": [
+        "Mortality_Rate_perYear",
+        "Mortality_Rate_perMonth",
+        "Lapse_Rate_perYear",
+        "Lapse_Rate_perMonth",
+        "No_Pol_Start",
+        "No_Death",
+        "No_Lapse",
+        "No_Pol_End",
+    ],
+    "unit_pp": [
+        "Contribution_PP",
+        "Wakalah_Fee_Rate",
+        "Wakalah_Fee_PP",
+        "Unit_Fund_BOP_PP",
+        "Unit_Alloc_PP",
+        "Insurance_Charge_PP",
+        "Unit_InvInc_PP",
+        "Unit_InvCharge_PP",
+        "Unit_Fund_EOP_PP",
+    ],
+    "risk_pp": [
+        "Risk_Fund_BOP_PP",
+        "Insurance_Charge_PP",
+        "Insurance_Claim_PP",
+        "Risk_Fund_InvInc_PP",
+        "Surplus_to_SHF_PP",
+        "Surplus_to_Participant_PP",
+        "Risk_Fund_EOP_PP",
+    ],
+    "shf_pp": [
+        "Wakalah_Fee_PP",
+        "Expenses_PP",
+        "SHF_InvInc_PP",
+        "Unit_InvCharge_PP",
+        "Fund_Expenses_PP",
+        "Surplus_to_SHF_PP",
+        "Profit_PP",
+    ],
+    "unit_if": [
+        "Contribution_IF",
+        "Wakalah_Fee_IF",
+        "Unit_Fund_BOP_IF",
+        "Unit_Alloc_IF",
+        "Insurance_Charge_IF",
+        "Unit_InvInc_IF",
+        "Unit_InvCharge_IF",
+        "Unit_Fund_EOP_IF",
+        "Fund_Rel_Death_IF",
+        "Fund_Rel_Lapse_IF",
+    ],
+    "risk_if": [
+        "Risk_Fund_BOP_IF",
+        "Insurance_Charge_IF",
+        "Insurance_Claim_IF",
+        "Risk_Fund_InvInc_IF",
+        "Surplus_to_SHF_IF",
+        "Surplus_to_Participant_IF",
+        "Risk_Fund_EOP_IF",
+    ],
+    "shf_if": [
+        "Wakalah_Fee_IF",
+        "Expenses_IF",
+        "SHF_InvInc_IF",
+        "Unit_InvCharge_IF",
+        "Fund_Expenses_IF",
+        "Surplus_to_SHF_IF",
+        "Profit_IF",
+    ],
+}
+
+PROJECTION_COLUMNS = list(
+    dict.fromkeys(col for cols in COLUMN_GROUPS.values() for col in cols)
+)
+
+INTEGER_COLUMNS = ["T_Index", "is_Cover", "Pol_Month", "Pol_Year", "Age"]
+
+# Columns that are only reported (not used by any later stage or by the PV calculation).
+# They are not allocated nor computed when they are not selected for the output.
+OPTIONAL_COLUMNS = [
+    "RiskFree_perYear",
+    "Mortality_Rate_perYear",
+    "Lapse_Rate_perYear",
+    "Wakalah_Fee_Rate",
+    "Risk_Fund_BOP_PP",
+    "Risk_Fund_EOP_PP",
+    "Unit_Fund_BOP_IF",
+    "Risk_Fund_BOP_IF",
+    "Risk_Fund_EOP_IF",
+]
+
+# Precision modes:
+# - "double": every column is stored as float64 (default).
+# - "single": cashflows and rates are stored as float32, the coverage flag as bool and the counters as int16.
+#   Accumulations (discount factors, policy counts, fund roll-forwards and PV sums) are still computed in float64.
+PRECISION_DTYPES = {"double": "float64", "single": "float32"}
+
+# Time step modes: number of projection steps per year
+TIME_STEPS = {"monthly": 12, "annual": 1}
+
+COMPACT_DTYPES = {
+    "T_Index": "int16",
+    "is_Cover": "bool",
+    "Pol_Month": "int16",
+    "Pol_Year": "int16",
+    "Age": "int16",
+}
+
+# Timing of each inforce cashflow item for discounting (same as `projection.generate_pv_cashflows_df`)
+CF_TIMING = {
+    # for unit fund
+    "Contribution_IF": "BOP",
+    "Wakalah_Fee_IF": "BOP",
+    "Unit_Alloc_IF": "BOP",
+    "Insurance_Charge_IF": "BOP",
+    "Unit_InvInc_IF": "EOP",
+    "Unit_InvCharge_IF": "EOP",
+    "Fund_Rel_Death_IF": "EOP",
+    "Fund_Rel_Lapse_IF": "EOP",
+    # for risk fund
+    "Insurance_Claim_IF": "EOP",
+    "Risk_Fund_InvInc_IF": "EOP",
+    "Surplus_to_SHF_IF": "EOP",
+    "Surplus_to_Participant_IF": "EOP",
+    # for shareholder's fund
+    "Expenses_IF": "BOP",
+    "SHF_InvInc_IF": "EOP",
+    "Fund_Expenses_IF": "EOP",
+    "Profit_IF": "EOP",
+}
+
+
+def create_projection_result(
+    n_policies=1, n_months=1200, precision="double", time_step="monthly", columns=None
+):
+    """
+    Create an empty ProjectionResult with the projection layout.
+
+    Parameters
+    ----------
+    n_policies : int
+        The number of model points to be projected.
+
+    n_months : int
+        The projection horizon in months (1200 = 100 years).
+
+    precision : str
+        The precision mode: "double" (default) or "single".
+
+    time_step : str
+        The projection time step: "monthly" (default) or "annual".
+
+    columns : List
+        Optional list of the columns required in the output. Optional columns (see OPTIONAL_COLUMNS) that are not
+        listed are left out of the result. By default all columns are allocated.
+
+    Returns
+    -------
+    ProjectionResult
+        The preallocated result container.
+    """
+
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(
+            f"Unsupported precision mode: {precision}. Use one of {list(PRECISION_DTYPES)}."
+        )
+
+    if time_step not in TIME_STEPS:
+        raise ValueError(
+            f"Unsupported time step: {time_step}. Use one of {list(TIME_STEPS)}."
+        )
+    steps_per_year = TIME_STEPS[time_step]
+
+    if columns is None:
+        result_columns = PROJECTION_COLUMNS
+    else:
+        # an inforce column is derived from its per policy column
+        selected = set(columns) | {col.replace("_IF", "_PP") for col in columns}
+        result_columns = [
+            col
+            for col in PROJECTION_COLUMNS
+            if col not in OPTIONAL_COLUMNS or col in selected
+        ]
+
+    return ProjectionResult(
+        result_columns,
+        n_policies=n_policies,
+        n_months=n_months * steps_per_year // 12,
+        int_columns=INTEGER_COLUMNS,
+        dtype=PRECISION_DTYPES[precision],
+        column_dtypes=COMPACT_DTYPES if precision == "single" else None,
+        steps_per_year=steps_per_year,
+    )
+
+
+def _per_policy(value):
+    """
+    Convert a per-policy input (scalar or one value per policy) into a (policies x 1) column for broadcasting.
+    """
+
+    return np.asarray(value).reshape(-1, 1)
+
+
+def _table_lookup(keys, values, lookup_keys, default):
+    """
+    Vectorized lookup of integer keys in a table. Keys not found in the table (or above the maximum key) get the default.
+
+    Parameters
+    ----------
+    keys : array-like
+        The integer keys of the table (e.g. age or policy year).
+
+    values : array-like
+        The table values for each key.
+
+    lookup_keys : ndarray
+        The keys to be looked up.
+
+    default : float
+        The value used for keys that are not in the table.
+
+    Returns
+    -------
+    ndarray
+        The looked-up values, with the same shape as lookup_keys.
+    """
+
+    keys = np.asarray(keys, dtype=np.int64)
+    dense = np.full(keys.max() + 1, default, dtype=np.float64)
+    dense[keys] = np.asarray(values, dtype=np.float64)
+    lookup_id = np.clip(np.asarray(lookup_keys, dtype=np.int64), 0, keys.max())
+
+    # keys above the table are capped to the maximum key, so set them to default explicitly
+    return np.where(np.asarray(lookup_keys) > keys.max(), default, dense[lookup_id])
+
+
+# ================================
+#  REFERENCE COLUMNS
+# ================================
+# - time index, coverage indicator, policy month, policy year and attained age.
+
+
+def generate_reference_columns(result, age, pol_year, elapsed_months=0):
+    """
+    Generate the reference columns: T_Index, is_Cover, Pol_Month, Pol_Year and Age.
+
+    Pol_Month and Pol_Year count from the issue of each policy (elapsed months included), and Age is the attained age
+    from the age at entry: Age = age at entry + Pol_Year - 1. For an in-force policy, the first projected month is
+    therefore at the attained age age + elapsed_months // 12, and the age increases at each policy anniversary. Every
+    rate table keyed by age (mortality) or by policy year (lapse, Wakalah fee) is looked up with these columns, so the
+    rates of an in-force policy are those of the same policy projected from its issue, shifted by its elapsed months.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    age : int or ndarray
+        The age at entry (issue) of each policyholder, also for in-force policies.
+
+    pol_year : int or ndarray
+        The number of years each policy is covered (policy term from issue).
+
+    elapsed_months : int or ndarray
+        The number of months each policy has been in force at the start of the projection (0 for new business). The
+        annual time step requires whole years.
+
+    Returns
+    -------
+    None
+    """
+
+    steps_per_year = result.steps_per_year
+    if np.any(np.asarray(elapsed_months) % (12 // steps_per_year)):
+        raise ValueError(
+            "The elapsed months of the policies must be whole time steps (whole years with the annual time step)."
+        )
+
+    t_index = np.arange(1, result.n_months + 1, dtype=np.float64)
+    pol_month = t_index * (12 // steps_per_year) + _per_policy(elapsed_months)
+    is_cover = (pol_month <= _per_policy(pol_year) * 12).astype(np.float64)
+    pol_month = pol_month * is_cover
+    pol_year_proj = np.ceil(pol_month / 12) * is_cover
+
+    result["T_Index"] = t_index
+    result["is_Cover"] = is_cover
+    result["Pol_Month"] = pol_month
+    result["Pol_Year"] = pol_year_proj
+    result["Age"] = (_per_policy(age) + pol_year_proj - 1) * is_cover
+
+
+# ================================
+#  ECONOMIC RATES PROJECTION
+# ================================
+
+
+def generate_rfr_columns(result, rfr_table):
+    """
+    Generate the annual and monthly risk-free rates based on the year since the start of the projection (the policy
+    year for new business, the year since the valuation date for an in-force block).
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    rfr_table : DataFrame
+        A DataFrame containing annual risk-free rates.
+
+    Returns
+    -------
+    None
+    """
+
+    years = rfr_table["Year.1"].to_numpy()
+    rates = rfr_table["rfr p.a."].to_numpy()
+    last_value = rates[np.argmax(years)]
+
+    is_cover = result["is_Cover"]
+    proj_year = np.ceil(
+        np.arange(1, result.n_months + 1) * (12 // result.steps_per_year) / 12
+    )
+    rfr_year = _table_lookup(years, rates, proj_year, last_value)
+
+    result["RiskFree_perMonth"] = (
+        (1 + rfr_year) ** (1 / result.steps_per_year) - 1
+    ) * is_cover
+    if "RiskFree_perYear" in result:
+        result["RiskFree_perYear"] = rfr_year * is_cover
+
+
+def generate_discount_factor_columns(result):
+    """
+    Generate the discount factors for the beginning and end of each period from the monthly risk-free rates.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    Returns
+    -------
+    None
+    """
+
+    # accumulated in float64 regardless of the precision mode
+    disc_factor_eop = 1 / np.cumprod(
+        1 + result["RiskFree_perMonth"], axis=1, dtype=np.float64
+    )
+
+    result["disc_factor_eop"] = disc_factor_eop
+    disc_factor_bop = result["disc_factor_bop"]
+    disc_factor_bop[:, 0] = 1.0
+    disc_factor_bop[:, 1:] = disc_factor_eop[:, :-1]
+
+
+# ================================
+#  DECREMENTS PROJECTION
+# ================================
+
+
+def generate_mortality_rate_columns(result, gender, mortality_table):
+    """
+    Generate the annual and monthly mortality rates based on attained age and gender. The attained age is the Age
+    column (see generate_reference_columns), which includes the elapsed years of in-force policies.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    gender : str or ndarray
+        The gender of each policyholder ("Male" or "Female").
+
+    mortality_table : DataFrame
+        A DataFrame containing annual mortality rates by age and gender.
+
+    Returns
+    -------
+    None
+    """
+
+    ages = mortality_table["Age"].to_numpy()
+    max_age_id = np.argmax(ages)
+    male_rates = mortality_table["Male Rates"].to_numpy()
+    female_rates = mortality_table["Female Rates"].to_numpy()
+
+    attained_age = result["Age"]
+    mort_male = _table_lookup(ages, male_rates, attained_age, male_rates[max_age_id])
+    mort_female = _table_lookup(
+        ages, female_rates, attained_age, female_rates[max_age_id]
+    )
+    mort_year = np.where(_per_policy(gender) == "Male", mort_male, mort_female)
+
+    is_cover = result["is_Cover"]
+    result["Mortality_Rate_perMonth"] = (
+        1 - (1 - mort_year) ** (1 / result.steps_per_year)
+    ) * is_cover
+    if "Mortality_Rate_perYear" in result:
+        result["Mortality_Rate_perYear"] = mort_year * is_cover
+
+
+def generate_lapse_rate_columns(result, lapse_table, max_pol_year):
+    """
+    Generate the annual and monthly lapse rates based on policy year.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    lapse_table : DataFrame
+        A DataFrame containing annual lapse rates by policy year.
+
+    max_pol_year : int or ndarray
+        The policy term of each policy. The lapse rate is 100% in the final policy year.
+
+    Returns
+    -------
+    None
+    """
+
+    years = lapse_table["Year"].to_numpy()
+    rates = lapse_table["%"].to_numpy() / 100
+
+    pol_year = result["Pol_Year"]
+    lapse_year = _table_lookup(years, rates, pol_year, rates[np.argmax(years)])
+    lapse_year = np.where(pol_year == _per_policy(max_pol_year), 1.0, lapse_year)
+    lapse_year = np.where(pol_year == 0, 0.0, lapse_year)
+
+    if "Lapse_Rate_perYear" in result:
+        result["Lapse_Rate_perYear"] = lapse_year
+    result["Lapse_Rate_perMonth"] = 1 - (1 - lapse_year) ** (1 / result.steps_per_year)
+
+
+def generate_dynamic_lapse_columns(result, dynamic_lapse):
+    """
+    Apply the dynamic lapse rules to the table lapse rates: lapse on unit fund exhaustion and rate-dependent lapse.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place. The lapse rate and unit fund columns must already be generated.
+
+    dynamic_lapse : dict
+        The dynamic lapse settings (see `data_read.get_dynamic_lapse_settings`).
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    Rate-dependent lapse: the annual lapse rate of each covered period is multiplied by
+
+    Lapse Multiplier = 1 + Rate Sensitivity * (Annual Risk-Free Rate - Reference Rate)
+
+    bounded by the minimum and maximum multipliers, and capped at 100%.
+
+    Fund exhaustion: the unit fund before investment (opening fund + allocation - insurance charge) of a covered period
+    is negative when the fund cannot pay the insurance charge, and the policy then lapses at the end of the period
+    (lapse rate of 100%). The negative fund is released on lapse, as the uncollected charge.
+
+    The per policy unit fund is projected for a policy still in force, so it does not depend on the policy count: both
+    rules only depend on the per policy columns and are applied to all the policies and periods at once. The policy
+    counts are generated afterwards from the dynamic lapse rates.
+    """
+
+    is_cover = result["is_Cover"].astype(bool)
+    steps_per_year = result.steps_per_year
+    lapse_month = result["Lapse_Rate_perMonth"].astype(np.float64)
+
+    if dynamic_lapse["rate_sensitivity"] != 0:
+        rfr_year = (
+            1 + result["RiskFree_perMonth"].astype(np.float64)
+        ) ** steps_per_year - 1
+        multiplier = np.clip(
+            1
+            + dynamic_lapse["rate_sensitivity"]
+            * (rfr_year - dynamic_lapse["reference_rate"]),
+            dynamic_lapse["multiplier_min"],
+            dynamic_lapse["multiplier_max"],
+        )
+        lapse_year = 1 - (1 - lapse_month) ** steps_per_year
+        lapse_year = np.where(
+            is_cover & (lapse_month < 1),
+            np.minimum(lapse_year * multiplier, 1.0),
+            lapse_year,
+        )
+        lapse_month = np.where(
+            lapse_month < 1, 1 - (1 - lapse_year) ** (1 / steps_per_year), lapse_month
+        )
+
+    if dynamic_lapse["fund_exhaustion"]:
+        fund_before_inv = (
+            result["Unit_Fund_BOP_PP"].astype(np.float64)
+            + result["Unit_Alloc_PP"]
+            - result["Insurance_Charge_PP"]
+        )
+        lapse_month = np.where(is_cover & (fund_before_inv < 0), 1.0, lapse_month)
+
+    result["Lapse_Rate_perMonth"] = lapse_month
+    if "Lapse_Rate_perYear" in result:
+        result["Lapse_Rate_perYear"] = 1 - (1 - lapse_month) ** steps_per_year
+
+
+def generate_policy_count_columns(result):
+    """
+    Generate the policy count at the start and end of each period, and the number of deaths and lapses.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    Same independent (non-competing) decrement approach as `projection.generate_policy_count_table`:
+
+    Number of Death = Num Policy at Start * Death Rate
+    Number of Lapse = (Num Policy at Start - Number of Death) * Lapse Rate
+    Number of Policy at End of Period = Num Policy at Start - Num of Death - Num of Lapse
+
+    The opening count of each month is the survival probability up to the previous month, computed with a cumulative
+    product instead of a loop over months.
+    """
+
+    mort_month = result["Mortality_Rate_perMonth"].astype(np.float64)
+    lapse_month = result["Lapse_Rate_perMonth"].astype(np.float64)
+    survival = (1 - mort_month) * (1 - lapse_month)
+
+    no_pol_start = np.ones((result.n_policies, result.n_months))
+    np.cumprod(survival[:, :-1], axis=1, out=no_pol_start[:, 1:])
+
+    no_death = no_pol_start * mort_month
+    no_lapse = (no_pol_start - no_death) * lapse_month
+
+    result["No_Pol_Start"] = no_pol_start
+    result["No_Death"] = no_death
+    result["No_Lapse"] = no_lapse
+    result["No_Pol_End"] = no_pol_start - no_death - no_lapse
+
+
+# ==========================================
+#  PER POLICY CASH FLOWs PROJECTION
+# ==========================================
+# - the fund roll-forward depends on the previous month, so it loops over months but is vectorized over policies.
+# - the fund carried from one month to the next is kept in float64, and only the reported columns follow the precision mode.
+# - the loops only project the active policies: every COMPACTION_INTERVAL periods, the policies whose cover has ended (or
+#   that are no longer in force, see get_active_periods) are dropped from the working arrays, and the loops stop at the
+#   last active period of the batch. The periods that are not projected keep their zero value.
+
+# Number of periods between two compactions of the active policies in the fund roll-forwards
+COMPACTION_INTERVAL = 12
+
+
+def get_active_periods(result, inforce_threshold=None):
+    """
+    Get the number of active periods of each policy: the periods in cover and, if an inforce threshold is given, with
+    an expected number of policies in force above the threshold.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The projection result. The policy count columns must already be generated if an inforce threshold is given.
+
+    inforce_threshold : float
+        Optional threshold of No_Pol_Start: a policy is no longer active from the first period where its expected
+        number of policies in force is not above the threshold (e.g. 0 once the policy has lapsed for certain).
+
+    Returns
+    -------
+    ndarray
+        The number of leading active periods of each policy.
+    """
+
+    # the cover and the policy count only decrease, so the active periods are the leading periods
+    n_active = np.count_nonzero(result["is_Cover"], axis=1)
+    if inforce_threshold is not None:
+        terminated = result["No_Pol_Start"] <= inforce_threshold
+        n_inforce = np.where(
+            terminated.any(axis=1), terminated.argmax(axis=1), result.n_months
+        )
+        n_active = np.minimum(n_active, n_inforce)
+
+    return n_active
+
+
+def _active_windows(n_active, n_months, keep_active=None, interval=COMPACTION_INTERVAL):
+    """
+    Split the periods of a fund roll-forward into windows of `interval` periods, with the policies still active at the
+    start of each window. The windows stop once no policy is active.
+
+    Parameters
+    ----------
+    n_active : ndarray
+        The number of active periods of each policy (see get_active_periods).
+
+    n_months : int
+        The number of projection periods.
+
+    keep_active : callable
+        Optional function returning, at the start of a window, a mask of the policies to project even if their active
+        periods have ended (e.g. a fund still to be distributed).
+
+    interval : int
+        The number of periods between two compactions.
+
+    Yields
+    ------
+    int, int, slice or ndarray
+        The first and last (excluded) periods of the window, and the rows of the active policies (all the rows as a
+        slice when every policy is active).
+    """
+
+    n_policies = n_active.size
+    for start in range(0, n_months, interval):
+        active = n_active > start
+        if keep_active is not None:
+            active |= keep_active()
+        n_live = np.count_nonzero(active)
+        if n_live == 0:
+            return
+        rows = slice(None) if n_live == n_policies else np.flatnonzero(active)
+        yield start, min(start + interval, n_months), rows
+
+
+def generate_unit_fund_columns(
+    result,
+    contribution_per_year,
+    wakalah_fee_table,
+    sum_assured,
+    coi_loading,
+    fmc,
+    unit_fund_value=0.0,
+):
+    """
+    Generate the unit fund per policy cashflows.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place.
+
+    contribution_per_year : float or ndarray
+        The annual contribution amount of each policy.
+
+    wakalah_fee_table : DataFrame
+        A DataFrame containing Wakalah fee rates by policy year.
+
+    sum_assured : float or ndarray
+        The sum assured amount of each policy.
+
+    coi_loading : float
+        The cost of insurance loading factor.
+
+    fmc : float
+        The fund management charge rate.
+
+    unit_fund_value : float or ndarray
+        The unit fund of each policy at the start of the projection (0 for new business, the fund value at the
+        valuation date for an in-force block).
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    See `projection.generate_unit_fund_cashflow_table` for the definition of each cashflow item.
+    """
+
+    is_cover = result["is_Cover"]
+    rfr_month = result["RiskFree_perMonth"]
+
+    years = wakalah_fee_table["Year"].to_numpy()
+    fee_rates = wakalah_fee_table["%"].to_numpy()
+    wakalah_fee_rate = _table_lookup(
+        years, fee_rates, result["Pol_Year"], fee_rates[np.argmax(years)]
+    )
+
+    steps_per_year = result.steps_per_year
+    contribution_pp = (_per_policy(contribution_per_year) / steps_per_year) * is_cover
+    wakalah_fee_pp = contribution_pp * (wakalah_fee_rate / 100)
+    unit_alloc_pp = contribution_pp - wakalah_fee_pp
+    insurance_charge_pp = (
+        _per_policy(sum_assured) * result["Mortality_Rate_perMonth"] * (1 + coi_loading)
+    )
+
+    result["Contribution_PP"] = contribution_pp
+    if "Wakalah_Fee_Rate" in result:
+        result["Wakalah_Fee_Rate"] = wakalah_fee_rate
+    result["Wakalah_Fee_PP"] = wakalah_fee_pp
+    result["Unit_Alloc_PP"] = unit_alloc_pp
+    result["Insurance_Charge_PP"] = insurance_charge_pp
+
+    # Fund roll-forward
+    unit_fund_bop_pp = result["Unit_Fund_BOP_PP"]
+    unit_invinc_pp = result["Unit_InvInc_PP"]
+    unit_invcharge_pp = result["Unit_InvCharge_PP"]
+    unit_fund_eop_pp = result["Unit_Fund_EOP_PP"]
+
+    # the fund is nil after the cover ends, so only the policies in cover are projected
+    fund_carried = np.zeros(result.n_policies)
+    fund_carried += np.asarray(unit_fund_value, dtype=np.float64).ravel()
+    n_active = get_active_periods(result)
+    for start, stop, rows in _active_windows(n_active, result.n_months):
+        # compacted working arrays of the active policies over the window
+        window_cover = is_cover[rows, start:stop]
+        window_alloc = unit_alloc_pp[rows, start:stop]
+        window_charge = insurance_charge_pp[rows, start:stop]
+        window_rfr = rfr_month[rows, start:stop]
+        window_bop, window_invinc, window_invcharge, window_eop = np.empty(
+            (4,) + window_alloc.shape
+        )
+
+        fund_eop = fund_carried[rows]
+        for j in range(stop - start):
+            fund_bop = fund_eop * window_cover[:, j]
+            fund_before_inv = fund_bop + window_alloc[:, j] - window_charge[:, j]
+            inv_inc = fund_before_inv * window_rfr[:, j]
+            inv_charge = (fund_before_inv + inv_inc) * (fmc / steps_per_year)
+            fund_eop = fund_before_inv + inv_inc - inv_charge
+
+            window_bop[:, j] = fund_bop
+            window_invinc[:, j] = inv_inc
+            window_invcharge[:, j] = inv_charge
+            window_eop[:, j] = fund_eop
+
+        fund_carried[rows] = fund_eop
+        unit_fund_bop_pp[rows, start:stop] = window_bop
+        unit_invinc_pp[rows, start:stop] = window_invinc
+        unit_invcharge_pp[rows, start:stop] = window_invcharge
+        unit_fund_eop_pp[rows, start:stop] = window_eop
+
+
+def generate_risk_fund_columns(
+    result,
+    sum_assured,
+    surplus_share_to_shf,
+    surplus_share_to_participant,
+    n_active=None,
+):
+    """
+    Generate the risk fund per policy cashflows.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place. The unit fund columns must already be generated.
+
+    sum_assured : float or ndarray
+        The sum assured amount of each policy.
+
+    surplus_share_to_shf : float
+        The surplus share to shareholder factor.
+
+    surplus_share_to_participant : float
+        The surplus share to participant factor.
+
+    n_active : ndarray
+        Optional number of active periods of each policy (see get_active_periods), after which the policy is not
+        projected. By default the policies are projected while in cover, and after their cover while their risk fund
+        is not nil (surplus still distributed).
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    See `projection.generate_risk_fund_cashflows_table` for the definition of each cashflow item.
+    """
+
+    rfr_month = result["RiskFree_perMonth"]
+    insurance_charge_pp = result["Insurance_Charge_PP"]
+    insurance_claim_pp = result["Insurance_Claim_PP"]
+    insurance_claim_pp[...] = (
+        _per_policy(sum_assured) * result["Mortality_Rate_perMonth"]
+    )
+
+    risk_fund_invinc_pp = result["Risk_Fund_InvInc_PP"]
+    surplus_to_shf_pp = result["Surplus_to_SHF_PP"]
+    surplus_to_participant_pp = result["Surplus_to_Participant_PP"]
+
+    # the fund balances are only reported, so they are not kept if not selected
+    risk_fund_bop_pp = (
+        result["Risk_Fund_BOP_PP"] if "Risk_Fund_BOP_PP" in result else None
+    )
+    risk_fund_eop_pp = (
+        result["Risk_Fund_EOP_PP"] if "Risk_Fund_EOP_PP" in result else None
+    )
+
+    fund_carried = np.zeros(result.n_policies)
+    keep_active = None
+    if n_active is None:
+        n_active = get_active_periods(result)
+        keep_active = lambda: fund_carried != 0
+    for start, stop, rows in _active_windows(n_active, result.n_months, keep_active):
+        # compacted working arrays of the active policies over the window
+        window_charge = insurance_charge_pp[rows, start:stop]
+        window_claim = insurance_claim_pp[rows, start:stop]
+        window_rfr = rfr_month[rows, start:stop]
+        window_bop, window_invinc, window_shf, window_participant, window_eop = (
+            np.empty((5,) + window_charge.shape)
+        )
+
+        fund_eop = fund_carried[rows]
+        for j in range(stop - start):
+            fund_bop = fund_eop
+            inv_inc = (fund_bop + window_charge[:, j]) * window_rfr[:, j]
+            surplus = fund_bop + window_charge[:, j] - window_claim[:, j] + inv_inc
+            surplus_shf = surplus * surplus_share_to_shf
+            surplus_participant = surplus * surplus_share_to_participant
+            fund_eop = surplus - surplus_shf - surplus_participant
+
+            window_bop[:, j] = fund_bop
+            window_invinc[:, j] = inv_inc
+            window_shf[:, j] = surplus_shf
+            window_participant[:, j] = surplus_participant
+            window_eop[:, j] = fund_eop
+
+        fund_carried[rows] = fund_eop
+        risk_fund_invinc_pp[rows, start:stop] = window_invinc
+        surplus_to_shf_pp[rows, start:stop] = window_shf
+        surplus_to_participant_pp[rows, start:stop] = window_participant
+        if risk_fund_bop_pp is not None:
+            risk_fund_bop_pp[rows, start:stop] = window_bop
+        if risk_fund_eop_pp is not None:
+            risk_fund_eop_pp[rows, start:stop] = window_eop
+
+
+def generate_shf_columns(
+    result, expense_per_contribution_per_year, expense_per_fund_per_year
+):
+    """
+    Generate the shareholders' fund per policy cashflows.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The result container to be written in place. The unit fund and risk fund columns must already be generated.
+
+    expense_per_contribution_per_year : float
+        The expense rate per contribution per year.
+
+    expense_per_fund_per_year : float
+        The expense rate per fund per year.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    See `projection.generate_shf_cashflows` for the definition of each cashflow item. Wakalah_Fee_PP, Unit_InvCharge_PP
+    and Surplus_to_SHF_PP are shared with the unit fund and risk fund, so they are not written again.
+    """
+
+    wakalah_fee_pp = result["Wakalah_Fee_PP"]
+    expenses_pp = result["Expenses_PP"]
+    # same basis as the monthly model: a twelfth of the yearly rate is charged on each contribution, so the annual
+    # contribution of an annual step (12 monthly contributions) is charged a twelfth of the rate as well
+    expenses_pp[...] = result["Contribution_PP"] * (
+        expense_per_contribution_per_year / 12
+    )
+    shf_invinc_pp = result["SHF_InvInc_PP"]
+    shf_invinc_pp[...] = (wakalah_fee_pp - expenses_pp) * result["RiskFree_perMonth"]
+    fund_expenses_pp = result["Fund_Expenses_PP"]
+    # same basis as the monthly model: the fund expense rate is charged on each month's closing fund,
+    # so an annual step covers 12 monthly charges
+    fund_expenses_pp[...] = (
+        result["Unit_Fund_EOP_PP"]
+        * expense_per_fund_per_year
+        * (12 // result.steps_per_year)
+    )
+
+    result["Profit_PP"] = (
+        wakalah_fee_pp
+        - expenses_pp
+        + shf_invinc_pp
+        + result["Unit_InvCharge_PP"]
+        - fund_expenses_pp
+        + result["Surplus_to_SHF_PP"]
+    )
+
+
+# ===================================================
+# INFORCE CASH FLOWs PROJECTION
+# ===================================================
+
+
+def generate_inforce_columns(result, log_list):
+    """
+    Generate the inforce cashflows by applying the policy count to the per policy cashflows.
+
+    Parameters
+    ----------
+    result : ProjectionResult or RaggedResult
+        The result container to be written in place. All per policy columns must already be generated.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    list
+        The updated log list.
+
+    Notes
+    -----
+    Inforce Cashflow = Per Policy Cashflow * No Policy At Start of Period
+    Unit_Fund_EOP_IF uses the policy count at end of period instead (fund after claims and lapses).
+    The fund released on death and lapse is the unit fund after investment applied to the number of deaths and lapses.
+    """
+
+    no_pol_start = result["No_Pol_Start"]
+    no_pol_end = result["No_Pol_End"]
+
+    for col in PROJECTION_COLUMNS:
+        if (
+            not col.endswith("_IF")
+            or col not in result
+            or col.replace("_IF", "_PP") not in result
+        ):
+            continue
+        pol_count = no_pol_end if col == "Unit_Fund_EOP_IF" else no_pol_start
+        np.multiply(result[col.replace("_IF", "_PP")], pol_count, out=result[col])
+
+    # Fund released on claims
+    unit_after_inv = (
+        result["Unit_Fund_BOP_PP"]
+        + result["Unit_Alloc_PP"]
+        - result["Insurance_Charge_PP"]
+        + result["Unit_InvInc_PP"]
+        - result["Unit_InvCharge_PP"]
+    )
+    result["Fund_Rel_Death_IF"] = unit_after_inv * result["No_Death"]
+    result["Fund_Rel_Lapse_IF"] = unit_after_inv * result["No_Lapse"]
+
+    # check if the net IF cashflow = Fund_EOP * no_pols_if (for Unit Fund only)
+    unit_after_inv_if = unit_after_inv * no_pol_start
+    unit_after_claim = (
+        unit_after_inv_if - result["Fund_Rel_Death_IF"] - result["Fund_Rel_Lapse_IF"]
+    )
+    if result.dtype == np.float64:
+        unit_if_check = np.round(result["Unit_Fund_EOP_IF"] - unit_after_claim, 4)
+        check_passed = unit_if_check.sum() == 0
+    else:
+        # stored values are rounded to the precision mode, so allow for its rounding error
+        tolerance = 1e-4 + 10 * np.finfo(result.dtype).eps * np.abs(unit_after_inv_if)
+        check_passed = np.all(
+            np.abs(result["Unit_Fund_EOP_IF"] - unit_after_claim) <= tolerance
+        )
+
+    if check_passed:
+        log_list = read.log_message(
+            f"Checking passed for: Net IF Unit Cashflow = Unit_PP * No_Pols_IF ",
+            log_list,
+        )
+    else:
+        log_list = read.log_message(
+            f"WARNING! Checking failed for: Net IF Unit Cashflow = Unit_PP * No_Pols_IF ",
+            log_list,
+        )
+
+    return log_list
+
+
+# =====================
+# DISCOUNTED CASH FLOW
+# =====================
+
+
+def generate_pv_array(result, cashflows, n_periods=None):
+    """
+    Calculate the present value of selected cashflow items for every policy.
+
+    Parameters
+    ----------
+    result : ProjectionResult or RaggedResult
+        The projection result.
+
+    cashflows : List
+        The inforce cashflow items to be discounted (must be defined in CF_TIMING).
+
+    n_periods : int
+        Optional number of periods discounted, when the projection stops before (see run_projection). The cashflows
+        and discount factors are zero-filled after the projected periods, so the sum products are the same as for a
+        full projection. It is not needed for a ragged result, whose sum products only run over the periods held.
+
+    Returns
+    -------
+    ndarray
+        A (policies x cashflows) array of present values.
+
+    Notes
+    -----
+    PV Cashflow = Sum Product of (Array of Projected Cashflow , Array of Discount Factor)
+    The sum product is always accumulated in float64. For a ragged result the products are added in period order for
+    each policy, so the present values can differ in the last digits from the padded layout.
+    """
+
+    if isinstance(result, RaggedResult):
+        pv_array = np.empty((result.n_policies, len(cashflows)))
+        for j, col in enumerate(cashflows):
+            pv_array[:, j] = result.sum_by_policy(
+                np.multiply(
+                    result[col],
+                    result[f"disc_factor_{CF_TIMING[col].lower()}"],
+                    dtype=np.float64,
+                )
+            )
+        return pv_array
+
+    # zero-filled buffers of the full periods (one per discount factor and one for the cashflows)
+    buffers = {}
+
+    def padded(values, key):
+        if n_periods is None or n_periods == result.n_months:
+            return values
+        if key not in buffers:
+            buffers[key] = np.zeros((result.n_policies, n_periods), dtype=values.dtype)
+        buffers[key][:, : result.n_months] = values
+        return buffers[key]
+
+    disc_factor = {
+        timing: padded(result[f"disc_factor_{timing.lower()}"], timing)
+        for timing in ["BOP", "EOP"]
+    }
+    pv_array = np.empty((result.n_policies, len(cashflows)))
+
+    for j, col in enumerate(cashflows):
+        pv_array[:, j] = np.einsum(
+            "ij,ij->i",
+            padded(result[col], result[col].dtype.str),
+            disc_factor[CF_TIMING[col]],
+            dtype=np.float64,
+        )
+
+    return pv_array
+
+
+def generate_pv_table(result, n_periods=None):
+    """
+    Generate the PV results table, in the same layout as the PV results of the loop-based model.
+
+    Parameters
+    ----------
+    result : ProjectionResult or RaggedResult
+        The projection result.
+
+    n_periods : int
+        Optional number of periods discounted (see generate_pv_array).
+
+    Returns
+    -------
+    DataFrame
+        A DataFrame with columns "Cashflow", "Timing" and "Present_Value" (one row per fund and cashflow item).
+        A "Policy_ID" column (0-based position of the model point) is added in front when more than one policy is
+        projected.
+    """
+
+    import pandas as pd
+
+    pv_cols = [
+        col
+        for group in ["unit_if", "risk_if", "shf_if"]
+        for col in COLUMN_GROUPS[group]
+        if col in CF_TIMING
+    ]
+    pv_array = generate_pv_array(result, pv_cols, n_periods)
+    names = [f"PV_{col}" for col in pv_cols]
+    timings = [CF_TIMING[col] for col in pv_cols]
+
+    pv_df = pd.DataFrame(
+        {
+            "Cashflow": np.tile(names, result.n_policies),
+            "Timing": np.tile(timings, result.n_policies),
+            "Present_Value": pv_array.ravel(),
+        }
+    )
+    if result.n_policies > 1:
+        pv_df.insert(
+            0, "Policy_ID", np.repeat(np.arange(result.n_policies), len(names))
+        )
+
+    return pv_df
+
+
+# =====================
+# PROFIT SIGNATURE
+# =====================
+# - metrics of the shareholder profit stream (Profit_IF) of each policy, in a table of their own on request (they are
+#   rates and years, not present values).
+
+# Profit metrics, in the order of the columns of the profit metrics table
+PROFIT_METRICS = ["IRR_Profit_IF", "Break_Even_Year", "NBV_Margin"]
+
+# Annual IRRs searched (bracket of the root finding), and tolerance on log(1 + IRR)
+IRR_BRACKET = (-0.9, 10.0)
+IRR_TOLERANCE = 1e-12
+IRR_MAX_ITERATIONS = 100
+
+
+def solve_irr(cashflows, times, bracket=IRR_BRACKET, tolerance=IRR_TOLERANCE):
+    """
+    Find the internal rate of return of many cashflow streams at once, with a safeguarded Newton method: each Newton
+    step is kept inside a bracket of the root of each stream, and replaced by a bisection step when it leaves it.
+
+    Parameters
+    ----------
+    cashflows : ndarray
+        The (streams x periods) cashflows.
+
+    times : ndarray
+        The time (in years) of each period.
+
+    bracket : tuple
+        The lowest and highest annual rates searched.
+
+    tolerance : float
+        The convergence tolerance on log(1 + IRR).
+
+    Returns
+    -------
+    ndarray
+        The annual IRR of each stream, NaN when its net present value does not change sign over the bracket (e.g. a
+        profit stream without negative cashflow).
+
+    Notes
+    -----
+    The root is searched in x = log(1 + IRR), so that the discount factor of time t is exp(-x * t):
+
+    NPV (x) = Sum of Cashflow (t) * exp(-x * t)
+    NPV' (x) = - Sum of t * Cashflow (t) * exp(-x * t)
+
+    Only the streams not yet converged are evaluated at each iteration. A stream with several sign changes can have
+    several IRRs; the one found is inside the bracket.
+    """
+
+    cashflows = np.asarray(cashflows, dtype=np.float64)
+    n_streams = cashflows.shape[0]
+
+    def npv(rows, x):
+        values = cashflows[rows] * np.exp(-x[:, np.newaxis] * times)
+        return values.sum(axis=1), -(values * times).sum(axis=1)
+
+    low = np.full(n_streams, np.log1p(bracket[0]))
+    high = np.full(n_streams, np.log1p(bracket[1]))
+    all_rows = np.arange(n_streams)
+    npv_low = npv(all_rows, low)[0]
+    npv_high = npv(all_rows, high)[0]
+    sign_low = np.sign(npv_low)
+
+    x = np.full(n_streams, np.nan)
+    active = np.flatnonzero(sign_low * np.sign(npv_high) < 0)
+    x[active] = 0.5 * (low[active] + high[active])
+
+    for _ in range(IRR_MAX_ITERATIONS):
+        if active.size == 0:
+            break
+        x_active = x[active]
+        value, derivative = npv(active, x_active)
+
+        # narrow the bracket to the side of the root
+        below = np.sign(value) == sign_low[active]
+        low[active] = np.where(below, x_active, low[active])
+        high[active] = np.where(below, high[active], x_active)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = x_active - value / derivative
+        inside = (newton > low[active]) & (newton < high[active])
+        x_next = np.where(inside, newton, 0.5 * (low[active] + high[active]))
+        x_next = np.where(value == 0, x_active, x_next)
+        x[active] = x_next
+
+        converged = (np.abs(x_next - x_active) <= tolerance) | (value == 0)
+        active = active[~converged]
+
+    return np.expm1(x)
+
+
+def generate_profit_metrics(result, pv_profit, pv_contribution):
+    """
+    Calculate the profit metrics of every policy: IRR of the profit stream, discounted break-even year and NBV margin.
+
+    Parameters
+    ----------
+    result : ProjectionResult or RaggedResult
+        The projection result (a ragged result is converted to the padded layout for the Profit_IF column).
+
+    pv_profit : ndarray
+        The PV of Profit_IF of each policy (see generate_pv_array).
+
+    pv_contribution : ndarray
+        The PV of Contribution_IF of each policy.
+
+    Returns
+    -------
+    ndarray
+        A (policies x PROFIT_METRICS) array.
+
+    Notes
+    -----
+    IRR_Profit_IF   : annual rate at which the PV of Profit_IF is nil (see solve_irr).
+    Break_Even_Year : policy year (since the start of the projection, 1 for the first year) in which the cumulative
+                      discounted Profit_IF turns positive or nil for good: 0 if it is never negative (profitable from
+                      the first period, no break-even), NaN if it ends negative.
+    NBV_Margin      : PV of Profit_IF / PV of Contribution_IF, NaN without contribution.
+    """
+
+    timing = CF_TIMING["Profit_IF"]
+    disc_col = f"disc_factor_{timing.lower()}"
+    if isinstance(result, RaggedResult):
+        result = result.to_padded(["Profit_IF", disc_col])
+
+    profit = result["Profit_IF"].astype(np.float64)
+    steps_per_year = result.steps_per_year
+    metrics = np.full((result.n_policies, len(PROFIT_METRICS)), np.nan)
+
+    # IRR: cashflows at the end (or start) of each period
+    times = np.arange(result.n_months) + (1 if timing == "EOP" else 0)
+    metrics[:, 0] = solve_irr(profit, times / steps_per_year)
+
+    # Break-even: the period following the last negative cumulative discounted profit (year 0 if never negative)
+    negative = np.cumsum(profit * result[disc_col], axis=1) < 0
+    last_negative = result.n_months - 1 - np.argmax(negative[:, ::-1], axis=1)
+    break_even_year = (last_negative + 1) // steps_per_year + 1
+    metrics[:, 1] = np.where(
+        negative[:, -1], np.nan, np.where(negative.any(axis=1), break_even_year, 0)
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics[:, 2] = np.where(
+            pv_contribution != 0, pv_profit / pv_contribution, np.nan
+        )
+
+    return metrics
+
+
+def generate_profit_table(result, pv_results):
+    """
+    Generate the profit metrics table: the profit metrics of each policy (see generate_profit_metrics).
+
+    Parameters
+    ----------
+    result : ProjectionResult or RaggedResult
+        The projection result.
+
+    pv_results : DataFrame
+        The PV results table of the projection (see generate_pv_table).
+
+    Returns
+    -------
+    DataFrame
+        A DataFrame with columns "Policy_ID" (0-based position of the model point) and PROFIT_METRICS (one row per
+        policy).
+    """
+
+    import pandas as pd
+
+    pv = {
+        cashflow: pv_results.loc[
+            pv_results["Cashflow"] == f"PV_{cashflow}", "Present_Value"
+        ].to_numpy()
+        for cashflow in ["Profit_IF", "Contribution_IF"]
+    }
+    profit_df = pd.DataFrame(
+        generate_profit_metrics(result, pv["Profit_IF"], pv["Contribution_IF"]),
+        columns=PROFIT_METRICS,
+    )
+    profit_df.insert(0, "Policy_ID", np.arange(result.n_policies))
+
+    return profit_df
+
+
+# =====================
+# FULL PROJECTION RUN
+# =====================
+# - per-policy inputs use the same keys as the pricing model data dictionary from `data_read.read_pricing_model_data`.
+
+MODEL_POINT_KEYS = ["Age", "Gender", "Pol_Year", "SumAssured", "Contribution_perYear"]
+
+# Layouts of the projection result from the inforce stage: "padded" (policies x months) or "ragged" (periods in cover)
+RESULT_LAYOUTS = ["padded", "ragged"]
+
+# Columns kept in the ragged layout: time index, discount factors, policy counts, per policy and inforce cashflows
+RAGGED_COLUMNS = list(
+    dict.fromkeys(
+        ["T_Index", "disc_factor_bop", "disc_factor_eop"]
+        + COLUMN_GROUPS["decrement"][4:]
+        + [
+            col
+            for group in [
+                "unit_pp",
+                "risk_pp",
+                "shf_pp",
+                "unit_if",
+                "risk_if",
+                "shf_if",
+            ]
+            for col in COLUMN_GROUPS[group]
+        ]
+    )
+)
+
+
+def run_projection(
+    pricing_model_data,
+    log_list,
+    model_points=None,
+    n_months=1200,
+    precision="double",
+    time_step="monthly",
+    columns=None,
+    metrics=None,
+    dynamic_lapse=None,
+    inforce_threshold=None,
+    horizon=None,
+    layout="padded",
+):
+    """
+    Run all the projection stages for a batch of model points.
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        A dictionary containing the data extracted from the pricing model (parameters and assumption tables).
+
+    log_list : list
+        The list that stores all log entries.
+
+    model_points : dict
+        Optional dictionary of per-policy arrays with keys "Age", "Gender", "Pol_Year", "SumAssured" and
+        "Contribution_perYear", and optionally "Elapsed_Months" and "Unit_Fund_Value" for in-force policies (see
+        generate_reference_columns and generate_unit_fund_columns). By default the single model point of the pricing
+        model is projected.
+
+    n_months : int
+        The number of projection months.
+
+    precision : str
+        The precision mode: "double" (default) or "single".
+
+    time_step : str
+        The projection time step: "monthly" (default) or "annual".
+
+    columns : List
+        Optional list of the columns required in the output (see create_projection_result). The columns needed for the
+        PV results are always projected.
+
+    metrics : dict
+        Optional run metrics dictionary (see `run_metrics.start_run_metrics`). When given, the wall time, CPU time and
+        peak memory of each stage are measured and logged.
+
+    dynamic_lapse : dict
+        Optional dynamic lapse settings (see `data_read.get_dynamic_lapse_settings`). By default the lapse rates are
+        the table lapse rates.
+
+    inforce_threshold : float
+        Optional threshold of the expected number of policies in force (see get_active_periods). The risk fund of a
+        policy is no longer projected once its policy count is not above the threshold, and its policy counts (so its
+        inforce cashflows) are nil from then on. By default the policies are projected until the end of their
+        cover.
+
+    horizon : int
+        Optional number of months projected, when the inforce cashflows are nil after it (e.g. the longest cover of
+        the model points). The result only holds these months, and the PV results are the same as for a projection
+        over n_months.
+
+    layout : str
+        The layout of the result for the inforce and PV stages: "padded" (default) or "ragged". The ragged result only
+        holds the periods in cover of each policy (its later inforce cashflows are nil) and the columns of
+        RAGGED_COLUMNS.
+
+    Returns
+    -------
+    ProjectionResult or RaggedResult, DataFrame, list
+        The projection result, the PV results table and the updated log list.
+    """
+
+    if layout not in RESULT_LAYOUTS:
+        raise ValueError(
+            f"Unsupported result layout: {layout}. Use one of {RESULT_LAYOUTS}."
+        )
+
+    if model_points is None:
+        model_points = {key: pricing_model_data[key] for key in MODEL_POINT_KEYS}
+    n_policies = np.asarray(model_points["Age"]).size
+
+    result = create_projection_result(
+        n_policies, min(n_months, horizon or n_months), precision, time_step, columns
+    )
+
+    # Stage instrumentation (no-op when metrics is None)
+    def stage(name):
+        return rm.measure_stage(
+            name, metrics, log_list, n_policies, n_policies * result.n_months
+        )
+
+    # Initiate main columns
+    with stage("generate_reference_columns"):
+        generate_reference_columns(
+            result,
+            model_points["Age"],
+            model_points["Pol_Year"],
+            model_points.get("Elapsed_Months", 0),
+        )
+
+    # Project risk-free return and discount factor
+    with stage("generate_rfr_columns"):
+        generate_rfr_columns(result, pricing_model_data["Table_RiskFreeRate"])
+    with stage("generate_discount_factor_columns"):
+        generate_discount_factor_columns(result)
+
+    # Project policy decrements
+    with stage("generate_mortality_rate_columns"):
+        generate_mortality_rate_columns(
+            result, model_points["Gender"], pricing_model_data["Table_Mortality"]
+        )
+    with stage("generate_lapse_rate_columns"):
+        generate_lapse_rate_columns(
+            result, pricing_model_data["Table_Lapse"], model_points["Pol_Year"]
+        )
+
+    # Project per policy cashflows
+    with stage("generate_unit_fund_columns"):
+        generate_unit_fund_columns(
+            result,
+            model_points["Contribution_perYear"],
+            pricing_model_data["Table_WakalahFee"],
+            model_points["SumAssured"],
+            pricing_model_data["COI_Loading"],
+            pricing_model_data["Wakalah_FMC"],
+            model_points.get("Unit_Fund_Value", 0.0),
+        )
+
+    # Policy counts after the unit fund, as the dynamic lapse rates depend on it
+    if dynamic_lapse is not None:
+        with stage("generate_dynamic_lapse_columns"):
+            generate_dynamic_lapse_columns(result, dynamic_lapse)
+    with stage("generate_policy_count_columns"):
+        generate_policy_count_columns(result)
+
+    # Policies no longer in force: their tail is nil and is not projected
+    n_active = None
+    if inforce_threshold is not None:
+        n_active = get_active_periods(result, inforce_threshold)
+        if inforce_threshold > 0:
+            ended = np.arange(result.n_months) >= n_active[:, None]
+            for col in ["No_Pol_Start", "No_Death", "No_Lapse", "No_Pol_End"]:
+                result[col][ended] = 0
+
+    with stage("generate_risk_fund_columns"):
+        generate_risk_fund_columns(
+            result,
+            model_points["SumAssured"],
+            pricing_model_data["SurplusShare_toSHF"],
+            pricing_model_data["SurplusShare_toParticipant"],
+            n_active,
+        )
+    with stage("generate_shf_columns"):
+        generate_shf_columns(
+            result,
+            pricing_model_data["Expense_perContribution_perYear"],
+            pricing_model_data["Expense_perFund_perYear"],
+        )
+
+    # Ragged layout: the periods after the cover of each policy are dropped
+    if layout == "ragged":
+        with stage("convert_to_ragged"):
+            result = RaggedResult.from_padded(
+                result,
+                get_active_periods(result),
+                [col for col in RAGGED_COLUMNS if col in result],
+                empty_columns=[col for col in result.columns if col.endswith("_IF")],
+            )
+
+    # Project inforce cashflows
+    with stage("generate_inforce_columns"):
+        log_list = generate_inforce_columns(result, log_list)
+
+    # Calculate PV of cashflow
+    with stage("generate_pv_table"):
+        pv_results = generate_pv_table(result, n_months * result.steps_per_year // 12)
+
+    return result, pv_results, log_list
+
+
+def report_pv_deviation(
+    pv_results,
+    pricing_model_data,
+    log_list,
+    model_points=None,
+    n_months=1200,
+    dynamic_lapse=None,
+):
+    """
+    Compare the PV results of a fast run (single precision and/or annual time step) against the reference engine
+    (float64, monthly time step) on the same inputs.
+
+    Parameters
+    ----------
+    pv_results : DataFrame
+        The PV results of the fast run.
+
+    pricing_model_data : dict
+        A dictionary containing the data extracted from the pricing model.
+
+    log_list : list
+        The list that stores all log entries.
+
+    model_points : dict
+        Optional dictionary of per-policy arrays (see run_projection).
+
+    n_months : int
+        The projection horizon in months.
+
+    dynamic_lapse : dict
+        Optional dynamic lapse settings of the fast run (see run_projection).
+
+    Returns
+    -------
+    dict, list
+        The deviation summary (max absolute and relative PV deviation and the PV item where it occurs) and the
+        updated log list.
+    """
+
+    _, pv_ref, _ = run_projection(
+        pricing_model_data,
+        [],
+        model_points,
+        n_months,
+        columns=[],
+        dynamic_lapse=dynamic_lapse,
+    )
+
+    pv_test = pv_results["Present_Value"].to_numpy(dtype=np.float64)
+    pv_ref_values = pv_ref["Present_Value"].to_numpy()
+    abs_dev = np.abs(pv_test - pv_ref_values)
+    rel_dev = abs_dev / np.maximum(np.abs(pv_ref_values), 1e-12)
+    worst = int(np.argmax(abs_dev))
+
+    deviation = {
+        "max_abs_deviation": float(abs_dev.max()),
+        "max_rel_deviation": float(rel_dev.max()),
+        "cashflow": str(pv_ref["Cashflow"].iloc[worst]),
+        "pv_profit_deviation": float(
+            abs_dev[(pv_ref["Cashflow"] == "PV_Profit_IF").to_numpy()].max()
+        ),
+    }
+    log_list = read.log_message(
+        f"PV check against the float64 monthly engine: max PV deviation = {deviation['max_abs_deviation']:.6g} "
+        f"(relative {deviation['max_rel_deviation']:.3g}) on {deviation['cashflow']}; "
+        f"PV_Profit_IF deviation = {deviation['pv_profit_deviation']:.6g}.",
+        log_list,
+    )
+
+    return deviation, log_list
+
+
+# =====================
+# MODEL POINT BATCHES
+# =====================
+# - seriatim runs: the model points of a model point file are projected in batches, and only the cashflows summed over
+#   the policies and the PV results of each policy are kept, so the memory does not grow with the number of policies.
+
+DEFAULT_BATCH_SIZE = 10 * red.REDUCTION_BLOCK_SIZE
+
+
+def get_batch_size(user_input, log_list):
+    """
+    Get the number of model points projected per batch ("modelPointBatchSize" in the user input), rounded up to whole
+    reduction blocks so that the aggregates do not depend on the batch size (see `reduction.get_block_aligned_size`).
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    int, list
+        The batch size and the updated log list.
+    """
+
+    requested = int(user_input.get("modelPointBatchSize", 0) or DEFAULT_BATCH_SIZE)
+    batch_size = red.get_block_aligned_size(requested)
+    if batch_size != requested:
+        log_list = read.log_message(
+            f"WARNING! The batch size of {requested:,} policies is rounded up to {batch_size:,} (a multiple of "
+            f"{red.REDUCTION_BLOCK_SIZE:,} policies, the reduction block size).",
+            log_list,
+        )
+
+    return batch_size, log_list
+
+
+# Columns summed over the policies: expected policy counts and inforce cashflows (T_Index is kept as the time index)
+AGGREGATE_COLUMNS = [
+    "T_Index",
+    "No_Pol_Start",
+    "No_Death",
+    "No_Lapse",
+    "No_Pol_End",
+] + list(
+    dict.fromkeys(
+        col
+        for group in ["unit_if", "risk_if", "shf_if"]
+        for col in COLUMN_GROUPS[group]
+    )
+)
+
+
+def get_aggregate_columns(columns=None):
+    """
+    Get the columns of the aggregated output of a batched run.
+
+    Parameters
+    ----------
+    columns : List
+        Optional list of the columns required in the output. By default all the aggregate columns are returned.
+
+    Returns
+    -------
+    List
+        T_Index and the selected aggregate columns, in projection order.
+    """
+
+    if columns is None:
+        return list(AGGREGATE_COLUMNS)
+
+    return ["T_Index"] + [col for col in AGGREGATE_COLUMNS[1:] if col in columns]
+
+
+def create_aggregate_result(columns, n_months=1200, time_step="monthly"):
+    """
+    Create the empty (zero) aggregated projection of a batched run, with its time index.
+
+    Parameters
+    ----------
+    columns : List
+        The aggregate columns (see get_aggregate_columns).
+
+    n_months : int
+        The number of projection months.
+
+    time_step : str
+        The projection time step: "monthly" or "annual".
+
+    Returns
+    -------
+    ProjectionResult
+        A float64 result with a single row per time step (n_policies = 1).
+    """
+
+    aggregate = ProjectionResult(
+        columns,
+        n_policies=1,
+        n_months=n_months * TIME_STEPS[time_step] // 12,
+        int_columns=["T_Index"],
+        steps_per_year=TIME_STEPS[time_step],
+    )
+    aggregate["T_Index"] = np.arange(1, aggregate.n_months + 1)
+
+    return aggregate
+
+
+def run_model_point_batches(
+    pricing_model_data,
+    log_list,
+    model_points,
+    batch_size=DEFAULT_BATCH_SIZE,
+    n_months=1200,
+    precision="double",
+    time_step="monthly",
+    columns=None,
+    progress=None,
+    cancel=None,
+    checkpoint=None,
+    first_policy=0,
+    reduction=None,
+    dynamic_lapse=None,
+    inforce_threshold=0.0,
+    layout="padded",
+    write_policies=None,
+    write_padded=None,
+    profit_metrics=False,
+    heartbeat=None,
+):
+    """
+    Project the model points in batches and aggregate the cashflows over the policies.
+
+    The aggregates are summed over fixed blocks of model points and a fixed tree of blocks (see `reduction.py`), so they
+    are bit-identical whatever the batch size and however the model point file is split between runs (e.g. shards).
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        A dictionary containing the data extracted from the pricing model (parameters and assumption tables).
+
+    log_list : list
+        The list that stores all log entries.
+
+    model_points : dict
+        Dictionary of per-policy arrays (see run_projection).
+
+    batch_size : int
+        The number of model points projected at once (a multiple of `reduction.REDUCTION_BLOCK_SIZE`, see
+        `reduction.get_block_aligned_size`).
+
+    n_months, precision, time_step : int, str, str
+        See run_projection.
+
+    columns : List
+        Optional list of the columns required in the aggregated output (see get_aggregate_columns).
+
+    progress : ProgressReporter
+        Optional progress reporter, updated after each batch (see `progress.py`).
+
+    cancel : CancelToken
+        Optional cancellation signal, checked before each batch (see `progress.py`).
+
+    checkpoint : RunCheckpoint
+        Optional checkpoint of the run (see `checkpoint.py`). The completed batches are read back from it instead of
+        being projected again, and each new batch is written to it.
+
+    first_policy : int
+        The row of the first model point in the model point file, when the model points are a part of the file (e.g. a
+        shard). It must be a multiple of `reduction.REDUCTION_BLOCK_SIZE`.
+
+    reduction : BlockReduction
+        Optional reduction of the aggregates (see `reduction.py`), which the batches are added to. It holds the tree
+        nodes of the model points projected, to be merged with the other parts of the model point file.
+
+    dynamic_lapse : dict
+        Optional dynamic lapse settings (see run_projection).
+
+    inforce_threshold : float
+        The threshold of the expected number of policies in force under which a policy is no longer projected (see
+        run_projection). Only the inforce cashflows are kept, so by default the policies are dropped as soon as they
+        have no policy in force (e.g. after the 100% lapse of their final year or a fund exhaustion lapse).
+
+    layout : str
+        The layout of the batch results for the inforce and PV stages: "padded" (default) or "ragged" (see
+        run_projection). The aggregates are the same in both layouts.
+
+    write_policies : callable
+        Optional function called with the ragged result of the aggregate columns of each projected batch and the row
+        of its first model point, e.g. to keep the per-policy results (see `array_store.write_ragged_policies`).
+
+    write_padded : callable
+        Optional function called with the padded result of each projected batch (padded layout only) and the row of
+        its first model point, e.g. to write a dense array store (see `array_store.write_padded_policies`).
+
+    profit_metrics : bool
+        Whether the profit metrics of each policy are calculated (see generate_profit_table).
+
+    heartbeat : callable
+        Optional function called without arguments after each batch, e.g. to refresh the lock of a shard (see
+        `shards.refresh_lock`).
+
+    Returns
+    -------
+    ProjectionResult, DataFrame, DataFrame, bool, list
+        The aggregated projection (one row per time step, summed in float64 over the policies), the PV results of each
+        policy (with its "Policy_ID", the 0-based row of the model point in the file), the profit metrics of each
+        policy (None if profit_metrics is False), whether the run was cancelled and the updated log list. A cancelled
+        run returns the batches completed before the cancellation.
+    """
+
+    import pandas as pd
+
+    if batch_size % red.REDUCTION_BLOCK_SIZE:
+        raise ValueError(
+            f"The batch size ({batch_size:,}) must be a multiple of the reduction block size "
+            f"({red.REDUCTION_BLOCK_SIZE:,})."
+        )
+
+    n_policies = np.asarray(model_points["Age"]).size
+    n_batches = -(-n_policies // batch_size)
+    agg_columns = get_aggregate_columns(columns)
+
+    aggregate = create_aggregate_result(agg_columns, n_months, time_step)
+    if reduction is None:
+        reduction = red.BlockReduction()
+
+    pv_tables = []
+    profit_tables = []
+    cancelled = False
+    for batch, start in enumerate(range(0, n_policies, batch_size), start=1):
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+            log_list = read.log_message(
+                f"Run cancelled after {batch - 1}/{n_batches} batches ({start:,}/{n_policies:,} policies). "
+                f"The output only contains the completed batches.",
+                log_list,
+            )
+            break
+
+        stop = min(start + batch_size, n_policies)
+        completed = checkpoint.load(batch) if checkpoint is not None else None
+        if completed is not None:
+            batch_nodes, pv_batch, profit_batch = completed
+        else:
+            batch_points = {
+                key: np.asarray(values)[start:stop]
+                for key, values in model_points.items()
+            }
+            # The batch is only projected up to its longest remaining cover, the inforce cashflows are nil afterwards
+            remaining_months = np.asarray(batch_points["Pol_Year"]) * 12 - (
+                batch_points.get("Elapsed_Months", 0)
+            )
+            result, pv_batch, log_list = run_projection(
+                pricing_model_data,
+                log_list,
+                batch_points,
+                n_months,
+                precision,
+                time_step,
+                columns=agg_columns,
+                dynamic_lapse=dynamic_lapse,
+                inforce_threshold=inforce_threshold,
+                horizon=max(int(np.max(remaining_months)), 12),
+                layout=layout,
+            )
+            profit_batch = (
+                generate_profit_table(result, pv_batch) if profit_metrics else None
+            )
+            batch_reduction = red.BlockReduction()
+            if layout == "ragged":
+                batch_reduction.add_ragged_policies(
+                    result, agg_columns[1:], first_policy + start, aggregate.n_months
+                )
+            else:
+                batch_reduction.add_policies(
+                    {col: result[col] for col in agg_columns[1:]},
+                    first_policy + start,
+                    aggregate.n_months,
+                )
+            batch_nodes = batch_reduction.nodes
+
+            if write_padded is not None:
+                write_padded(result, first_policy + start)
+
+            if write_policies is not None:
+                if layout != "ragged":
+                    result = RaggedResult.from_padded(
+                        result, get_active_periods(result), agg_columns[1:]
+                    )
+                write_policies(result, first_policy + start)
+
+            if "Policy_ID" not in pv_batch:
+                pv_batch.insert(0, "Policy_ID", 0)
+            pv_batch["Policy_ID"] += first_policy + start
+            if profit_batch is not None:
+                profit_batch["Policy_ID"] += first_policy + start
+            if checkpoint is not None:
+                checkpoint.save(batch, batch_nodes, pv_batch, profit_batch)
+
+        # The batch tree nodes are merged in batch order, whether they are projected or read from the checkpoint
+        reduction.merge(batch_nodes)
+        pv_tables.append(pv_batch)
+        if profit_batch is not None:
+            profit_tables.append(profit_batch)
+
+        if progress is not None:
+            log_list = progress.update(batch, stop, log_list)
+        if heartbeat is not None:
+            heartbeat()
+
+    totals = reduction.total()
+    if totals is not None:
+        for col in agg_columns[1:]:
+            aggregate[col] = totals[col]
+
+    if pv_tables:
+        pv_results = pd.concat(pv_tables, ignore_index=True)
+    else:
+        pv_results = pd.DataFrame(
+            columns=["Policy_ID", "Cashflow", "Timing", "Present_Value"]
+        )
+
+    profit_results = None
+    if profit_metrics:
+        if profit_tables:
+            profit_results = pd.concat(profit_tables, ignore_index=True)
+        else:
+            profit_results = pd.DataFrame(columns=["Policy_ID"] + PROFIT_METRICS)
+
+    return aggregate, pv_results, profit_results, cancelled, log_list
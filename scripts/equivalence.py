@@ -0,0 +1,566 @@
+"""
+equivalence.py
+
+This module contains the numerical equivalence gate of the optimized engines. The loop-based functions of `projection.py`
+(the original model) are kept as the reference (oracle): `run_reference_projection` runs them for one model point in the
+same order as the original `main.py`.
+
+The checker runs a faster engine (`engine.py`, in any precision mode) on the same inputs and reports, for every
+projection column and every PV line, the maximum absolute and relative difference against the reference. A column
+or PV line passes when every value is within the tolerances, with the same rule as `numpy.isclose`:
+
+    |value - reference| <= atol + rtol * |reference|
+
+The reference model is monthly, so annual time step runs are not checked: their PVs differ by design, and are reported
+against the monthly engine instead (see `engine.report_pv_deviation`).
+
+The check is used by `main.py` ("equivalenceCheck"), by the benchmark and by the batch tools. A stored output file of the
+original model (e.g. `pricing_model_py_output.xlsx`) can also be used as the reference.
+"""
+
+import numpy as np
+import data_read as read
+import engine as eng
+
+# Default tolerances (atol, rtol) by precision mode
+DEFAULT_TOLERANCES = {"double": (1e-6, 1e-9), "single": (1e-2, 1e-4)}
+
+# Projection horizon of the loop-based model (see `projection.generate_t_index_table`)
+REFERENCE_MONTHS = 1200
+
+# Layout of the comparison tables
+COLUMN_CHECK_COLUMNS = ["Column", "Max_Abs_Diff", "Max_Rel_Diff", "Passed"]
+PV_CHECK_COLUMNS = [
+    "Line",
+    "Cashflow",
+    "Timing",
+    "Max_Abs_Diff",
+    "Max_Rel_Diff",
+    "Passed",
+]
+
+
+def get_tolerances(user_input, precision="double"):
+    """
+    Get the tolerances of the equivalence check from the user input ("equivalenceAtol" and "equivalenceRtol").
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    precision : str
+        The precision mode of the run, used for the default tolerances.
+
+    Returns
+    -------
+    float, float
+        The absolute and relative tolerances.
+    """
+
+    atol, rtol = DEFAULT_TOLERANCES[precision]
+    if user_input.get("equivalenceAtol", "") not in ["", None]:
+        atol = float(user_input["equivalenceAtol"])
+    if user_input.get("equivalenceRtol", "") not in ["", None]:
+        rtol = float(user_input["equivalenceRtol"])
+
+    return atol, rtol
+
+
+def run_reference_projection(pricing_model_data, log_list, model_point=None):
+    """
+    Run the loop-based projection of `projection.py` (reference model) for one model point.
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        A dictionary containing the data extracted from the pricing model.
+
+    log_list : list
+        The list that stores all log entries.
+
+    model_point : dict
+        Optional model point with keys "Age", "Gender", "Pol_Year", "SumAssured" and "Contribution_perYear".
+        By default the model point of the pricing model is projected.
+
+    Returns
+    -------
+    DataFrame, DataFrame, list
+        The cashflow projection table (each column once), the PV results table and the updated log list.
+    """
+
+    import pandas as pd
+    import projection as prj
+
+    if model_point is None:
+        model_point = pricing_model_data
+    AGE = model_point["Age"]
+    GENDER = model_point["Gender"]
+    POL_YEAR = model_point["Pol_Year"]
+    SUM_ASSD = model_point["SumAssured"]
+    CONT_Y = model_point["Contribution_perYear"]
+
+    # Initiate main columns
+    t_index_col = prj.generate_t_index_table()
+    is_cover_col = prj.generate_is_cover_table(t_index_col, POL_YEAR)
+    pol_month_col = prj.generate_pol_month_table(t_index_col, is_cover_col)
+    pol_year_col = prj.generate_pol_year_table(pol_month_col, is_cover_col)
+    age_col = prj.generate_age_table(pol_year_col, is_cover_col, AGE)
+
+    # Project risk-free return and discount factor
+    rfr_proj_tab = prj.generate_rfr_table(
+        pol_year_col, pricing_model_data["Table_RiskFreeRate"], is_cover_col
+    )
+    disc_fact_tab = prj.generate_discount_factor_table(rfr_proj_tab)
+
+    # Project policy decrements
+    mort_tab = prj.generate_mortality_rate_table(
+        age_col, GENDER, pricing_model_data["Table_Mortality"], is_cover_col
+    )
+    lapse_tab = prj.generate_lapse_rate(
+        pol_year_col, pricing_model_data["Table_Lapse"], POL_YEAR
+    )
+    pol_count_proj = prj.generate_policy_count_table(pol_month_col, mort_tab, lapse_tab)
+
+    # Project per policy cashflows
+    unit_cf_pp_proj = prj.generate_unit_fund_cashflow_table(
+        CONT_Y,
+        is_cover_col,
+        pol_year_col,
+        pricing_model_data["Table_WakalahFee"],
+        SUM_ASSD,
+        mort_tab,
+        pricing_model_data["COI_Loading"],
+        rfr_proj_tab,
+        pricing_model_data["Wakalah_FMC"],
+    )
+    risk_cf_pp_proj = prj.generate_risk_fund_cashflows_table(
+        unit_cf_pp_proj,
+        mort_tab,
+        rfr_proj_tab,
+        SUM_ASSD,
+        pricing_model_data["SurplusShare_toSHF"],
+        pricing_model_data["SurplusShare_toParticipant"],
+    )
+    shf_cf_pp_proj = prj.generate_shf_cashflows(
+        unit_cf_pp_proj,
+        rfr_proj_tab,
+        risk_cf_pp_proj,
+        pricing_model_data["Expense_perContribution_perYear"],
+        pricing_model_data["Expense_perFund_perYear"],
+    )
+
+    # Project inforce cashflows
+    unit_cf_if_proj, log_list = prj.generate_cashflow_if_df(
+        unit_cf_pp_proj, pol_count_proj, log_list, is_unit_fund=True
+    )
+    risk_cf_if_proj, log_list = prj.generate_cashflow_if_df(
+        risk_cf_pp_proj, pol_count_proj, log_list
+    )
+    shf_cf_if_proj, log_list = prj.generate_cashflow_if_df(
+        shf_cf_pp_proj, pol_count_proj, log_list
+    )
+
+    # Calculate PV of cashflow
+    pv_results = pd.concat(
+        [
+            prj.generate_pv_cashflows_df(unit_cf_if_proj, disc_fact_tab),
+            prj.generate_pv_cashflows_df(risk_cf_if_proj, disc_fact_tab),
+            prj.generate_pv_cashflows_df(shf_cf_if_proj, disc_fact_tab),
+        ],
+        ignore_index=True,
+    )
+
+    cf_proj_table = prj.append_dataframes(
+        [
+            t_index_col,
+            is_cover_col,
+            pol_month_col,
+            pol_year_col,
+            age_col,
+            rfr_proj_tab,
+            disc_fact_tab,
+            mort_tab,
+            lapse_tab,
+            pol_count_proj,
+            unit_cf_pp_proj,
+            risk_cf_pp_proj,
+            shf_cf_pp_proj,
+            unit_cf_if_proj,
+            risk_cf_if_proj,
+            shf_cf_if_proj,
+        ]
+    )
+    cf_proj_table = cf_proj_table.loc[:, ~cf_proj_table.columns.duplicated()]
+
+    return cf_proj_table, pv_results, log_list
+
+
+def reference_to_result(cf_proj_table):
+    """
+    Copy a reference cashflow projection table into a ProjectionResult, so that it can be exported like the output of
+    the vectorized engine.
+
+    Parameters
+    ----------
+    cf_proj_table : DataFrame
+        The cashflow projection table of run_reference_projection.
+
+    Returns
+    -------
+    ProjectionResult
+        A single policy projection result.
+    """
+
+    result = eng.create_projection_result(1, len(cf_proj_table))
+    for col in result.columns:
+        result[col] = cf_proj_table[col].to_numpy(dtype=np.float64)
+
+    return result
+
+
+def _model_point(model_points, policy_id):
+    """
+    Get the model point of one policy from a dictionary of per-policy arrays (or scalars).
+    """
+
+    model_point = {}
+    for key in eng.MODEL_POINT_KEYS:
+        values = np.asarray(model_points[key]).reshape(-1)
+        model_point[key] = values[policy_id] if values.size > 1 else values[0]
+
+    return model_point
+
+
+def _max_differences(values, reference, atol, rtol):
+    """
+    Get the maximum absolute difference, the maximum relative difference (where |reference| > atol) and whether every
+    value is within the tolerances.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    abs_diff = np.abs(values - reference)
+    significant = np.abs(reference) > atol
+    rel_diff = abs_diff[significant] / np.abs(reference[significant])
+
+    return (
+        float(abs_diff.max(initial=0.0)),
+        float(rel_diff.max(initial=0.0)),
+        bool(np.all(abs_diff <= atol + rtol * np.abs(reference))),
+    )
+
+
+def compare_columns(result, reference_tables, policy_ids, atol, rtol):
+    """
+    Compare the projection columns of a result against reference tables.
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The projection result to be checked (monthly time step).
+
+    reference_tables : List
+        The reference cashflow projection table (DataFrame) of each checked policy.
+
+    policy_ids : List
+        The position of each checked policy in the result.
+
+    atol : float
+        The absolute tolerance.
+
+    rtol : float
+        The relative tolerance.
+
+    Returns
+    -------
+    DataFrame
+        One row per column with "Column", "Max_Abs_Diff", "Max_Rel_Diff" and "Passed".
+    """
+
+    import pandas as pd
+
+    rows = []
+    for col in result.columns:
+        if col not in reference_tables[0].columns:
+            continue
+        n_months = min(result.n_months, len(reference_tables[0]))
+        values = np.stack([result[col][i, :n_months] for i in policy_ids])
+        reference = np.stack(
+            [table[col].to_numpy()[:n_months] for table in reference_tables]
+        )
+        rows.append((col, *_max_differences(values, reference, atol, rtol)))
+
+    return pd.DataFrame(rows, columns=COLUMN_CHECK_COLUMNS)
+
+
+def compare_pv(pv_results, reference_pvs, policy_ids, atol, rtol):
+    """
+    Compare the PV results against reference PV results, line by line.
+
+    Parameters
+    ----------
+    pv_results : DataFrame
+        The PV results to be checked (with a "Policy_ID" column when more than one policy was projected).
+
+    reference_pvs : List
+        The reference PV results (DataFrame) of each checked policy.
+
+    policy_ids : List
+        The position of each checked policy in the result.
+
+    atol : float
+        The absolute tolerance.
+
+    rtol : float
+        The relative tolerance.
+
+    Returns
+    -------
+    DataFrame
+        One row per PV line with "Line", "Cashflow", "Timing", "Max_Abs_Diff", "Max_Rel_Diff" and "Passed".
+    """
+
+    import pandas as pd
+
+    n_lines = len(reference_pvs[0])
+    if "Policy_ID" in pv_results.columns:
+        values = np.stack(
+            [
+                pv_results.loc[pv_results["Policy_ID"] == i, "Present_Value"].to_numpy()
+                for i in policy_ids
+            ]
+        )
+    else:
+        values = pv_results["Present_Value"].to_numpy().reshape(1, -1)
+    reference = np.stack([pv["Present_Value"].to_numpy() for pv in reference_pvs])
+
+    rows = []
+    for line in range(n_lines):
+        rows.append(
+            (
+                line,
+                reference_pvs[0]["Cashflow"].iloc[line],
+                reference_pvs[0]["Timing"].iloc[line],
+                *_max_differences(values[:, line], reference[:, line], atol, rtol),
+            )
+        )
+
+    return pd.DataFrame(rows, columns=PV_CHECK_COLUMNS)
+
+
+def summarise_check(column_check, pv_check, policy_ids, atol, rtol, log_list):
+    """
+    Summarise the column and PV comparisons into a report and log the result.
+
+    Returns
+    -------
+    dict, list
+        The equivalence report and the updated log list.
+    """
+
+    checks = [check for check in [column_check, pv_check] if len(check)]
+    passed = all(check["Passed"].all() for check in checks)
+
+    report = {
+        "passed": bool(passed),
+        "atol": atol,
+        "rtol": rtol,
+        "policies_checked": [int(i) for i in policy_ids],
+        "max_abs_diff": max(
+            (float(check["Max_Abs_Diff"].max()) for check in checks), default=0.0
+        ),
+        "max_rel_diff": max(
+            (float(check["Max_Rel_Diff"].max()) for check in checks), default=0.0
+        ),
+        "columns": column_check,
+        "pv": pv_check,
+    }
+
+    message = (
+        f"Equivalence check against the reference model ({len(policy_ids)} policies, atol = {atol:g}, rtol = {rtol:g}): "
+        f"max abs diff = {report['max_abs_diff']:.6g}, max rel diff = {report['max_rel_diff']:.3g}"
+    )
+    if passed:
+        log_list = read.log_message(f"{message}. Checking passed.", log_list)
+    else:
+        failed = [
+            name
+            for check, key in [(column_check, "Column"), (pv_check, "Cashflow")]
+            if len(check)
+            for name in check.loc[~check["Passed"], key]
+        ]
+        log_list = read.log_message(
+            f"WARNING! {message}. Checking failed for: {', '.join(map(str, failed))}",
+            log_list,
+        )
+
+    return report, log_list
+
+
+def check_equivalence(
+    pricing_model_data,
+    log_list,
+    result=None,
+    pv_results=None,
+    model_points=None,
+    n_months=REFERENCE_MONTHS,
+    precision="double",
+    time_step="monthly",
+    atol=None,
+    rtol=None,
+    max_policies=3,
+):
+    """
+    Check a run of the vectorized engine against the loop-based reference model on the same inputs.
+
+    Parameters
+    ----------
+    pricing_model_data : dict
+        A dictionary containing the data extracted from the pricing model.
+
+    log_list : list
+        The list that stores all log entries.
+
+    result : ProjectionResult
+        Optional projection result to be checked. If None, the engine is run with the given modes.
+
+    pv_results : DataFrame
+        The PV results of the result (required if result is given).
+
+    model_points : dict
+        Optional dictionary of per-policy arrays (see `engine.run_projection`). By default the model point of the
+        pricing model.
+
+    n_months : int
+        The projection horizon of the engine run (only used when the engine is run here). Columns are compared on the
+        common months and the PV results only when the horizon is the one of the reference model (1200 months).
+
+    precision : str
+        The precision mode of the engine run (used for the default tolerances).
+
+    time_step : str
+        The time step of the engine run. Only the monthly time step can be compared with the reference model.
+
+    atol : float
+        The absolute tolerance. Default from DEFAULT_TOLERANCES.
+
+    rtol : float
+        The relative tolerance. Default from DEFAULT_TOLERANCES.
+
+    max_policies : int
+        The maximum number of policies run through the reference model (spread evenly over the batch), as the
+        reference model projects one policy at a time.
+
+    Returns
+    -------
+    dict, list
+        The equivalence report (keys "passed", "atol", "rtol", "policies_checked", "max_abs_diff", "max_rel_diff",
+        "columns" and "pv" - the last two are DataFrames) and the updated log list.
+    """
+
+    if time_step != "monthly" or (result is not None and result.steps_per_year != 12):
+        raise ValueError(
+            "The equivalence check needs a monthly time step run: the reference model is monthly "
+            "(annual runs are compared with the monthly engine by engine.report_pv_deviation)."
+        )
+
+    default_atol, default_rtol = DEFAULT_TOLERANCES[precision]
+    atol = default_atol if atol is None else atol
+    rtol = default_rtol if rtol is None else rtol
+
+    if model_points is None:
+        model_points = {key: pricing_model_data[key] for key in eng.MODEL_POINT_KEYS}
+
+    if result is None:
+        result, pv_results, _ = eng.run_projection(
+            pricing_model_data,
+            [],
+            model_points,
+            n_months,
+            precision=precision,
+            time_step=time_step,
+        )
+
+    policy_ids = np.unique(
+        np.linspace(0, result.n_policies - 1, min(max_policies, result.n_policies))
+        .round()
+        .astype(int)
+    )
+
+    reference_tables, reference_pvs = [], []
+    for i in policy_ids:
+        table, pv, _ = run_reference_projection(
+            pricing_model_data, [], _model_point(model_points, i)
+        )
+        reference_tables.append(table)
+        reference_pvs.append(pv)
+
+    import pandas as pd
+
+    column_check = compare_columns(result, reference_tables, policy_ids, atol, rtol)
+
+    # PVs are only comparable on the same projection horizon
+    pv_check = pd.DataFrame(columns=PV_CHECK_COLUMNS)
+    if result.n_months * 12 // result.steps_per_year == REFERENCE_MONTHS:
+        pv_check = compare_pv(pv_results, reference_pvs, policy_ids, atol, rtol)
+
+    return summarise_check(column_check, pv_check, policy_ids, atol, rtol, log_list)
+
+
+def check_against_output_file(
+    result, pv_results, output_file, log_list, atol=1e-6, rtol=1e-9
+):
+    """
+    Check a single policy projection against a stored output file of the reference model (e.g. the
+    `pricing_model_py_output.xlsx` of the repository).
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The projection result to be checked (first policy, monthly time step).
+
+    pv_results : DataFrame
+        The PV results of the result.
+
+    output_file : str
+        The stored output file (xlsx with "Cashflow_Proj" and "PV_Results" sheets, or pickle of the projection table
+        with its "_pv_results" pickle).
+
+    log_list : list
+        The list that stores all log entries.
+
+    atol : float
+        The absolute tolerance.
+
+    rtol : float
+        The relative tolerance.
+
+    Returns
+    -------
+    dict, list
+        The equivalence report and the updated log list.
+    """
+
+    import pandas as pd
+
+    if output_file.endswith(".xlsx"):
+        sheets = pd.read_excel(output_file, sheet_name=["Cashflow_Proj", "PV_Results"])
+        reference_table = sheets["Cashflow_Proj"]
+        reference_pv = sheets["PV_Results"]
+    else:
+        reference_table = pd.read_pickle(output_file)
+        reference_pv = pd.read_pickle(output_file.replace(".pkl", "_pv_results.pkl"))
+
+    # duplicated column names are suffixed when read from Excel (e.g. "Insurance_Charge_PP.1")
+    reference_table = reference_table.loc[
+        :, ~reference_table.columns.duplicated()
+    ].reset_index(drop=True)
+    reference_pv = reference_pv.reset_index(drop=True)
+
+    column_check = compare_columns(result, [reference_table], [0], atol, rtol)
+    if "Policy_ID" in pv_results.columns:
+        pv_results = pv_results[pv_results["Policy_ID"] == 0]
+    pv_check = compare_pv(pv_results, [reference_pv], [0], atol, rtol)
+
+    return summarise_check(column_check, pv_check, [0], atol, rtol, log_list)
@@ -1,227 +1,494 @@
-import projection as prj
 import data_read as read
-import pandas as pd
+import run_metrics as rm
 import sys
 import os
 
+# Modules needed by every run, imported (and timed) once the user input has been read. The optional modules
+# (profiler, equivalence, results_db, array_store) are only imported when the user input asks for them.
+STARTUP_MODULES = ["numpy", "openpyxl", "pandas", "engine", "output"]
+
+
+def run(
+    json_file_path,
+    log_list,
+    workbook_cache=None,
+    delete_json=True,
+    progress_callback=None,
+    handle_signals=True,
+    equivalence_check=None,
+):
+    """
+    Run the pricing model for one user input JSON file: projection, PV results, output files, run metrics and log.
+
+    Parameters
+    ----------
+    json_file_path : str
+        The path to the user input JSON file.
+
+    log_list : list
+        The list that stores all log entries.
+
+    workbook_cache : dict
+        Optional cache of the pricing model data already read, by workbook (see `data_read.get_pricing_model_key`).
+        Runs of a batch sharing the same workbook read it only once.
+
+    delete_json : bool
+        Whether the JSON file is deleted after the run (temporary file written by the app).
+
+    progress_callback : callable
+        Optional function receiving the progress events of a model point file run (see `progress.py`). By default the
+        events are printed.
+
+    handle_signals : bool
+        Whether SIGINT and SIGTERM cancel a model point file run between batches (see `progress.CancelToken`), instead of
+        stopping the process.
+
+    equivalence_check : bool
+        Whether the run is checked against the reference model (see `equivalence.py`). By default the
+        "equivalenceCheck" setting of the user input. The summary of the check is in metrics["equivalence"].
+
+    Returns
+    -------
+    DataFrame, dict, list
+        The PV results table, the run metrics dictionary (metrics["cancelled"] is True if the run was cancelled) and
+        the updated log list.
+    """
 
-if __name__ == "__main__":
+    # Get user input from json file
+    user_input, log_list = read.read_json_file(json_file_path, log_list)
 
-    # Initalised log list
-    log_list = []
+    # Start the profiler if requested ("profile": "cprofile" or "sampling")
+    profiler = None
+    if user_input.get("profile", ""):
+        import profiler as prof
 
-    # Check if json path is passed as an argument and set the path if exists
-    if len(sys.argv) > 1:
-        json_file_path = sys.argv[1]
-    else:
-        log_list = read.log_message(
-            "Path to temporary JSON file not provided.", log_list
-        )
-        sys.exit(1)
+        profiler, log_list = prof.start_profiler(user_input, log_list)
 
-    # Get user input from json file
-    user_input, log_list = read.read_json_file(json_file_path, log_list)
+    # Start the run instrumentation (wall time, CPU time and peak memory of each stage).
+    # Memory tracing (tracemalloc) slows down the workbook read, so it can be switched off with "traceMemory"
+    metrics = rm.start_run_metrics(
+        trace_memory=user_input.get("traceMemory", True) is not False,
+        profiler=profiler,
+    )
+
+    # Import the modules of the run and log the start-up report (import time of each module)
+    log_list = rm.import_modules(STARTUP_MODULES, metrics, log_list)
+    import engine as eng
+    import output as out
 
-    # Read data dictionary
-    pricing_model_data, log_list = read.read_pricing_model_data(user_input, log_list)
+    # Read data dictionary (or reuse the data read from the same workbook in a batch)
+    workbook_key = read.get_pricing_model_key(user_input)
+    if workbook_cache is not None and workbook_key in workbook_cache:
+        pricing_model_data = workbook_cache[workbook_key]
+        log_list = read.log_message(
+            f"Pricing model data reused from the workbook already read: {user_input['filePath']}.",
+            log_list,
+        )
+    else:
+        with rm.measure_stage("read_pricing_model_data", metrics, log_list):
+            pricing_model_data, log_list = read.read_pricing_model_data(
+                user_input, log_list
+            )
+        if workbook_cache is not None:
+            workbook_cache[workbook_key] = pricing_model_data
 
     # -----------------------------------------------------
-    # Get the parameters and tables from the dictionary
+    # Produce projections cashflows and PV of cashflows
     # -----------------------------------------------------
-    #  Policyholder's profile
-    AGE = pricing_model_data["Age"]
-    GENDER = pricing_model_data["Gender"]
-
-    # Insurance Contract features
-    POL_YEAR = pricing_model_data["Pol_Year"]
-    SUM_ASSD = pricing_model_data["SumAssured"]
-    CONT_Y = pricing_model_data["Contribution_perYear"]
-    SURPLUS_SHARE_SHF = pricing_model_data["SurplusShare_toSHF"]
-    SURPLUS_SHARE_PH = pricing_model_data["SurplusShare_toParticipant"]
 
-    # Contract Fees & Charges
-    WAKALAH_TABLE = pricing_model_data["Table_WakalahFee"]
-    WAKALAH_FMC = pricing_model_data["Wakalah_FMC"]
-    COI_LOADING = pricing_model_data["COI_Loading"]
+    # Precision mode: "double" (default) or "single" (float32 cashflows, compact flags and counters)
+    precision = user_input.get("precisionMode", "double") or "double"
 
-    # Expense Assumptions
-    EXP_CONT_Y = pricing_model_data["Expense_perContribution_perYear"]
-    EXP_FUND_Y = pricing_model_data["Expense_perFund_perYear"]
+    # Time step: "monthly" (default) or "annual" (indicative runs with 12x fewer steps)
+    time_step = user_input.get("timeStep", "monthly") or "monthly"
 
-    # Decrements Assumptions
-    MORT_TABLE = pricing_model_data["Table_Mortality"]
-    LAPSE_TABLE = pricing_model_data["Table_Lapse"]
+    # Output columns: from the output profile or the explicit column list (None = all columns).
+    # Optional columns that are not exported are not projected at all.
+    output_columns = out.get_output_columns(user_input)
 
-    # Decrements Assumptions
-    RFR_TABLE = pricing_model_data["Table_RiskFreeRate"]
+    # Engine: "vectorized" (default) or "reference" (loop-based model of projection.py)
+    engine_mode = user_input.get("engine", "vectorized") or "vectorized"
 
-    # ----end of procedure----------------------------------------------
+    # Dynamic lapse rules (lapse on unit fund exhaustion, rate-dependent lapse), None = table lapse rates only.
+    # The reference model only has the table lapse rates.
+    dynamic_lapse = read.get_dynamic_lapse_settings(user_input)
+    if dynamic_lapse is not None and engine_mode == "reference":
+        raise ValueError(
+            "Dynamic lapse is not available with the reference (loop-based) engine."
+        )
 
-    # -----------------------------------------------------
-    # Produce projections cashflows
-    # -----------------------------------------------------
+    # Profit signature of each policy (IRR, break-even year, NBV margin) in a table next to the PV results (optional)
+    profit_metrics = bool(user_input.get("profitMetrics", False))
+    profit_results = None
 
-    # Initiate main columns
-    t_index_col = prj.generate_t_index_table()
-    is_cover_col = prj.generate_is_cover_table(t_index_col, POL_YEAR)
-    pol_month_col = prj.generate_pol_month_table(t_index_col, is_cover_col)
-    pol_year_col = prj.generate_pol_year_table(pol_month_col, is_cover_col)
-    age_col = prj.generate_age_table(pol_year_col, is_cover_col, AGE)
+    # Model point file (seriatim run): the model points are projected in batches and the cashflows are aggregated
+    model_point_file = user_input.get("modelPointFile", "")
+    checkpoint = None
 
-    # Project risk-free return and discount factor
-    rfr_proj_tab = prj.generate_rfr_table(pol_year_col, RFR_TABLE, is_cover_col)
-    disc_fact_tab = prj.generate_discount_factor_table(rfr_proj_tab)
+    # Sales volume file (new business plan): the cohorts sold each month are combined by calendar month
+    sales_volume_file = user_input.get("salesVolumeFile", "")
 
-    # Project policy decrements
-    mort_tab = prj.generate_mortality_rate_table(
-        age_col, GENDER, MORT_TABLE, is_cover_col
-    )
-    lapse_tab = prj.generate_lapse_rate(pol_year_col, LAPSE_TABLE, POL_YEAR)
-    pol_count_proj = prj.generate_policy_count_table(pol_month_col, mort_tab, lapse_tab)
-
-    # Project per policy cashflows
-    unit_cf_pp_proj = prj.generate_unit_fund_cashflow_table(
-        CONT_Y,
-        is_cover_col,
-        pol_year_col,
-        WAKALAH_TABLE,
-        SUM_ASSD,
-        mort_tab,
-        COI_LOADING,
-        rfr_proj_tab,
-        WAKALAH_FMC,
-    )
-    risk_cf_pp_proj = prj.generate_risk_fund_cashflows_table(
-        unit_cf_pp_proj,
-        mort_tab,
-        rfr_proj_tab,
-        SUM_ASSD,
-        SURPLUS_SHARE_SHF,
-        SURPLUS_SHARE_PH,
-    )
-    shf_cf_pp_proj = prj.generate_shf_cashflows(
-        unit_cf_pp_proj, rfr_proj_tab, risk_cf_pp_proj, EXP_CONT_Y, EXP_FUND_Y
-    )
+    # Memory-mapped array store of the per-policy projection (optional)
+    array_store_path = user_input.get("arrayStorePath", "")
+    if array_store_path and sales_volume_file:
+        raise ValueError(
+            "The array store holds the projection of each policy, which new business cohort runs do not keep "
+            "(the cohorts are summed by calendar month)."
+        )
+    if array_store_path and user_input.get("resultLayout", "") == "ragged":
+        raise ValueError(
+            "The array store keeps the padded layout (policies x months). Use 'policyResultsPath' to keep the "
+            "per-policy results of a ragged layout run."
+        )
 
-    # Project inforce cashflows
-    unit_cf_if_proj, log_list = prj.generate_cashflow_if_df(
-        unit_cf_pp_proj, pol_count_proj, log_list, is_unit_fund=True
-    )
-    risk_cf_if_proj, log_list = prj.generate_cashflow_if_df(
-        risk_cf_pp_proj, pol_count_proj, log_list
-    )
-    shf_cf_if_proj, log_list = prj.generate_cashflow_if_df(
-        shf_cf_pp_proj, pol_count_proj, log_list
-    )
+    # Project the new business cohorts of the product cells (model point file, or the model point of the pricing model)
+    if sales_volume_file:
+        import cohorts as coh
 
-    # ----end of procedure----------------------------------------------
+        if time_step != "monthly":
+            raise ValueError(
+                "New business cohort runs use the monthly time step (monthly sales volumes)."
+            )
+        if model_point_file:
+            model_points, log_list = read.read_model_points(model_point_file, log_list)
+        else:
+            model_points = {
+                key: [pricing_model_data[key]] for key in eng.MODEL_POINT_KEYS
+            }
+        sales, log_list = read.read_sales_volumes(
+            sales_volume_file, len(model_points["Age"]), log_list
+        )
 
-    # -----------------------------------------------------
-    # Calculate Preset Values of cashflow
-    # -----------------------------------------------------
+        with rm.measure_stage("run_cohort_projection", metrics, log_list):
+            result, pv_results, profit_results, log_list = coh.run_cohort_projection(
+                pricing_model_data,
+                log_list,
+                model_points,
+                sales,
+                precision=precision,
+                columns=output_columns,
+                dynamic_lapse=dynamic_lapse,
+                method=user_input.get("convolutionMethod", "auto") or "auto",
+                profit_metrics=profit_metrics,
+            )
+        output_columns, log_list = out.get_aggregate_output_columns(
+            output_columns, log_list
+        )
 
-    # Calculate PV of cashflow
-    unit_cf_PV = prj.generate_pv_cashflows_df(unit_cf_if_proj, disc_fact_tab)
-    risk_cf_PV = prj.generate_pv_cashflows_df(risk_cf_if_proj, disc_fact_tab)
-    shf_cf_PV = prj.generate_pv_cashflows_df(shf_cf_if_proj, disc_fact_tab)
+    # Project the model points of the model point file in batches
+    elif model_point_file:
+        import progress as prg
 
-    # ----end of procedure----------------------------------------------
+        with rm.measure_stage("read_model_points", metrics, log_list):
+            model_points, log_list = read.read_model_points(model_point_file, log_list)
+        n_policies = len(model_points["Age"])
 
-    # -----------------------------------------------------
-    # Export output file
-    # -----------------------------------------------------
-    cf_proj_list = [
-        t_index_col,
-        is_cover_col,
-        pol_month_col,
-        pol_year_col,
-        age_col,
-        rfr_proj_tab,
-        disc_fact_tab,
-        mort_tab,
-        lapse_tab,
-        pol_count_proj,
-        unit_cf_pp_proj,
-        risk_cf_pp_proj,
-        shf_cf_pp_proj,
-        unit_cf_if_proj,
-        risk_cf_if_proj,
-        shf_cf_if_proj,
-    ]
-
-    cf_proj_table = prj.append_dataframes(cf_proj_list)
-
-    # Define Excel output name
-    output_path = user_input["outputFilePath"]
-    output_name = user_input["outputFileName"]
-    output_format = user_input["outputFormat"]
-    output_file = output_path + "\\" + output_name + "." + output_format
+        # Batches of whole reduction blocks, so that the aggregates do not depend on the batch size
+        batch_size, log_list = eng.get_batch_size(user_input, log_list)
 
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-        log_list = read.log_message(
-            f"Output directory provided does not exists, '{output_path}' created successfully.",
-            log_list,
+        # Progress events (throttled) and cancellation between batches (cancel file or SIGINT / SIGTERM)
+        progress = prg.ProgressReporter(
+            -(-n_policies // batch_size),
+            n_policies,
+            interval=float(user_input.get("progressInterval", 1) or 1),
+            callback=progress_callback,
+        )
+        cancel = prg.CancelToken(
+            user_input.get("cancelFile", "") or json_file_path + ".cancel",
+            handle_signals=handle_signals,
         )
 
-    # Write output
-    if output_format == "xlsx":
-        # Write data to Excel
-        with pd.ExcelWriter(output_file) as writer:
-            # Write cashflow projection table to "cashflow_proj" sheet
-            cf_proj_table.to_excel(writer, sheet_name="Cashflow_Proj", index=False)
+        # Checkpoint of the completed batches, to resume the run if it is restarted with the same inputs
+        checkpoint_dir = user_input.get("checkpointDir", "")
+        if checkpoint_dir:
+            import checkpoint as ckp
 
-            # Write PV results to "pv_results" sheet
-            pv_results = pd.concat([unit_cf_PV, risk_cf_PV, shf_cf_PV])
-            pv_results.to_excel(writer, sheet_name="PV_Results", index=False)
+            checkpoint, log_list = ckp.open_checkpoint(
+                checkpoint_dir, user_input, progress.n_batches, log_list
+            )
 
-        log_list = read.log_message(
-            f"Output file has been created successfully in: {output_file}", log_list
-        )
+        # Layout of the batch results: "padded" (default) or "ragged" (only the periods in cover of each policy)
+        result_layout = user_input.get("resultLayout", "padded") or "padded"
+
+        # Per-policy results kept in a ragged store (optional). A resumed run keeps the batches already written.
+        write_policies = None
+        policy_results_path = user_input.get("policyResultsPath", "")
+        if policy_results_path:
+            import array_store as arr
+
+            policy_store = arr.create_ragged_store(
+                policy_results_path,
+                arr.get_policy_lengths(
+                    model_points["Pol_Year"],
+                    time_step=time_step,
+                    elapsed_months=model_points.get("Elapsed_Months", 0),
+                ),
+                eng.get_aggregate_columns(output_columns)[1:],
+                1200 * eng.TIME_STEPS[time_step] // 12,
+                dtype=eng.PRECISION_DTYPES[precision],
+                reuse=checkpoint is not None,
+            )
+            write_policies = lambda result, first_policy: arr.write_ragged_policies(
+                policy_store, result, first_policy
+            )
 
-    elif output_format == "csv":
-        # Write data to CSV
-        cf_proj_table.to_csv(output_file, index=False)
+        # Per-policy results kept in a dense array store (optional), written batch by batch in the padded layout
+        write_padded = None
+        if array_store_path:
+            import array_store as arr
+
+            array_store = arr.create_array_store(
+                array_store_path,
+                n_policies,
+                1200 * eng.TIME_STEPS[time_step] // 12,
+                arr.get_store_groups(eng.get_aggregate_columns(output_columns)[1:]),
+                dtype=eng.PRECISION_DTYPES[precision],
+                reuse=checkpoint is not None,
+            )
+            write_padded = lambda result, first_policy: arr.write_padded_policies(
+                array_store, result, first_policy
+            )
+        try:
+            with rm.measure_stage(
+                "run_model_point_batches", metrics, log_list, n_policies
+            ):
+                result, pv_results, profit_results, metrics["cancelled"], log_list = (
+                    eng.run_model_point_batches(
+                        pricing_model_data,
+                        log_list,
+                        model_points,
+                        batch_size,
+                        precision=precision,
+                        time_step=time_step,
+                        columns=output_columns,
+                        progress=progress,
+                        cancel=cancel,
+                        checkpoint=checkpoint,
+                        dynamic_lapse=dynamic_lapse,
+                        inforce_threshold=float(
+                            user_input.get("inforceThreshold", 0) or 0
+                        ),
+                        layout=result_layout,
+                        write_policies=write_policies,
+                        write_padded=write_padded,
+                        profit_metrics=profit_metrics,
+                    )
+                )
+        finally:
+            cancel.close()
+
+        if array_store_path:
+            arr.flush_array_store(array_store)
+            log_list = read.log_message(
+                f"Per-policy projection written to memory-mapped array store in: {array_store_path}",
+                log_list,
+            )
+        if policy_results_path:
+            arr.flush_array_store(policy_store)
+            log_list = read.log_message(
+                f"Per-policy results written to the ragged store in: {policy_results_path}",
+                log_list,
+            )
+            if user_input.get("policyResultsParquet", False):
+                with rm.measure_stage("export_policy_results", metrics, log_list):
+                    log_list = arr.export_ragged_parquet(
+                        policy_store,
+                        os.path.join(policy_results_path, "policy_results.parquet"),
+                        log_list,
+                    )
+
+        # The output holds the cashflows aggregated over the policies
+        output_columns, log_list = out.get_aggregate_output_columns(
+            output_columns, log_list
+        )
         log_list = read.log_message(
-            f"Output file has been created successfully in: {output_file}",
+            f"Projection of {n_policies:,} model points completed in batches of {batch_size:,} "
+            f"in {precision} precision mode with {time_step} time step ({result_layout} layout).",
             log_list,
         )
+    elif engine_mode == "reference":
+        import equivalence as eq
 
-        pv_results = pd.concat([unit_cf_PV, risk_cf_PV, shf_cf_PV])
-        pv_results.to_csv(output_file.replace(".csv", "_pv_results.csv"), index=False)
-
+        with rm.measure_stage("run_reference_projection", metrics, log_list):
+            cf_ref_table, pv_results, log_list = eq.run_reference_projection(
+                pricing_model_data, log_list
+            )
+            result = eq.reference_to_result(cf_ref_table)
         log_list = read.log_message(
-            f"Output file has been created successfully in: {output_file.replace('.csv', '_pv_results.csv')}",
+            "Projection completed with the reference (loop-based) model.", log_list
+        )
+        if profit_metrics:
+            log_list = read.log_message(
+                "Profit metrics not computed: the reference model only has the present values.",
+                log_list,
+            )
+    else:
+        result, pv_results, log_list = eng.run_projection(
+            pricing_model_data,
             log_list,
+            precision=precision,
+            time_step=time_step,
+            columns=output_columns,
+            metrics=metrics,
+            dynamic_lapse=dynamic_lapse,
         )
-
-    elif output_format == "pickle":
-        # Write data to Pickle
-        cf_proj_table.to_pickle(output_file.replace(".pickle", ".pkl"))
+        if profit_metrics:
+            profit_results = eng.generate_profit_table(result, pv_results)
         log_list = read.log_message(
-            f"Output file has been created successfully in: {output_file.replace(".pickle", ".pkl")}",
+            f"Projection completed in {precision} precision mode with {time_step} time step "
+            f"({result.nbytes / 1024 ** 2:.2f} MB of projection results held in memory).",
             log_list,
         )
 
-        pv_results = pd.concat([unit_cf_PV, risk_cf_PV, shf_cf_PV])
-        pv_results.to_pickle(output_file.replace(".pickle", "_pv_results.pkl"))
-        log_list = read.log_message(
-            f"Output file has been created successfully in: {output_file.replace('.pickle', '_pv_results.pkl')}",
-            log_list,
+    # Check the engine against the reference model (optional, with configurable tolerances). The reference model
+    # projects the model point of the workbook on the monthly time step, with the table lapse rates only.
+    if equivalence_check is None:
+        equivalence_check = bool(user_input.get("equivalenceCheck", False))
+    skip_reason = None
+    if engine_mode == "reference":
+        skip_reason = "the run uses the reference model"
+    elif model_point_file or sales_volume_file:
+        skip_reason = (
+            "the reference model only projects the model point of the workbook"
+        )
+    elif dynamic_lapse is not None:
+        skip_reason = "the reference model has no dynamic lapse"
+    elif time_step != "monthly":
+        skip_reason = (
+            "the reference model is monthly, annual runs are only compared with the monthly engine "
+            "(PV deviation below)"
         )
 
-    else:
+    if equivalence_check and skip_reason:
         log_list = read.log_message(
-            f"Unsupported output format: {output_format}", log_list
+            f"Equivalence check skipped: {skip_reason}.", log_list
+        )
+    elif equivalence_check:
+        import equivalence as eq
+
+        atol, rtol = eq.get_tolerances(user_input, precision)
+        with rm.measure_stage("check_equivalence", metrics, log_list):
+            equivalence, log_list = eq.check_equivalence(
+                pricing_model_data,
+                log_list,
+                result,
+                pv_results,
+                precision=precision,
+                time_step=time_step,
+                atol=atol,
+                rtol=rtol,
+            )
+        metrics["equivalence"] = {
+            key: equivalence[key]
+            for key in [
+                "passed",
+                "atol",
+                "rtol",
+                "policies_checked",
+                "max_abs_diff",
+                "max_rel_diff",
+            ]
+        }
+
+    # Report the PV deviation of fast runs against the float64 monthly engine
+    if (
+        engine_mode != "reference"
+        and not model_point_file
+        and not sales_volume_file
+        and (precision != "double" or time_step != "monthly")
+    ):
+        with rm.measure_stage("report_pv_deviation", metrics, log_list):
+            pv_deviation, log_list = eng.report_pv_deviation(
+                pv_results, pricing_model_data, log_list, dynamic_lapse=dynamic_lapse
+            )
+
+    # ----end of procedure----------------------------------------------
+
+    # -----------------------------------------------------
+    # Export output file
+    # -----------------------------------------------------
+    # Roll up the output to the requested time granularity (monthly, quarterly or annual)
+    output_granularity = user_input.get("outputGranularity", "monthly") or "monthly"
+    with rm.measure_stage("rollup_projection", metrics, log_list):
+        output_result, log_list = out.rollup_projection(
+            result, output_granularity, log_list, columns=output_columns
         )
+        cf_proj_table = output_result.to_frame(columns=output_columns)
+
+    # Write output files (cashflow table, PV results and profit metrics in the selected format)
+    output_path = user_input["outputFilePath"]
+    with rm.measure_stage(
+        "export_output", metrics, log_list, result.n_policies, len(cf_proj_table)
+    ):
+        log_list = out.write_output_files(
+            cf_proj_table, pv_results, user_input, log_list, profit_results
+        )
+
+    # Write results to the SQLite results store (optional)
+    results_db_path = user_input.get("resultsDbPath", "")
+    if results_db_path:
+        import results_db as rdb
+
+        # Model points of the PV results (policies 1 to n), none for the PVs of a cohort run (summed over the policies)
+        if sales_volume_file:
+            db_model_points = None
+        elif model_point_file:
+            db_model_points = model_points
+        else:
+            db_model_points = {
+                key: [pricing_model_data[key]] for key in eng.MODEL_POINT_KEYS
+            }
+
+        # The database holds the cashflows at the projection time step (not rolled up to the output granularity)
+        if output_result is not result:
+            db_table = result.to_frame(columns=output_columns)
+        else:
+            db_table = cf_proj_table
+
+        with rm.measure_stage("write_run_results", metrics, log_list):
+            run_id, log_list = rdb.write_run_results(
+                results_db_path,
+                user_input,
+                db_model_points,
+                db_table,
+                pv_results,
+                log_list,
+                aggregated=bool(model_point_file or sales_volume_file),
+            )
+
+    # Write the projection of a single model point to the memory-mapped array store (optional).
+    # Model point file runs write the store batch by batch.
+    if array_store_path and not model_point_file:
+        import array_store as arr
+
+        with rm.measure_stage("write_projection_store", metrics, log_list):
+            log_list = arr.write_projection_store(
+                array_store_path, result, log_list, dtype=result.dtype
+            )
+
+    # Remove the checkpoint once the output has been written (a cancelled run keeps it to be resumed)
+    if (
+        checkpoint is not None
+        and not metrics["cancelled"]
+        and not user_input.get("keepCheckpoint", False)
+    ):
+        log_list = checkpoint.remove(log_list)
+
+    # Stop the profiler and write the profile files next to the run log
+    if profiler is not None:
+        profiler.stop()
+        log_list = profiler.write(output_path, log_list)
+
+    # Write the run metrics (time and memory of each stage) to run_metrics.json
+    log_list = rm.write_run_metrics(metrics, output_path, log_list)
 
     # Delete the JSON file after processing
-    os.remove(json_file_path)
-    log_list = read.log_message(
-        f"Temporary JSON file deleted after succesful creation of Output file.",
-        log_list,
-    )
+    if delete_json:
+        os.remove(json_file_path)
+        log_list = read.log_message(
+            f"Temporary JSON file deleted after succesful creation of Output file.",
+            log_list,
+        )
 
     # Write log output file
     generate_log_bool = user_input["generateRunLog"]
@@ -240,3 +507,35 @@ if __name__ == "__main__":
             file.write(log_entry_last)
 
     # ----end of procedure----------------------------------------------
+
+    return pv_results, metrics, log_list
+
+
+if __name__ == "__main__":
+
+    # Initalised log list
+    log_list = []
+
+    # Warm worker of the local job service (job_server.js): run the jobs received on stdin
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        import worker
+
+        sys.exit(worker.serve())
+
+    # Check if json path is passed as an argument and set the path if exists
+    if len(sys.argv) > 1:
+        json_file_path = sys.argv[1]
+    else:
+        log_list = read.log_message(
+            "Path to temporary JSON file not provided.", log_list
+        )
+        sys.exit(1)
+
+    # Run the pricing model (batch runs of many JSON files: see batch.py)
+    pv_results, metrics, log_list = run(json_file_path, log_list)
+
+    # Exit with a distinct status if the run was cancelled (the completed model point batches have been exported)
+    if metrics["cancelled"]:
+        import progress as prg
+
+        sys.exit(prg.EXIT_CANCELLED)
@@ -0,0 +1,376 @@
+"""
+output.py
+
+This module prepares the projection result for export. It contains the output column selection (output profiles or an
+explicit column list) and the time-granularity rollup, which converts the monthly projection into quarterly or annual
+periods before the output file is written.
+
+Output profiles:
+- "full"      : every projection column (default).
+- "valuation" : reference columns, discount factors, policy counts and inforce cashflows.
+- "pricing"   : reference columns, policy counts and the inforce cashflows that make up the profit.
+- "audit"     : reference columns, rates, decrements and per policy cashflows, to check the calculation of a policy.
+
+The rollup is a vectorized reshape-and-reduce on the (policies x months) columns of the ProjectionResult:
+cashflow items (contributions, claims, fees, profit, number of deaths and lapses) are summed over the period, closing
+balances (e.g. Unit_Fund_EOP_IF, No_Pol_End) take the value at the end of the period, and opening balances, rates and
+reference columns take the value at the start of the period.
+
+The output files (cashflow table, PV results and optional profit metrics in xlsx, csv or pickle format) are written by
+write_output_files.
+"""
+
+import numpy as np
+import os
+import data_read as read
+import engine as eng
+from proj_result import ProjectionResult
+
+# Number of output periods per year for each output granularity
+OUTPUT_GRANULARITY = {"monthly": 12, "quarterly": 4, "annual": 1}
+
+# Columns exported by each output profile (None = every column)
+OUTPUT_PROFILES = {
+    "full": None,
+    "valuation": eng.COLUMN_GROUPS["reference"]
+    + ["disc_factor_bop", "disc_factor_eop", "No_Pol_Start", "No_Pol_End"]
+    + eng.COLUMN_GROUPS["unit_if"]
+    + eng.COLUMN_GROUPS["risk_if"]
+    + eng.COLUMN_GROUPS["shf_if"],
+    "pricing": eng.COLUMN_GROUPS["reference"]
+    + [
+        "disc_factor_eop",
+        "No_Pol_Start",
+        "No_Pol_End",
+        "Contribution_IF",
+        "Wakalah_Fee_IF",
+        "Insurance_Charge_IF",
+        "Insurance_Claim_IF",
+        "Expenses_IF",
+        "Unit_InvCharge_IF",
+        "Fund_Expenses_IF",
+        "Surplus_to_SHF_IF",
+        "Profit_IF",
+    ],
+    "audit": eng.COLUMN_GROUPS["reference"]
+    + eng.COLUMN_GROUPS["economic"]
+    + eng.COLUMN_GROUPS["decrement"]
+    + eng.COLUMN_GROUPS["unit_pp"]
+    + eng.COLUMN_GROUPS["risk_pp"]
+    + eng.COLUMN_GROUPS["shf_pp"],
+}
+
+
+def get_output_columns(user_input):
+    """
+    Get the columns to be exported from the output profile ("outputProfile") or the explicit column list
+    ("outputColumns", comma-separated) of the user input.
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    Returns
+    -------
+    List or None
+        The selected columns in projection order, or None when every column is exported.
+
+    Notes
+    -----
+    The explicit column list takes precedence over the profile. T_Index is always exported.
+    """
+
+    output_columns = user_input.get("outputColumns", "")
+    if output_columns:
+        if isinstance(output_columns, str):
+            output_columns = output_columns.split(",")
+        selected = [col.strip() for col in output_columns if col.strip()]
+    else:
+        profile = user_input.get("outputProfile", "full") or "full"
+        if profile not in OUTPUT_PROFILES:
+            raise ValueError(
+                f"Unsupported output profile: {profile}. Use one of {list(OUTPUT_PROFILES)}."
+            )
+        selected = OUTPUT_PROFILES[profile]
+        if selected is None:
+            return None
+
+    unknown = [col for col in selected if col not in eng.PROJECTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown output column(s): {unknown}")
+
+    selected = set(selected) | {"T_Index"}
+
+    return [col for col in eng.PROJECTION_COLUMNS if col in selected]
+
+
+def get_aggregate_output_columns(columns, log_list):
+    """
+    Get the columns of the aggregated output of a model point file or cohort run (policy counts and inforce cashflows
+    summed over the policies), and warn about the selected columns that are not in it.
+
+    Parameters
+    ----------
+    columns : List or None
+        The selected output columns (see get_output_columns), None for every column.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    List, list
+        The aggregate columns (see `engine.get_aggregate_columns`) and the updated log list.
+    """
+
+    aggregate_columns = eng.get_aggregate_columns(columns)
+    if columns is not None:
+        ignored = [col for col in columns if col not in aggregate_columns]
+        if ignored:
+            log_list = read.log_message(
+                f"WARNING! Output column(s) not exported: {', '.join(ignored)}. Runs aggregated over the policies "
+                f"only have T_Index, the policy counts and the inforce cashflows.",
+                log_list,
+            )
+
+    return aggregate_columns, log_list
+
+
+def get_rollup_rule(col):
+    """
+    Get the aggregation rule of a projection column when rolled up to a longer period.
+
+    Parameters
+    ----------
+    col : str
+        The column name.
+
+    Returns
+    -------
+    str
+        One of "index" (period counter), "max", "last", "first" or "sum".
+    """
+
+    if col == "T_Index":
+        return "index"
+    if col == "is_Cover":
+        return "max"
+    if "EOP" in col.upper() or col in ["No_Pol_End", "Pol_Month"]:
+        return "last"
+    if (
+        "BOP" in col.upper()
+        or "Rate" in col
+        or "RiskFree" in col
+        or col in ["No_Pol_Start", "Pol_Year", "Age"]
+    ):
+        return "first"
+    if col.endswith("_PP") or col.endswith("_IF") or col in ["No_Death", "No_Lapse"]:
+        return "sum"
+
+    return "first"
+
+
+def rollup_projection(result, granularity, log_list, columns=None):
+    """
+    Roll up a projection result to a longer output period (monthly, quarterly or annual).
+
+    Parameters
+    ----------
+    result : ProjectionResult
+        The projection result to be rolled up.
+
+    granularity : str
+        The output granularity: "monthly", "quarterly" or "annual".
+
+    log_list : list
+        The list that stores all log entries.
+
+    columns : List
+        Optional list of the columns to be rolled up. By default all columns of the result are rolled up.
+
+    Returns
+    -------
+    ProjectionResult, list
+        The rolled-up projection result (the input result itself if no rollup is needed) and the updated log list.
+
+    Notes
+    -----
+    Each column of shape (policies x months) is reshaped to (policies x periods x months per period) and reduced along
+    the last axis. Sums are accumulated in float64.
+    """
+
+    if granularity not in OUTPUT_GRANULARITY:
+        raise ValueError(
+            f"Unsupported output granularity: {granularity}. Use one of {list(OUTPUT_GRANULARITY)}."
+        )
+
+    periods_per_year = OUTPUT_GRANULARITY[granularity]
+    if periods_per_year >= result.steps_per_year:
+        if periods_per_year > result.steps_per_year:
+            log_list = read.log_message(
+                f"Output granularity '{granularity}' is finer than the projection time step. "
+                f"Output is kept at the projection time step.",
+                log_list,
+            )
+        return result, log_list
+
+    steps_per_period = result.steps_per_year // periods_per_year
+    columns = result.columns if columns is None else columns
+    n_periods = result.n_months // steps_per_period
+
+    rollup = ProjectionResult(
+        columns,
+        n_policies=result.n_policies,
+        n_months=n_periods,
+        int_columns=result.int_columns,
+        dtype=result.dtype,
+        column_dtypes={col: arr.dtype for col, arr in result.compact.items()},
+        steps_per_year=periods_per_year,
+    )
+
+    for col in columns:
+        values = result[col][:, : n_periods * steps_per_period].reshape(
+            result.n_policies, n_periods, steps_per_period
+        )
+        rule = get_rollup_rule(col)
+        if rule == "index":
+            rollup[col] = np.arange(1, n_periods + 1)
+        elif rule == "max":
+            rollup[col] = values.max(axis=2)
+        elif rule == "last":
+            rollup[col] = values[:, :, -1]
+        elif rule == "first":
+            rollup[col] = values[:, :, 0]
+        else:
+            rollup[col] = values.sum(axis=2, dtype=np.float64)
+
+    log_list = read.log_message(
+        f"Output rolled up to {granularity} periods ({result.n_months} to {n_periods} rows per policy).",
+        log_list,
+    )
+
+    return rollup, log_list
+
+
+def write_output_files(
+    cf_proj_table, pv_results, user_input, log_list, profit_results=None
+):
+    """
+    Write the cashflow projection table, the PV results and the profit metrics in the output format of the user input
+    ("xlsx", "csv" or "pickle") to the output directory, created if it does not exist.
+
+    Parameters
+    ----------
+    cf_proj_table : DataFrame
+        The cashflow projection table.
+
+    pv_results : DataFrame
+        The PV results table.
+
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file ("outputFilePath",
+        "outputFileName" and "outputFormat").
+
+    log_list : list
+        The list that stores all log entries.
+
+    profit_results : DataFrame
+        Optional profit metrics table (see `engine.generate_profit_table`), written next to the PV results
+        ("Profit_Metrics" sheet, or "_profit_metrics" file).
+
+    Returns
+    -------
+    list
+        The updated log list.
+    """
+
+    # Define Excel output name
+    output_path = user_input["outputFilePath"]
+    output_name = user_input["outputFileName"]
+    output_format = user_input["outputFormat"]
+    output_file = output_path + "\\" + output_name + "." + output_format
+
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+        log_list = read.log_message(
+            f"Output directory provided does not exists, '{output_path}' created successfully.",
+            log_list,
+        )
+
+    # Write output
+    if output_format == "xlsx":
+        import pandas as pd
+
+        # Write data to Excel
+        with pd.ExcelWriter(output_file) as writer:
+            # Write cashflow projection table to "cashflow_proj" sheet
+            cf_proj_table.to_excel(writer, sheet_name="Cashflow_Proj", index=False)
+
+            # Write PV results to "pv_results" sheet
+            pv_results.to_excel(writer, sheet_name="PV_Results", index=False)
+
+            # Write profit metrics to "Profit_Metrics" sheet (optional)
+            if profit_results is not None:
+                profit_results.to_excel(
+                    writer, sheet_name="Profit_Metrics", index=False
+                )
+
+        log_list = read.log_message(
+            f"Output file has been created successfully in: {output_file}", log_list
+        )
+
+    elif output_format == "csv":
+        # Write data to CSV
+        cf_proj_table.to_csv(output_file, index=False)
+        log_list = read.log_message(
+            f"Output file has been created successfully in: {output_file}",
+            log_list,
+        )
+
+        pv_results.to_csv(output_file.replace(".csv", "_pv_results.csv"), index=False)
+
+        log_list = read.log_message(
+            f"Output file has been created successfully in: {output_file.replace('.csv', '_pv_results.csv')}",
+            log_list,
+        )
+
+        if profit_results is not None:
+            profit_results.to_csv(
+                output_file.replace(".csv", "_profit_metrics.csv"), index=False
+            )
+            log_list = read.log_message(
+                f"Output file has been created successfully in: {output_file.replace('.csv', '_profit_metrics.csv')}",
+                log_list,
+            )
+
+    elif output_format == "pickle":
+        # Write data to Pickle
+        cf_proj_table.to_pickle(output_file.replace(".pickle", ".pkl"))
+        log_list = read.log_message(
+            f"Output file has been created successfully in: {output_file.replace('.pickle', '.pkl')}",
+            log_list,
+        )
+
+        pv_results.to_pickle(output_file.replace(".pickle", "_pv_results.pkl"))
+        log_list = read.log_message(
+            f"Output file has been created successfully in: {output_file.replace('.pickle', '_pv_results.pkl')}",
+            log_list,
+        )
+
+        if profit_results is not None:
+            profit_results.to_pickle(
+                output_file.replace(".pickle", "_profit_metrics.pkl")
+            )
+            log_list = read.log_message(
+                f"Output file has been created successfully in: {output_file.replace('.pickle', '_profit_metrics.pkl')}",
+                log_list,
+            )
+
+    else:
+        log_list = read.log_message(
+            f"Unsupported output format: {output_format}", log_list
+        )
+
+    return log_list
@@ -0,0 +1,335 @@
+"""
+profiler.py
+
+This module contains the opt-in profiler hooks of a run, selected in the user input:
+- "profile"          : "cprofile" (deterministic, every function call) or "sampling" (the call stack of the main thread
+                       is sampled at a fixed interval, with a much lower overhead). Empty = no profiling.
+- "profileStages"    : optional comma-separated list of stage names (e.g. "read_pricing_model_data,
+                       generate_unit_fund_columns"). Only these stages are profiled. By default the whole run is profiled.
+- "profileFunctions" : optional comma-separated list of functions of `engine.py` or `projection.py`
+                       (e.g. "generate_risk_fund_columns"). Only the calls to these functions are profiled.
+
+The functions of "profileFunctions" are replaced by profiling wrappers in their module for the run only: the original
+functions are put back when the profiler is stopped, so later runs of the same process (e.g. the warm worker of the job
+service, or a batch) are not profiled by it.
+
+Both profilers only use the standard library (cProfile, pstats, threading), so they also work inside the PyInstaller
+executable without any other installation. The profile files are written next to the run log:
+- cProfile : "profile.prof" (open with pstats or snakeviz) and "profile_stats.txt" (top functions by cumulative time).
+- sampling : "profile_sampling.txt" (collapsed stacks, one line per stack with its sample count, which can be loaded
+             in flame graph tools such as speedscope).
+"""
+
+import collections
+import contextlib
+import functools
+import importlib
+import os
+import sys
+import threading
+import time
+import data_read as read
+
+PROFILE_MODES = ["cprofile", "sampling"]
+
+# Modules searched for the functions listed in "profileFunctions"
+PROFILE_FUNCTION_MODULES = ["engine", "projection"]
+
+# Profiler of the current run of this process (see start_profiler)
+_active_profiler = None
+
+
+def _split_names(names):
+    """
+    Split a comma-separated list of names (or a list) into a list of stripped names.
+    """
+
+    if not names:
+        return []
+    if isinstance(names, str):
+        names = names.split(",")
+
+    return [name.strip() for name in names if name.strip()]
+
+
+class RunProfiler:
+    """
+    Profiler of a run, enabled for the whole run, for selected stages or for selected functions.
+
+    Parameters
+    ----------
+    mode : str
+        The profiler: "cprofile" or "sampling".
+
+    stages : List
+        Optional stage names to be profiled. By default (and if no function is given) the whole run is profiled.
+
+    functions : List
+        Optional function names of `engine.py` or `projection.py` to be profiled.
+
+    interval : float
+        The sampling interval in seconds (sampling mode only).
+    """
+
+    def __init__(self, mode, stages=None, functions=None, interval=0.001):
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f"Unsupported profile mode: {mode}. Use one of {PROFILE_MODES}."
+            )
+
+        self.mode = mode
+        self.stages = list(stages or [])
+        self.functions = list(functions or [])
+        self.interval = interval
+        self.whole_run = not self.stages and not self.functions
+        self._depth = 0
+        self._stopped_run = False
+        # (module, name, original function) of each wrapped function
+        self._originals = []
+
+        if mode == "cprofile":
+            import cProfile
+
+            self._profile = cProfile.Profile()
+        else:
+            self._samples = collections.Counter()
+            self._thread_id = threading.get_ident()
+            self._active = threading.Event()
+            self._stopped = threading.Event()
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self._sampler.start()
+
+    def enable(self):
+        """
+        Start (or keep) collecting profile data. Calls can be nested.
+        """
+
+        self._depth += 1
+        if self._depth > 1:
+            return
+        if self.mode == "cprofile":
+            self._profile.enable()
+        else:
+            self._active.set()
+
+    def disable(self):
+        """
+        Stop collecting profile data when the outermost enable is closed.
+        """
+
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if self.mode == "cprofile":
+            self._profile.disable()
+        else:
+            self._active.clear()
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """
+        Profile a stage if it is selected (used as a context manager).
+        """
+
+        if stage not in self.stages:
+            yield
+            return
+
+        self.enable()
+        try:
+            yield
+        finally:
+            self.disable()
+
+    def wrap_functions(self, log_list):
+        """
+        Replace the selected functions of `engine.py` / `projection.py` by wrappers that profile each call (until the
+        profiler is stopped).
+
+        Parameters
+        ----------
+        log_list : list
+            The list that stores all log entries.
+
+        Returns
+        -------
+        list
+            The updated log list.
+        """
+
+        for name in self.functions:
+            for module_name in PROFILE_FUNCTION_MODULES:
+                module = importlib.import_module(module_name)
+                if callable(getattr(module, name, None)):
+                    original = getattr(module, name)
+                    self._originals.append((module, name, original))
+                    setattr(module, name, self._wrap(original))
+                    break
+            else:
+                log_list = read.log_message(
+                    f"WARNING! Function '{name}' not found for profiling.", log_list
+                )
+
+        return log_list
+
+    def _wrap(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.disable()
+
+        return wrapper
+
+    def _sample_loop(self):
+        """
+        Sample the call stack of the profiled thread while the profiler is active.
+        """
+
+        while not self._stopped.is_set():
+            if not self._active.wait(0.05):
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self._samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        """
+        Stop the profiler (and the sampling thread), and put back the original functions of the wrapped ones. Stopping
+        a stopped profiler does nothing.
+        """
+
+        global _active_profiler
+
+        if self._stopped_run:
+            return
+        self._stopped_run = True
+
+        for module, name, original in reversed(self._originals):
+            setattr(module, name, original)
+        self._originals = []
+
+        if self.whole_run:
+            self.disable()
+        if self.mode == "sampling":
+            self._active.clear()
+            self._stopped.set()
+            self._sampler.join()
+
+        if _active_profiler is self:
+            _active_profiler = None
+
+    def write(self, output_path, log_list):
+        """
+        Write the profile files in the output directory (next to the run log).
+
+        Parameters
+        ----------
+        output_path : str
+            The output directory.
+
+        log_list : list
+            The list that stores all log entries.
+
+        Returns
+        -------
+        list
+            The updated log list.
+        """
+
+        if self.mode == "cprofile":
+            import io
+            import pstats
+
+            profile_file = output_path + "\\" + "profile.prof"
+            self._profile.dump_stats(profile_file)
+
+            stats_file = output_path + "\\" + "profile_stats.txt"
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(50)
+            with open(stats_file, "w") as f:
+                f.write(stream.getvalue())
+
+            profile_files = [profile_file, stats_file]
+        else:
+            profile_file = output_path + "\\" + "profile_sampling.txt"
+            with open(profile_file, "w") as f:
+                for stack, count in self._samples.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            profile_files = [profile_file]
+
+        for profile_file in profile_files:
+            log_list = read.log_message(
+                f"Profile file has been created successfully in: {profile_file}",
+                log_list,
+            )
+
+        return log_list
+
+
+def start_profiler(user_input, log_list):
+    """
+    Create and start the profiler selected in the user input.
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    RunProfiler or None, list
+        The profiler (None if profiling is not requested) and the updated log list.
+    """
+
+    global _active_profiler
+
+    mode = user_input.get("profile", "")
+    if not mode:
+        return None, log_list
+
+    # A profiler left running by a failed run of this process must not profile this run
+    stop_active_profiler()
+
+    profiler = RunProfiler(
+        mode,
+        stages=_split_names(user_input.get("profileStages", "")),
+        functions=_split_names(user_input.get("profileFunctions", "")),
+    )
+    _active_profiler = profiler
+    log_list = profiler.wrap_functions(log_list)
+    if profiler.whole_run:
+        profiler.enable()
+
+    scope = "whole run"
+    if not profiler.whole_run:
+        scope = ", ".join(profiler.stages + profiler.functions)
+    log_list = read.log_message(
+        f"Profiler '{mode}' started ({scope}).",
+        log_list,
+    )
+
+    return profiler, log_list
+
+
+def stop_active_profiler():
+    """
+    Stop the profiler of the current run of this process, if any (e.g. after a failed run, which does not reach the
+    end of `main.run`), and put back the functions it has wrapped.
+    """
+
+    if _active_profiler is not None:
+        _active_profiler.stop()
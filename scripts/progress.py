@@ -0,0 +1,175 @@
+"""
+progress.py
+
+This module contains the progress reporting and the cooperative cancellation of long runs (model point batches, see
+`engine.run_model_point_batches`):
+- ProgressReporter : structured progress events (batch i of n, policies projected, policies per second and ETA), emitted
+                     at most once per interval ("progressInterval", in seconds) and always for the last batch. Each event
+                     is logged as a readable message and sent to a callback (e.g. the job server worker); without a
+                     callback, it is printed as one "PROGRESS {json}" line that the app parses from the run output.
+- CancelToken      : cancellation signal checked between model point batches. A run is cancelled when the cancel file
+                     exists ("cancelFile", by default the user input JSON path + ".cancel", written by the app or the job
+                     server) or when the process receives SIGINT / SIGTERM. The batches already projected are exported
+                     and `main.py` exits with EXIT_CANCELLED. Only the first signal is trapped: a second one stops the
+                     process as usual (e.g. when the current batch is too long to wait for).
+"""
+
+import json
+import os
+import signal
+import time
+import data_read as read
+
+# Exit code of a cancelled run (0 = completed, 1 = error)
+EXIT_CANCELLED = 3
+
+PROGRESS_PREFIX = "PROGRESS "
+
+
+class ProgressReporter:
+    """
+    Throttled progress events of a run over model point batches.
+
+    Parameters
+    ----------
+    n_batches : int
+        The number of model point batches.
+
+    n_policies : int
+        The total number of model points.
+
+    interval : float
+        The minimum time between two events, in seconds.
+
+    callback : callable
+        Optional function receiving each event dictionary. By default the events are printed as "PROGRESS {json}".
+    """
+
+    def __init__(self, n_batches, n_policies, interval=1.0, callback=None):
+        self.n_batches = n_batches
+        self.n_policies = n_policies
+        self.interval = interval
+        self.callback = callback
+        self.start_time = time.perf_counter()
+        self.last_event_time = None
+
+    def update(self, batch, policies_done, log_list):
+        """
+        Report the end of a batch. The event is emitted if the interval has passed since the last event, or if it is
+        the last batch.
+
+        Parameters
+        ----------
+        batch : int
+            The number of batches completed.
+
+        policies_done : int
+            The number of model points projected so far.
+
+        log_list : list
+            The list that stores all log entries.
+
+        Returns
+        -------
+        list
+            The updated log list.
+        """
+
+        now = time.perf_counter()
+        if (
+            batch < self.n_batches
+            and self.last_event_time is not None
+            and now - self.last_event_time < self.interval
+        ):
+            return log_list
+        self.last_event_time = now
+
+        elapsed = now - self.start_time
+        policies_per_second = policies_done / elapsed if elapsed > 0 else None
+        eta = (
+            (self.n_policies - policies_done) / policies_per_second
+            if policies_per_second
+            else None
+        )
+        event = {
+            "event": "progress",
+            "batch": batch,
+            "batches": self.n_batches,
+            "policies": policies_done,
+            "totalPolicies": self.n_policies,
+            "policiesPerSecond": policies_per_second,
+            "elapsedSeconds": elapsed,
+            "etaSeconds": eta,
+        }
+
+        message = f"Batch {batch}/{self.n_batches} completed: {policies_done:,}/{self.n_policies:,} policies"
+        if policies_per_second is not None:
+            message += f", {policies_per_second:,.0f} policies/s, ETA {eta:.1f} s"
+        log_list = read.log_message(message + ".", log_list)
+
+        if self.callback is not None:
+            self.callback(event)
+        else:
+            print(PROGRESS_PREFIX + json.dumps(event), flush=True)
+
+        return log_list
+
+
+class CancelToken:
+    """
+    Cancellation signal of a run, checked between model point batches.
+
+    Parameters
+    ----------
+    cancel_file : str
+        Optional path of the cancel file. The run is cancelled once the file exists, including when it was written
+        before the token is created (e.g. a cancel sent while the inputs are read). A cancel file left over from an
+        earlier run must be removed before the run starts (the app and the job server do so), and close removes it at
+        the end of the run.
+
+    handle_signals : bool
+        Whether SIGINT and SIGTERM cancel the run (instead of stopping the process immediately). Only possible in the
+        main thread. The first signal cancels the run and restores the previous handler of that signal, so a second one
+        stops the process. Processes stopped with a signal by their parent (e.g. the warm worker of the job server,
+        which is killed when a cancelled job does not reach a batch boundary) should not trap them.
+    """
+
+    def __init__(self, cancel_file=None, handle_signals=True):
+        self.cancel_file = cancel_file
+        self.signalled = False
+        self._previous_handlers = {}
+
+        if handle_signals:
+            for name in ["SIGINT", "SIGTERM"]:
+                try:
+                    sig = getattr(signal, name)
+                    self._previous_handlers[sig] = signal.signal(sig, self._handle)
+                except ValueError:
+                    # Not in the main thread
+                    break
+
+    def _handle(self, signum, frame):
+        self.signalled = True
+        if signum in self._previous_handlers:
+            signal.signal(signum, self._previous_handlers.pop(signum))
+
+    def is_set(self):
+        """
+        Check whether the run has been cancelled.
+        """
+
+        return self.signalled or bool(
+            self.cancel_file and os.path.exists(self.cancel_file)
+        )
+
+    def close(self):
+        """
+        Restore the signal handlers and remove the cancel file.
+        """
+
+        for sig, handler in self._previous_handlers.items():
+            signal.signal(sig, handler)
+        self._previous_handlers = {}
+
+        if self.cancel_file and os.path.exists(self.cancel_file):
+            os.remove(self.cancel_file)
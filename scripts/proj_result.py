@@ -0,0 +1,528 @@
+"""
+proj_result.py
+
+This module contains the ProjectionResult container, which holds the full cashflow projection of a run in a single
+preallocated 2-D float block (rows x columns) plus a column index.
+
+Each projection stage in `engine.py` writes its columns directly into the block, so the output table no longer needs to be
+assembled by concatenating one dataframe per stage. Cashflow items that are shared between funds (e.g. Insurance_Charge_PP,
+Wakalah_Fee_PP, Unit_InvCharge_PP and Surplus_to_SHF_PP) are stored only once.
+
+Rows are ordered by policy and then by projection month (i.e. row = policy * n_months + month). The block is stored in
+column-major order so that every column is a contiguous array and can be exposed as a (policies x months) view.
+
+Flags and counters (e.g. is_Cover, Pol_Month) can optionally be held outside the float block in their own compact arrays
+(bool or int16), which is used by the single precision mode of the engine to reduce memory.
+
+The RaggedResult container holds the same columns for model points with different terms without padding: the values of
+each column are one flat array of the active periods of every policy, policy after policy, with the offset and the
+number of periods of each policy (the layout of Arrow list arrays). Its memory grows with the sum of the policy terms
+instead of the number of policies times the longest term.
+"""
+
+import numpy as np
+
+
+class ProjectionResult:
+    """
+    Container for the cashflow projection of one or more model points.
+
+    Parameters
+    ----------
+    columns : List
+        The column names of the projection. Duplicated names are only stored once (first occurrence).
+
+    n_policies : int
+        The number of model points (policies) projected.
+
+    n_months : int
+        The number of projection time steps (months for the monthly engine, years for the annual engine).
+
+    int_columns : List
+        The columns holding integer values (e.g. T_Index, Pol_Year). They are converted to integer when exported.
+
+    dtype : str
+        The NumPy data type of the block.
+
+    column_dtypes : dict
+        Optional {column: dtype} for columns stored in their own compact array instead of the float block
+        (e.g. {"is_Cover": "bool", "Pol_Month": "int16"}).
+
+    steps_per_year : int
+        The number of projection time steps per year (12 = monthly, 1 = annual).
+
+    Notes
+    -----
+    Example:
+
+        result = ProjectionResult(["T_Index", "Profit_IF"], n_policies=1, n_months=1200)
+        result["T_Index"][:] = np.arange(1, 1201)   # write in place
+        df = result.to_frame()                      # zero-copy DataFrame view for export
+    """
+
+    def __init__(
+        self,
+        columns,
+        n_policies=1,
+        n_months=1200,
+        int_columns=(),
+        dtype="float64",
+        column_dtypes=None,
+        steps_per_year=12,
+    ):
+        self.columns = list(dict.fromkeys(columns))
+        self.n_policies = int(n_policies)
+        self.n_months = int(n_months)
+        self.dtype = np.dtype(dtype)
+        self.steps_per_year = int(steps_per_year)
+
+        # Columns held in their own compact array (flags and counters)
+        column_dtypes = column_dtypes or {}
+        self.compact = {
+            col: np.zeros((self.n_policies, self.n_months), dtype=col_dtype)
+            for col, col_dtype in column_dtypes.items()
+            if col in self.columns
+        }
+
+        # Columns held in the float block
+        self.block_columns = [col for col in self.columns if col not in self.compact]
+        self.col_index = {col: i for i, col in enumerate(self.block_columns)}
+        self.int_columns = [col for col in int_columns if col in self.columns]
+        self.block = np.zeros(
+            (self.n_policies * self.n_months, len(self.block_columns)),
+            dtype=self.dtype,
+            order="F",
+        )
+
+    def __contains__(self, col):
+        return col in self.col_index or col in self.compact
+
+    def __getitem__(self, col):
+        return self.column(col)
+
+    def __setitem__(self, col, values):
+        self.column(col)[...] = values
+
+    @property
+    def nbytes(self):
+        """
+        The total memory (in bytes) held by the result.
+        """
+
+        return self.block.nbytes + sum(arr.nbytes for arr in self.compact.values())
+
+    def column(self, col):
+        """
+        Get a writable (policies x months) view of a column.
+
+        Parameters
+        ----------
+        col : str
+            The column name.
+
+        Returns
+        -------
+        ndarray
+            A view into the block (or the compact array of the column). Writing to it updates the result in place.
+        """
+
+        if col in self.compact:
+            return self.compact[col]
+
+        return self.block[:, self.col_index[col]].reshape(
+            self.n_policies, self.n_months
+        )
+
+    def policy(self, policy_id):
+        """
+        Get a (months x columns) view of the float block rows of a single policy.
+
+        Parameters
+        ----------
+        policy_id : int
+            The position of the policy in the result (0-based).
+
+        Returns
+        -------
+        ndarray
+            A view into the block. The columns follow `block_columns`.
+        """
+
+        start = policy_id * self.n_months
+
+        return self.block[start : start + self.n_months, :]
+
+    def to_numpy(self):
+        """
+        Get the underlying (rows x columns) float block without copying.
+
+        Returns
+        -------
+        ndarray
+            The projection block. The columns follow `block_columns`.
+        """
+
+        return self.block
+
+    def to_frame(self, columns=None):
+        """
+        Expose the projection as a pandas DataFrame.
+
+        Parameters
+        ----------
+        columns : List
+            Optional subset of columns. By default all columns are returned.
+
+        Returns
+        -------
+        DataFrame
+            The projection table. The float columns share memory with the block (no copy) when all columns are
+            requested; only the integer and compact columns are converted.
+        """
+
+        import pandas as pd
+
+        if columns is None:
+            proj_df = pd.DataFrame(self.block, columns=self.block_columns, copy=False)
+            columns = self.columns
+        else:
+            block_cols = [col for col in columns if col in self.col_index]
+            col_ids = [self.col_index[col] for col in block_cols]
+            proj_df = pd.DataFrame(self.block[:, col_ids], columns=block_cols)
+
+        for col in self.int_columns:
+            if col in proj_df.columns:
+                proj_df[col] = proj_df[col].astype(np.int64)
+
+        # Put back the compact columns at their position
+        for position, col in enumerate(columns):
+            if col in self.compact:
+                values = self.compact[col].ravel()
+                if col in self.int_columns:
+                    values = values.astype(np.int64)
+                proj_df.insert(position, col, values)
+
+        return proj_df
+
+
+class RaggedResult:
+    """
+    Ragged container for the projection of model points with different numbers of active periods.
+
+    Policy p holds the rows offsets[p] to offsets[p + 1] - 1 of every column, i.e. its first lengths[p] periods. The
+    periods after them are nil and are not stored.
+
+    Parameters
+    ----------
+    columns : List
+        The column names of the projection. Duplicated names are only stored once (first occurrence).
+
+    lengths : array-like
+        The number of periods held for each policy (at most n_months).
+
+    n_months : int
+        The number of projection time steps of the padded layout (see to_padded).
+
+    int_columns, dtype, column_dtypes, steps_per_year : List, str, dict, int
+        See ProjectionResult.
+
+    Notes
+    -----
+    Example:
+
+        ragged = RaggedResult.from_padded(result, lengths)   # keep the first lengths[p] periods of each policy
+        ragged["Profit_IF"][ragged.offsets[p] : ragged.offsets[p + 1]]  # values of policy p (view)
+        padded = ragged.to_padded()                          # zero-filled ProjectionResult
+    """
+
+    def __init__(
+        self,
+        columns,
+        lengths,
+        n_months=1200,
+        int_columns=(),
+        dtype="float64",
+        column_dtypes=None,
+        steps_per_year=12,
+    ):
+        self.columns = list(dict.fromkeys(columns))
+        self.lengths = np.asarray(lengths, dtype=np.int64).ravel()
+        self.n_policies = self.lengths.size
+        self.n_months = int(n_months)
+        self.dtype = np.dtype(dtype)
+        self.steps_per_year = int(steps_per_year)
+        if np.any(self.lengths < 0) or np.any(self.lengths > self.n_months):
+            raise ValueError(
+                f"The number of periods of each policy must be between 0 and {self.n_months}."
+            )
+
+        self.offsets = np.zeros(self.n_policies + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.n_rows = int(self.offsets[-1])
+
+        # Columns held in their own compact array (flags and counters)
+        column_dtypes = column_dtypes or {}
+        self.compact = {
+            col: np.zeros(self.n_rows, dtype=col_dtype)
+            for col, col_dtype in column_dtypes.items()
+            if col in self.columns
+        }
+
+        # Columns held in the float block
+        self.block_columns = [col for col in self.columns if col not in self.compact]
+        self.col_index = {col: i for i, col in enumerate(self.block_columns)}
+        self.int_columns = [col for col in int_columns if col in self.columns]
+        self.block = np.zeros(
+            (self.n_rows, len(self.block_columns)), dtype=self.dtype, order="F"
+        )
+
+    @classmethod
+    def from_padded(cls, result, lengths, columns=None, empty_columns=()):
+        """
+        Create a ragged result from the first periods of each policy of a ProjectionResult.
+
+        Parameters
+        ----------
+        result : ProjectionResult
+            The padded projection result.
+
+        lengths : array-like
+            The number of leading periods kept for each policy.
+
+        columns : List
+            Optional subset of columns. By default all columns are kept.
+
+        empty_columns : List
+            Columns allocated at zero instead of being copied (e.g. columns still to be generated).
+
+        Returns
+        -------
+        RaggedResult
+            The ragged result, with the same data types as the padded result.
+        """
+
+        columns = result.columns if columns is None else columns
+        ragged = cls(
+            columns,
+            lengths,
+            n_months=result.n_months,
+            int_columns=result.int_columns,
+            dtype=result.dtype,
+            column_dtypes={col: arr.dtype for col, arr in result.compact.items()},
+            steps_per_year=result.steps_per_year,
+        )
+        mask = ragged.padding_mask()
+        for col in ragged.columns:
+            if col not in empty_columns:
+                ragged[col] = result[col][mask]
+
+        return ragged
+
+    def __contains__(self, col):
+        return col in self.col_index or col in self.compact
+
+    def __getitem__(self, col):
+        return self.column(col)
+
+    def __setitem__(self, col, values):
+        self.column(col)[...] = values
+
+    @property
+    def nbytes(self):
+        """
+        The total memory (in bytes) held by the result.
+        """
+
+        return (
+            self.block.nbytes
+            + sum(arr.nbytes for arr in self.compact.values())
+            + self.offsets.nbytes
+            + self.lengths.nbytes
+        )
+
+    def column(self, col):
+        """
+        Get a writable flat (rows) view of a column.
+
+        Parameters
+        ----------
+        col : str
+            The column name.
+
+        Returns
+        -------
+        ndarray
+            A view into the block (or the compact array of the column). Writing to it updates the result in place.
+        """
+
+        if col in self.compact:
+            return self.compact[col]
+
+        return self.block[:, self.col_index[col]]
+
+    def policy(self, policy_id):
+        """
+        Get a (periods x columns) view of the float block rows of a single policy.
+
+        Parameters
+        ----------
+        policy_id : int
+            The position of the policy in the result (0-based).
+
+        Returns
+        -------
+        ndarray
+            A view into the block, with lengths[policy_id] rows. The columns follow `block_columns`.
+        """
+
+        return self.block[self.offsets[policy_id] : self.offsets[policy_id + 1], :]
+
+    def padding_mask(self):
+        """
+        Get the (policies x months) mask of the periods held in the ragged layout.
+
+        Returns
+        -------
+        ndarray
+            True for the first lengths[p] periods of each policy p.
+        """
+
+        return np.arange(self.n_months) < self.lengths[:, np.newaxis]
+
+    def period_index(self, start=0, stop=None):
+        """
+        Get the period (0-based) of each row of a range of policies.
+
+        Parameters
+        ----------
+        start, stop : int
+            The range of policies (all policies by default).
+
+        Returns
+        -------
+        ndarray
+            The period of each row from offsets[start] to offsets[stop] - 1.
+        """
+
+        stop = self.n_policies if stop is None else stop
+        first_rows = self.offsets[start:stop] - self.offsets[start]
+
+        return np.arange(
+            self.offsets[stop] - self.offsets[start], dtype=np.int64
+        ) - np.repeat(first_rows, self.lengths[start:stop])
+
+    def sum_by_policy(self, values):
+        """
+        Sum flat (rows) values over the periods of each policy.
+
+        Parameters
+        ----------
+        values : ndarray
+            The values of every row (e.g. a column or a product of columns).
+
+        Returns
+        -------
+        ndarray
+            The float64 sum of each policy, added in period order (0 for a policy without period).
+        """
+
+        sums = np.zeros(self.n_policies)
+        held = self.lengths > 0
+        if np.any(held):
+            # each reduceat segment ends at the next start, so the policies without period are left out
+            sums[held] = np.add.reduceat(
+                values, self.offsets[:-1][held], dtype=np.float64
+            )
+
+        return sums
+
+    def sum_by_period(self, values, start=0, stop=None, n_periods=None):
+        """
+        Sum flat (rows) values over a range of policies for each period.
+
+        Parameters
+        ----------
+        values : ndarray
+            The values of every row (e.g. a column).
+
+        start, stop : int
+            The range of policies summed (all policies by default).
+
+        n_periods : int
+            The number of periods of the sums (n_months by default).
+
+        Returns
+        -------
+        ndarray
+            The float64 sum of each period, added in policy order (the same as a sum over the policies of the padded
+            layout).
+        """
+
+        stop = self.n_policies if stop is None else stop
+
+        return np.bincount(
+            self.period_index(start, stop),
+            weights=values[self.offsets[start] : self.offsets[stop]],
+            minlength=n_periods or self.n_months,
+        )
+
+    def to_padded(self, columns=None):
+        """
+        Convert to the padded (policies x months) layout.
+
+        Parameters
+        ----------
+        columns : List
+            Optional subset of columns. By default all columns are converted.
+
+        Returns
+        -------
+        ProjectionResult
+            The padded result, zero-filled after the periods of each policy (including the columns defined beyond
+            them in the original projection, e.g. T_Index or the discount factors).
+        """
+
+        columns = self.columns if columns is None else columns
+        padded = ProjectionResult(
+            columns,
+            n_policies=self.n_policies,
+            n_months=self.n_months,
+            int_columns=self.int_columns,
+            dtype=self.dtype,
+            column_dtypes={col: arr.dtype for col, arr in self.compact.items()},
+            steps_per_year=self.steps_per_year,
+        )
+        mask = self.padding_mask()
+        for col in padded.columns:
+            padded[col][mask] = self[col]
+
+        return padded
+
+    def to_frame(self, columns=None):
+        """
+        Expose the projection as a pandas DataFrame in long format (one row per policy and period held).
+
+        Parameters
+        ----------
+        columns : List
+            Optional subset of columns. By default all columns are returned.
+
+        Returns
+        -------
+        DataFrame
+            The projection table, with the position of the policy ("Policy_ID") in front.
+        """
+
+        import pandas as pd
+
+        columns = self.columns if columns is None else columns
+        proj_df = pd.DataFrame(
+            {"Policy_ID": np.repeat(np.arange(self.n_policies), self.lengths)}
+        )
+        for col in columns:
+            values = self[col]
+            if col in self.int_columns:
+                values = values.astype(np.int64)
+            proj_df[col] = values
+
+        return proj_df
@@ -0,0 +1,195 @@
+"""
+reduction.py
+
+This module contains the deterministic reduction of the aggregates of model point file runs (policy counts and inforce
+cashflows summed over the policies, see `engine.run_model_point_batches`).
+
+Floating-point addition is not associative, so a plain running sum over batches or shards changes in the last bits with
+the batch size, the number of shards and the number of workers. Instead, the model points are split into fixed blocks of
+REDUCTION_BLOCK_SIZE policies (by their row in the model point file), and:
+1. each block is summed on its own, in policy order,
+2. the block sums are combined along a fixed binary tree over the blocks: a node is the sum of its left and right child,
+   and the nodes left at the end (the binary decomposition of the number of blocks) are added from right to left.
+
+A batch or a shard projects a contiguous range of whole blocks and keeps the tree nodes it can complete (at most two per
+tree level). The nodes of consecutive ranges are merged in block order into the same tree, so the totals are
+bit-identical whatever the batch size, the shards and the number of workers. The extra cost over a plain sum is one
+addition of a (months) array per block.
+"""
+
+import numpy as np
+
+# Number of model points per reduction block (the batch sizes and shard boundaries are multiples of it)
+REDUCTION_BLOCK_SIZE = 1000
+
+
+def get_block_aligned_size(n_policies, block_size=REDUCTION_BLOCK_SIZE):
+    """
+    Round a number of policies (e.g. a batch size) up to a whole number of reduction blocks.
+
+    Parameters
+    ----------
+    n_policies : int
+        The number of policies.
+
+    block_size : int
+        The number of policies per reduction block.
+
+    Returns
+    -------
+    int
+        The smallest multiple of block_size not below n_policies (at least one block).
+    """
+
+    return max(1, -(-n_policies // block_size)) * block_size
+
+
+class BlockReduction:
+    """
+    Deterministic sum of per-policy arrays over fixed model point blocks and a fixed binary tree of blocks.
+
+    Each tree node is held as (level, index, sums): it covers the blocks index * 2**level to (index + 1) * 2**level - 1,
+    and sums is a dictionary of (months) float64 arrays. The nodes must be added in block order, without gaps.
+
+    Parameters
+    ----------
+    block_size : int
+        The number of policies per reduction block.
+    """
+
+    def __init__(self, block_size=REDUCTION_BLOCK_SIZE):
+        self.block_size = block_size
+        self.nodes = []
+
+    def add_node(self, level, index, sums):
+        """
+        Add a tree node after the current nodes, and merge it with its left sibling as far as possible.
+
+        Parameters
+        ----------
+        level : int
+            The tree level of the node (0 for a single block).
+
+        index : int
+            The index of the node in its level.
+
+        sums : dict
+            The sums of the node ({column: array}).
+        """
+
+        self.nodes.append((level, index, sums))
+        while len(self.nodes) >= 2:
+            left_level, left_index, left_sums = self.nodes[-2]
+            right_level, right_index, right_sums = self.nodes[-1]
+            if (
+                left_level != right_level
+                or left_index % 2
+                or right_index != left_index + 1
+            ):
+                break
+            self.nodes[-2:] = [
+                (
+                    left_level + 1,
+                    left_index // 2,
+                    {col: left_sums[col] + right_sums[col] for col in left_sums},
+                )
+            ]
+
+    def add_policies(self, values, first_policy, n_periods=None):
+        """
+        Sum the policies of a contiguous range of blocks and add them to the tree.
+
+        Parameters
+        ----------
+        values : dict
+            The (policies x months) arrays to sum ({column: array}).
+
+        first_policy : int
+            The row of the first policy in the model point file. It must be the first policy of a block.
+
+        n_periods : int
+            Optional number of periods of the sums, when the arrays only hold the first periods (the sums are
+            zero-filled after them).
+        """
+
+        if first_policy % self.block_size:
+            raise ValueError(
+                f"The policies added to the reduction must start on a block boundary (policy {first_policy} is not a "
+                f"multiple of {self.block_size})."
+            )
+
+        n_policies, n_values = next(iter(values.values())).shape
+        for start in range(0, n_policies, self.block_size):
+            sums = {}
+            for col, array in values.items():
+                sums[col] = np.zeros(n_periods or n_values)
+                array[start : start + self.block_size].sum(
+                    axis=0, dtype=np.float64, out=sums[col][:n_values]
+                )
+            self.add_node(0, (first_policy + start) // self.block_size, sums)
+
+    def add_ragged_policies(self, result, columns, first_policy, n_periods=None):
+        """
+        Sum the policies of a ragged result (see `proj_result.RaggedResult`) by block and add them to the tree. The
+        block sums are the same as for the padded layout of the result (see add_policies).
+
+        Parameters
+        ----------
+        result : RaggedResult
+            The ragged result of a contiguous range of blocks.
+
+        columns : List
+            The columns to sum.
+
+        first_policy : int
+            The row of the first policy in the model point file. It must be the first policy of a block.
+
+        n_periods : int
+            Optional number of periods of the sums (the n_months of the result by default).
+        """
+
+        if first_policy % self.block_size:
+            raise ValueError(
+                f"The policies added to the reduction must start on a block boundary (policy {first_policy} is not a "
+                f"multiple of {self.block_size})."
+            )
+
+        for start in range(0, result.n_policies, self.block_size):
+            stop = min(start + self.block_size, result.n_policies)
+            sums = {
+                col: result.sum_by_period(result[col], start, stop, n_periods)
+                for col in columns
+            }
+            self.add_node(0, (first_policy + start) // self.block_size, sums)
+
+    def merge(self, nodes):
+        """
+        Add the nodes of the next range of blocks (e.g. of a checkpointed batch or of a shard).
+
+        Parameters
+        ----------
+        nodes : List
+            The nodes of the range (see the nodes attribute), in block order.
+        """
+
+        for level, index, sums in nodes:
+            self.add_node(level, index, sums)
+
+    def total(self):
+        """
+        Get the total of all the blocks added: the remaining nodes are added from right to left.
+
+        Returns
+        -------
+        dict or None
+            The total ({column: array}), or None if no block has been added.
+        """
+
+        if not self.nodes:
+            return None
+
+        total = dict(self.nodes[-1][2])
+        for level, index, sums in reversed(self.nodes[:-1]):
+            total = {col: sums[col] + total[col] for col in total}
+
+        return total
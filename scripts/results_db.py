@@ -0,0 +1,296 @@
+"""
+results_db.py
+
+This module handles the optional SQLite results store. Each run writes its metadata (the user input and the model point
+profile), the present value results and the inforce monthly cashflows into a single local database file, so that results
+from many runs can be compared with a simple SQL query instead of opening individual output spreadsheets.
+
+The store is written by `main.py` when the user provides a database path in the Output Settings ("resultsDbPath").
+All tables are keyed by run, model point (policy) and scenario so that the same layout can hold seriatim and stochastic
+runs. The policies are numbered by their row in the model point file from 1 (the model point of the workbook is policy
+1). Results summed over the policies (the cashflows of model point file runs, the cashflows and PVs of new business
+cohort runs) are stored as policy 0, which has no model point profile. Runs are deterministic (scenario 0).
+"""
+
+import sqlite3
+import json
+import datetime
+import numpy as np
+import data_read as read
+import engine as eng
+
+
+# ================================
+#  DATABASE SCHEMA
+# ================================
+# - runs             : one row per run, with the user input stored as JSON for audit.
+# - model_points     : the profile of each model point of the run (age, gender, term, sum assured, contribution).
+# - pv_results       : present value of each cashflow item, per run / policy / scenario.
+# - monthly_cashflows: inforce cashflows in long format, per run / policy / scenario / cashflow / projection time step
+#                      (months, or years for annual time step runs).
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_name TEXT,
+    run_timestamp TEXT,
+    model_file_path TEXT,
+    user_input TEXT
+);
+
+CREATE TABLE IF NOT EXISTS model_points (
+    run_id INTEGER NOT NULL,
+    policy_id INTEGER NOT NULL,
+    age INTEGER,
+    gender TEXT,
+    pol_year INTEGER,
+    sum_assured REAL,
+    contribution_per_year REAL,
+    PRIMARY KEY (run_id, policy_id)
+);
+
+CREATE TABLE IF NOT EXISTS pv_results (
+    run_id INTEGER NOT NULL,
+    policy_id INTEGER NOT NULL,
+    scenario INTEGER NOT NULL,
+    cashflow TEXT NOT NULL,
+    timing TEXT,
+    present_value REAL
+);
+
+CREATE TABLE IF NOT EXISTS monthly_cashflows (
+    run_id INTEGER NOT NULL,
+    policy_id INTEGER NOT NULL,
+    scenario INTEGER NOT NULL,
+    cashflow TEXT NOT NULL,
+    t_index INTEGER NOT NULL,
+    value REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_pv_results_key
+    ON pv_results (run_id, policy_id, scenario, cashflow);
+CREATE INDEX IF NOT EXISTS idx_pv_results_cashflow
+    ON pv_results (cashflow, run_id);
+CREATE INDEX IF NOT EXISTS idx_monthly_cashflows_key
+    ON monthly_cashflows (run_id, policy_id, scenario, cashflow);
+CREATE INDEX IF NOT EXISTS idx_model_points_gender
+    ON model_points (gender, run_id);
+"""
+
+
+def open_results_db(db_path):
+    """
+    Open (and create if needed) the SQLite results database.
+
+    Parameters
+    ----------
+    db_path : str
+        The file path to the SQLite database.
+
+    Returns
+    -------
+    Connection
+        An open sqlite3 connection with the results schema in place.
+
+    Notes
+    -----
+    WAL journaling and NORMAL synchronous mode are used so that bulk inserts are not flushed to disk row by row.
+    """
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA_SQL)
+
+    return conn
+
+
+def write_run_results(
+    db_path,
+    user_input,
+    model_points,
+    cf_proj_table,
+    pv_results,
+    log_list,
+    aggregated=False,
+    scenario=0,
+):
+    """
+    Write the run metadata, model points, PV results and inforce monthly cashflows of a run into the SQLite results
+    database.
+
+    Parameters
+    ----------
+    db_path : str
+        The file path to the SQLite database.
+
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    model_points : dict or None
+        The per-policy arrays of the model points projected (see `engine.MODEL_POINT_KEYS`), stored as policies 1 to
+        n. None when the PV results are summed over the policies (new business cohort runs).
+
+    cf_proj_table : DataFrame
+        The cashflow projection table at the projection time step (not rolled up to the output granularity).
+
+    pv_results : DataFrame
+        A DataFrame containing the PV results (columns "Cashflow", "Timing" and "Present_Value", and "Policy_ID", the
+        0-based row of the model point, when the run has more than one policy).
+
+    log_list : list
+        The list that stores all log entries.
+
+    aggregated : bool
+        Whether the cashflow projection table is summed over the policies (model point file and cohort runs). It is
+        then stored as policy 0, otherwise as policy 1.
+
+    scenario : int
+        The scenario identifier used as key in the database (0 = deterministic run).
+
+    Returns
+    -------
+    int, list
+        The run identifier assigned by the database and the updated log list.
+
+    Notes
+    -----
+    All rows of a run are written in a single transaction using bulk inserts (executemany).
+    Only the inforce cashflow columns (i.e. column name ending with '_IF') are stored in monthly_cashflows.
+    """
+
+    conn = open_results_db(db_path)
+
+    try:
+        with conn:
+            # Run metadata
+            cursor = conn.execute(
+                "INSERT INTO runs (run_name, run_timestamp, model_file_path, user_input) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    user_input.get("outputFileName"),
+                    datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    user_input.get("filePath"),
+                    json.dumps(user_input),
+                ),
+            )
+            run_id = cursor.lastrowid
+
+            # Model point profiles (policies 1 to n)
+            if model_points is not None:
+                profiles = [
+                    np.asarray(model_points[key]).ravel().tolist()
+                    for key in eng.MODEL_POINT_KEYS
+                ]
+                conn.executemany(
+                    "INSERT INTO model_points VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip(
+                        [run_id] * len(profiles[0]),
+                        range(1, len(profiles[0]) + 1),
+                        *profiles,
+                    ),
+                )
+
+            # PV results, by policy (policy 0 for the PVs summed over the policies of a cohort run)
+            if "Policy_ID" in pv_results:
+                policy_ids = (pv_results["Policy_ID"].to_numpy() + 1).tolist()
+            else:
+                policy_ids = [1 if model_points is not None else 0] * len(pv_results)
+            pv_rows = [
+                (run_id, policy_id, scenario, cashflow, timing, float(value))
+                for policy_id, (cashflow, timing, value) in zip(
+                    policy_ids,
+                    pv_results[["Cashflow", "Timing", "Present_Value"]].itertuples(
+                        index=False
+                    ),
+                )
+            ]
+            conn.executemany(
+                "INSERT INTO pv_results VALUES (?, ?, ?, ?, ?, ?)", pv_rows
+            )
+
+            # Inforce monthly cashflows, in long format.
+            # Items shared between funds (e.g. Insurance_Charge_IF) appear more than once in the
+            # projection table, so each cashflow name is stored once (first occurrence).
+            cf_unique = cf_proj_table.loc[:, ~cf_proj_table.columns.duplicated()]
+            t_index = cf_unique["T_Index"].tolist()
+            policy_id = 0 if aggregated else 1
+            if_cols = [col for col in cf_unique.columns if col.endswith("_IF")]
+            for col in if_cols:
+                conn.executemany(
+                    "INSERT INTO monthly_cashflows VALUES (?, ?, ?, ?, ?, ?)",
+                    zip(
+                        [run_id] * len(t_index),
+                        [policy_id] * len(t_index),
+                        [scenario] * len(t_index),
+                        [col] * len(t_index),
+                        t_index,
+                        cf_unique[col].astype(float).tolist(),
+                    ),
+                )
+    finally:
+        conn.close()
+
+    log_list = read.log_message(
+        f"Results written to SQLite results database: {db_path} (run_id = {run_id}).",
+        log_list,
+    )
+
+    return run_id, log_list
+
+
+def query_pv_by_run(db_path, cashflow, **model_point_filters):
+    """
+    Query the present value of a cashflow item for every run in the database.
+
+    Parameters
+    ----------
+    db_path : str
+        The file path to the SQLite database.
+
+    cashflow : str
+        The PV item to be queried (e.g. "PV_Profit_IF").
+
+    **model_point_filters
+        Optional equality filters on the model_points table (e.g. gender="Female", pol_year=20).
+
+    Returns
+    -------
+    DataFrame
+        A DataFrame with columns run_id, run_name, policy_id, scenario and present_value. Without filter, the PVs
+        summed over the policies (policy 0) are included.
+
+    Notes
+    -----
+    Example: PV of profit by run for female model points
+
+        query_pv_by_run("results.db", "PV_Profit_IF", gender="Female")
+    """
+
+    import pandas as pd
+
+    allowed = {"age", "gender", "pol_year", "sum_assured", "contribution_per_year"}
+    unknown = set(model_point_filters) - allowed
+    if unknown:
+        raise ValueError(f"Unsupported model point filter(s): {sorted(unknown)}")
+
+    sql = (
+        "SELECT r.run_id, r.run_name, p.policy_id, p.scenario, p.present_value "
+        "FROM pv_results p "
+        "LEFT JOIN model_points m ON m.run_id = p.run_id AND m.policy_id = p.policy_id "
+        "JOIN runs r ON r.run_id = p.run_id "
+        "WHERE p.cashflow = ?"
+    )
+    params = [cashflow]
+    for key, value in model_point_filters.items():
+        sql += f" AND m.{key} = ?"
+        params.append(value)
+    sql += " ORDER BY r.run_id, p.policy_id, p.scenario"
+
+    conn = open_results_db(db_path)
+    try:
+        result_df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+    return result_df
@@ -0,0 +1,275 @@
+"""
+run_metrics.py
+
+This module contains the run instrumentation. Every stage of a run (workbook read, each projection stage, PV calculation
+and export) can be measured with:
+- the wall time and the CPU time of the stage,
+- the peak traced memory during the stage and the memory kept after it (traced with `tracemalloc`),
+- the throughput in policies and projection rows per second.
+
+Each measurement is logged in the run log and kept in a metrics dictionary, which is written to a machine-readable
+"run_metrics.json" file next to the output so that the time and memory of production runs can be compared without
+attaching a profiler.
+
+Memory tracing slows down code that allocates many small Python objects (e.g. the workbook read with openpyxl), so it
+can be switched off ("traceMemory" = false) when only the timings are needed.
+
+The start-up report (`import_modules`) records the import time of the heavy modules (numpy, pandas, openpyxl), which
+dominates small single-policy runs.
+
+Example:
+
+    metrics = start_run_metrics()
+    with measure_stage("read_pricing_model_data", metrics, log_list):
+        pricing_model_data, log_list = read.read_pricing_model_data(user_input, log_list)
+    log_list = write_run_metrics(metrics, output_path, log_list)
+"""
+
+import contextlib
+import datetime
+import json
+import time
+import tracemalloc
+import data_read as read
+
+METRICS_FILE_NAME = "run_metrics.json"
+
+
+def start_run_metrics(trace_memory=True, profiler=None):
+    """
+    Start the memory tracing and create the metrics dictionary of a run.
+
+    Parameters
+    ----------
+    trace_memory : bool
+        Whether the memory is traced with tracemalloc. If False, only the times and throughputs are measured.
+
+    profiler : RunProfiler
+        Optional profiler (see `profiler.py`). The stages selected in the profiler are profiled by measure_stage.
+
+    Returns
+    -------
+    dict
+        The metrics dictionary with keys "run_timestamp", "trace_memory", "profiler", "start_wall_time",
+        "start_cpu_time", "cancelled", "equivalence" (the summary of the equivalence check, None if not run) and
+        "stages".
+    """
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    return {
+        "run_timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "trace_memory": trace_memory,
+        "profiler": profiler,
+        "start_wall_time": time.perf_counter(),
+        "start_cpu_time": time.process_time(),
+        "cancelled": False,
+        "equivalence": None,
+        "stages": [],
+    }
+
+
+@contextlib.contextmanager
+def measure_stage(stage, metrics, log_list, n_policies=None, n_rows=None):
+    """
+    Measure the wall time, CPU time and memory of a stage (used as a context manager).
+
+    Parameters
+    ----------
+    stage : str
+        The stage name (e.g. "generate_unit_fund_columns").
+
+    metrics : dict
+        The metrics dictionary from start_run_metrics. If None, the stage is not measured.
+
+    log_list : list
+        The list that stores all log entries. The stage metrics are appended to it.
+
+    n_policies : int
+        Optional number of policies processed by the stage, for the policies per second throughput.
+
+    n_rows : int
+        Optional number of projection rows (policies x time steps) processed by the stage, for the rows per second
+        throughput.
+
+    Notes
+    -----
+    Stages should not be nested, as the peak memory is reset at the start of each stage. When the stage is selected
+    in the profiler of the run, its times include the profiler overhead.
+    """
+
+    if metrics is None:
+        yield
+        return
+
+    profiler = metrics["profiler"]
+    stage_profile = (
+        profiler.stage(stage) if profiler is not None else contextlib.nullcontext()
+    )
+
+    trace_memory = metrics["trace_memory"]
+    if trace_memory:
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    with stage_profile:
+        yield
+
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    if trace_memory:
+        memory_end, memory_peak = tracemalloc.get_traced_memory()
+
+    stage_metrics = {
+        "stage": stage,
+        "wall_time_s": wall_time,
+        "cpu_time_s": cpu_time,
+        "peak_memory_mb": memory_peak / 1024**2 if trace_memory else None,
+        "stage_peak_memory_mb": (
+            (memory_peak - memory_start) / 1024**2 if trace_memory else None
+        ),
+        "memory_increase_mb": (
+            (memory_end - memory_start) / 1024**2 if trace_memory else None
+        ),
+        "policies": n_policies,
+        "rows": n_rows,
+        "policies_per_second": _per_second(n_policies, wall_time),
+        "rows_per_second": _per_second(n_rows, wall_time),
+    }
+    metrics["stages"].append(stage_metrics)
+
+    message = f"Stage '{stage}': wall time {wall_time:.4f} s, CPU time {cpu_time:.4f} s"
+    if trace_memory:
+        message += (
+            f", peak memory {stage_metrics['peak_memory_mb']:.2f} MB "
+            f"(+{stage_metrics['stage_peak_memory_mb']:.2f} MB in stage)"
+        )
+    if stage_metrics["rows_per_second"] is not None:
+        message += f", {stage_metrics['rows_per_second']:,.0f} rows/s"
+    read.log_message(message + ".", log_list)
+
+
+def import_modules(module_names, metrics, log_list):
+    """
+    Import modules one by one and record the import time of each of them (start-up report).
+
+    Parameters
+    ----------
+    module_names : List
+        The modules to be imported, in import order (e.g. ["numpy", "pandas"]). The time of each module only includes
+        the modules it imports that were not already loaded.
+
+    metrics : dict
+        The metrics dictionary from start_run_metrics. The import times are kept in metrics["import_times"].
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    list
+        The updated log list.
+
+    Notes
+    -----
+    The memory tracing is paused during the imports, as it slows them down several times.
+    """
+
+    import importlib
+
+    trace_memory = tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.stop()
+
+    import_times = {}
+    for name in module_names:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        import_times[name] = time.perf_counter() - start
+
+    if trace_memory:
+        tracemalloc.start()
+
+    if metrics is not None:
+        metrics["import_times"] = import_times
+
+    log_list = read.log_message(
+        f"Start-up: modules imported in {sum(import_times.values()):.4f} s ("
+        + ", ".join(f"{name} {seconds:.4f} s" for name, seconds in import_times.items())
+        + ").",
+        log_list,
+    )
+
+    return log_list
+
+
+def _per_second(count, wall_time):
+    """
+    Get a throughput per second, or None if the count is not known.
+    """
+
+    if count is None:
+        return None
+
+    return count / wall_time if wall_time > 0 else None
+
+
+def write_run_metrics(metrics, output_path, log_list):
+    """
+    Add the run totals to the metrics, stop the memory tracing and write the metrics to "run_metrics.json".
+
+    Parameters
+    ----------
+    metrics : dict
+        The metrics dictionary from start_run_metrics.
+
+    output_path : str
+        The output directory where the metrics file is written.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    list
+        The updated log list.
+    """
+
+    stages = metrics["stages"]
+    run_metrics = {
+        "run_timestamp": metrics["run_timestamp"],
+        "trace_memory": metrics["trace_memory"],
+        "cancelled": metrics["cancelled"],
+        "equivalence": metrics["equivalence"],
+        "total_wall_time_s": time.perf_counter() - metrics["start_wall_time"],
+        "total_cpu_time_s": time.process_time() - metrics["start_cpu_time"],
+        "peak_memory_mb": None,
+        "import_times": metrics.get("import_times", {}),
+        "stages": stages,
+    }
+
+    message = (
+        f"Run completed: wall time {run_metrics['total_wall_time_s']:.4f} s, "
+        f"CPU time {run_metrics['total_cpu_time_s']:.4f} s"
+    )
+    if metrics["trace_memory"]:
+        run_metrics["peak_memory_mb"] = max(
+            (s["peak_memory_mb"] for s in stages), default=0.0
+        )
+        tracemalloc.stop()
+        message += f", peak memory {run_metrics['peak_memory_mb']:.2f} MB"
+    log_list = read.log_message(message + ".", log_list)
+
+    metrics_file = output_path + "\\" + METRICS_FILE_NAME
+    with open(metrics_file, "w") as f:
+        json.dump(run_metrics, f, indent=4)
+
+    log_list = read.log_message(
+        f"Run metrics file has been created successfully in: {metrics_file}",
+        log_list,
+    )
+
+    return log_list
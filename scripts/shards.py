@@ -0,0 +1,547 @@
+"""
+shards.py
+
+This module contains the sharded execution of large model point file runs over several worker processes, possibly on
+different hosts sharing a filesystem, without any scheduler or external service:
+
+1. run   : every worker splits the model point file ("modelPointFile" of the user input) into the same deterministic
+           shards (contiguous ranges of whole reduction blocks of policies), claims the next free shard by creating its lock file (exclusive
+           create), projects it in model point batches and writes the shard result (cashflows aggregated over the
+           policies of the shard and their PV results). Workers keep claiming shards until none is left.
+2. merge : once every shard result is written, the shard aggregates are merged in shard order into the reduction tree
+           of the model point file (see `reduction.py`, so the totals do not depend on the number of shards or
+           workers), the PV tables (and profit metrics tables) are
+           concatenated and the output is written as a `main.py` run would (output columns, granularity and format of
+           the user input).
+
+The shard directory holds "shards.json" (input hash, number of shards and policies, written by the first worker), and
+one lock file and one result file per shard. Workers started with a different input or number of shards are rejected,
+and so is a merge with another input. Each lock holds the random token of its worker, which refreshes the lock after
+each model point batch (heartbeat) and only removes its own lock. A lock without result that has not been refreshed for
+`--stale-after` seconds (e.g. left by a worker that died) can be claimed again: it is first moved aside with an atomic
+rename, so only one worker can take it over. `--stale-after` must be longer than the projection of one batch.
+
+Usage (several local workers on one machine):
+
+    python shards.py run input.json --shard-dir shards --shards 16 &
+    python shards.py run input.json --shard-dir shards --shards 16 &
+    wait
+    python shards.py merge input.json --shard-dir shards
+"""
+
+import argparse
+import datetime
+import json
+import os
+import pickle
+import socket
+import sys
+import time
+import uuid
+import data_read as read
+import reduction as red
+
+SHARD_MANIFEST_FILE_NAME = "shards.json"
+
+
+def get_shard_ranges(n_policies, n_shards, block_size=red.REDUCTION_BLOCK_SIZE):
+    """
+    Split the policies into contiguous shards of (almost) equal numbers of reduction blocks.
+
+    Parameters
+    ----------
+    n_policies : int
+        The number of model points.
+
+    n_shards : int
+        The number of shards.
+
+    block_size : int
+        The number of policies per reduction block.
+
+    Returns
+    -------
+    List
+        The (start, stop) policy range of each shard. The first shards hold one more block than the last ones, and
+        shards are empty if there are fewer blocks than shards.
+    """
+
+    size, extra = divmod(-(-n_policies // block_size), n_shards)
+    ranges = []
+    start = 0
+    for shard in range(n_shards):
+        stop = min(
+            start + (size + (1 if shard < extra else 0)) * block_size, n_policies
+        )
+        ranges.append((start, stop))
+        start = stop
+
+    return ranges
+
+
+def _shard_file(shard_dir, shard, extension):
+    return os.path.join(shard_dir, f"shard_{shard:05d}.{extension}")
+
+
+def open_shard_set(shard_dir, user_input, n_shards, n_policies, log_list):
+    """
+    Create the shard manifest of a run, or check that the existing manifest is for the same run.
+
+    Parameters
+    ----------
+    shard_dir : str
+        The shard directory (shared by all the workers).
+
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    n_shards : int
+        The number of shards.
+
+    n_policies : int
+        The number of model points.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    dict, list
+        The shard manifest and the updated log list.
+    """
+
+    import checkpoint as ckp
+
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = {
+        "input_hash": ckp.compute_input_hash(user_input),
+        "n_shards": n_shards,
+        "n_policies": n_policies,
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    manifest_file = os.path.join(shard_dir, SHARD_MANIFEST_FILE_NAME)
+
+    try:
+        with open(manifest_file, "x") as f:
+            json.dump(manifest, f, indent=4)
+        log_list = read.log_message(
+            f"Shard manifest created in {manifest_file}: {n_shards} shards of {n_policies:,} policies.",
+            log_list,
+        )
+    except FileExistsError:
+        manifest = read_shard_manifest(shard_dir)
+        if manifest["input_hash"] != ckp.compute_input_hash(user_input) or (
+            manifest["n_shards"],
+            manifest["n_policies"],
+        ) != (n_shards, n_policies):
+            raise ValueError(
+                f"The shard directory {shard_dir} holds the shards of another run (different inputs or number of "
+                f"shards)."
+            )
+
+    return manifest, log_list
+
+
+def read_shard_manifest(shard_dir):
+    """
+    Read the shard manifest of a shard directory (waiting shortly if it is being written by another worker).
+    """
+
+    manifest_file = os.path.join(shard_dir, SHARD_MANIFEST_FILE_NAME)
+    for _ in range(50):
+        try:
+            with open(manifest_file, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            time.sleep(0.1)
+
+    with open(manifest_file, "r") as f:
+        return json.load(f)
+
+
+class ShardLockLost(RuntimeError):
+    """
+    The lock of a shard being projected has been taken over by another worker (see refresh_lock).
+    """
+
+
+def _read_lock_token(lock_file):
+    """
+    Get the token of the worker holding a lock file (None if there is no lock, or if it is still being written).
+    """
+
+    try:
+        with open(lock_file, "r") as f:
+            return json.load(f).get("token")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _remove_stale_lock(lock_file, stale_after):
+    """
+    Remove a lock file that has not been refreshed for stale_after seconds.
+
+    The lock is moved aside with an atomic rename, so that two workers cannot both remove it. If another worker has
+    replaced it with a new lock between the age check and the rename, the new lock is put back (a hard link only
+    created if no lock exists again).
+    """
+
+    try:
+        if time.time() - os.path.getmtime(lock_file) <= stale_after:
+            return
+    except FileNotFoundError:
+        return
+
+    stale_file = f"{lock_file}.{uuid.uuid4().hex}.stale"
+    try:
+        os.rename(lock_file, stale_file)
+    except FileNotFoundError:
+        # Moved aside by another worker
+        return
+
+    if time.time() - os.path.getmtime(stale_file) <= stale_after:
+        try:
+            os.link(stale_file, lock_file)
+        except FileExistsError:
+            pass
+    os.remove(stale_file)
+
+
+def claim_shard(shard_dir, shard, stale_after=None):
+    """
+    Claim a shard by creating its lock file. A shard is free if it has no result and no lock, or a lock that has not
+    been refreshed for stale_after seconds.
+
+    Parameters
+    ----------
+    shard_dir : str
+        The shard directory.
+
+    shard : int
+        The shard number (0-based).
+
+    stale_after : float
+        Optional age (in seconds) after which the lock of a shard without result can be claimed again.
+
+    Returns
+    -------
+    str or None
+        The token of the lock if the shard has been claimed by this worker, None otherwise.
+    """
+
+    if os.path.exists(_shard_file(shard_dir, shard, "pkl")):
+        return None
+
+    lock_file = _shard_file(shard_dir, shard, "lock")
+    if stale_after is not None:
+        _remove_stale_lock(lock_file, stale_after)
+
+    try:
+        fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+
+    token = uuid.uuid4().hex
+    with os.fdopen(fd, "w") as f:
+        json.dump(
+            {
+                "token": token,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "claimed": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            },
+            f,
+        )
+
+    return token
+
+
+def refresh_lock(shard_dir, shard, token):
+    """
+    Refresh the modification time of the lock of a shard claimed by this worker (heartbeat), so that it is not seen as
+    stale while the shard is projected.
+
+    Raises
+    ------
+    ShardLockLost
+        If the lock is no longer held by this worker (taken over as stale).
+    """
+
+    lock_file = _shard_file(shard_dir, shard, "lock")
+    if _read_lock_token(lock_file) != token:
+        raise ShardLockLost(
+            f"The lock of shard {shard} has been taken over by another worker."
+        )
+    os.utime(lock_file)
+
+
+def release_lock(shard_dir, shard, token):
+    """
+    Remove the lock of a shard if it is still held by this worker.
+    """
+
+    lock_file = _shard_file(shard_dir, shard, "lock")
+    if _read_lock_token(lock_file) == token:
+        try:
+            os.remove(lock_file)
+        except FileNotFoundError:
+            pass
+
+
+def run_shards(user_input, shard_dir, n_shards, log_list, stale_after=None):
+    """
+    Claim and project shards until every shard has been claimed (worker process).
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    shard_dir : str
+        The shard directory (shared by all the workers).
+
+    n_shards : int
+        The number of shards.
+
+    log_list : list
+        The list that stores all log entries.
+
+    stale_after : float
+        Optional age (in seconds) after which the lock of a shard without result can be claimed again.
+
+    Returns
+    -------
+    List, list
+        The shards projected by this worker and the updated log list.
+    """
+
+    import numpy as np
+    import engine as eng
+    import output as out
+
+    pricing_model_data, log_list = read.read_pricing_model_data(user_input, log_list)
+    model_points, log_list = read.read_model_points(
+        user_input["modelPointFile"], log_list
+    )
+    n_policies = len(model_points["Age"])
+    manifest, log_list = open_shard_set(
+        shard_dir, user_input, n_shards, n_policies, log_list
+    )
+
+    precision = user_input.get("precisionMode", "double") or "double"
+    time_step = user_input.get("timeStep", "monthly") or "monthly"
+    batch_size, log_list = eng.get_batch_size(user_input, log_list)
+    columns = out.get_output_columns(user_input)
+
+    projected = []
+    for shard, (start, stop) in enumerate(get_shard_ranges(n_policies, n_shards)):
+        token = claim_shard(shard_dir, shard, stale_after)
+        if token is None:
+            continue
+
+        shard_start_time = time.perf_counter()
+        result_file = _shard_file(shard_dir, shard, "pkl")
+        temp_file = f"{result_file}.{token}.tmp"
+        try:
+            shard_points = {
+                key: np.asarray(values)[start:stop]
+                for key, values in model_points.items()
+            }
+            reduction = red.BlockReduction()
+            _, pv_results, profit_results, _, log_list = eng.run_model_point_batches(
+                pricing_model_data,
+                log_list,
+                shard_points,
+                batch_size,
+                precision=precision,
+                time_step=time_step,
+                columns=columns,
+                first_policy=start,
+                reduction=reduction,
+                dynamic_lapse=read.get_dynamic_lapse_settings(user_input),
+                inforce_threshold=float(user_input.get("inforceThreshold", 0) or 0),
+                layout=user_input.get("resultLayout", "padded") or "padded",
+                profit_metrics=bool(user_input.get("profitMetrics", False)),
+                heartbeat=lambda: refresh_lock(shard_dir, shard, token),
+            )
+
+            # Write the shard result (to a temporary file of this worker), then release the lock
+            refresh_lock(shard_dir, shard, token)
+            with open(temp_file, "wb") as f:
+                pickle.dump(
+                    {
+                        "shard": shard,
+                        "input_hash": manifest["input_hash"],
+                        "start": start,
+                        "stop": stop,
+                        "aggregates": reduction.nodes,
+                        "pv_results": pv_results,
+                        "profit_results": profit_results,
+                    },
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(temp_file, result_file)
+        except ShardLockLost:
+            log_list = read.log_message(
+                f"WARNING! The lock of shard {shard + 1}/{n_shards} has been taken over by another worker (stale "
+                f"lock): the shard is left to it.",
+                log_list,
+            )
+            continue
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            release_lock(shard_dir, shard, token)
+
+        projected.append(shard)
+        log_list = read.log_message(
+            f"Shard {shard + 1}/{n_shards} (policies {start:,} to {stop - 1:,}) written in "
+            f"{time.perf_counter() - shard_start_time:.2f} s.",
+            log_list,
+        )
+
+    log_list = read.log_message(
+        f"No shard left to claim: {len(projected)} shards projected by this worker.",
+        log_list,
+    )
+
+    return projected, log_list
+
+
+def merge_shards(user_input, shard_dir, log_list):
+    """
+    Merge the shard results and write the output of the run.
+
+    Parameters
+    ----------
+    user_input : dict
+        A dictionary containing the user-defined inputs extracted from a JSON file.
+
+    shard_dir : str
+        The shard directory.
+
+    log_list : list
+        The list that stores all log entries.
+
+    Returns
+    -------
+    ProjectionResult, DataFrame, list
+        The aggregated projection, the PV results of every policy and the updated log list.
+    """
+
+    import pandas as pd
+    import checkpoint as ckp
+    import engine as eng
+    import output as out
+
+    manifest = read_shard_manifest(shard_dir)
+    n_shards = manifest["n_shards"]
+    input_hash = ckp.compute_input_hash(user_input)
+    if manifest["input_hash"] != input_hash:
+        raise ValueError(
+            f"The shard directory {shard_dir} holds the shards of another run (different inputs)."
+        )
+    missing = [
+        shard
+        for shard in range(n_shards)
+        if not os.path.exists(_shard_file(shard_dir, shard, "pkl"))
+    ]
+    if missing:
+        raise RuntimeError(
+            f"{len(missing)} of {n_shards} shards are not completed yet (first missing shard: {missing[0]})."
+        )
+
+    time_step = user_input.get("timeStep", "monthly") or "monthly"
+    output_columns, log_list = out.get_aggregate_output_columns(
+        out.get_output_columns(user_input), log_list
+    )
+    aggregate = eng.create_aggregate_result(output_columns, time_step=time_step)
+
+    # Shard aggregates (reduction tree nodes) are merged in shard order
+    reduction = red.BlockReduction()
+    pv_tables = []
+    profit_tables = []
+    for shard in range(n_shards):
+        with open(_shard_file(shard_dir, shard, "pkl"), "rb") as f:
+            shard_result = pickle.load(f)
+        if shard_result.get("input_hash") != input_hash:
+            raise ValueError(
+                f"Shard {shard} of {shard_dir} was projected with other inputs: run it again."
+            )
+        reduction.merge(shard_result["aggregates"])
+        if len(shard_result["pv_results"]):
+            pv_tables.append(shard_result["pv_results"])
+        if shard_result.get("profit_results") is not None:
+            profit_tables.append(shard_result["profit_results"])
+    if pv_tables:
+        pv_results = pd.concat(pv_tables, ignore_index=True)
+    else:
+        pv_results = pd.DataFrame(
+            columns=["Policy_ID", "Cashflow", "Timing", "Present_Value"]
+        )
+    profit_results = None
+    if user_input.get("profitMetrics", False):
+        profit_results = pd.concat(profit_tables, ignore_index=True)
+
+    totals = reduction.total()
+    if totals is not None:
+        for col in output_columns[1:]:
+            aggregate[col] = totals[col]
+
+    log_list = read.log_message(
+        f"{n_shards} shards merged ({manifest['n_policies']:,} policies).", log_list
+    )
+
+    # Roll up and write the output as a main.py run
+    output_granularity = user_input.get("outputGranularity", "monthly") or "monthly"
+    output_result, log_list = out.rollup_projection(
+        aggregate, output_granularity, log_list, columns=output_columns
+    )
+    cf_proj_table = output_result.to_frame(columns=output_columns)
+    log_list = out.write_output_files(
+        cf_proj_table, pv_results, user_input, log_list, profit_results
+    )
+
+    return aggregate, pv_results, log_list
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sharded execution of a model point file run."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="claim and project shards")
+    run_parser.add_argument("json_path", help="user input JSON file")
+    run_parser.add_argument("--shard-dir", required=True)
+    run_parser.add_argument("--shards", type=int, required=True)
+    run_parser.add_argument(
+        "--stale-after",
+        type=float,
+        default=None,
+        help="seconds after which the lock of an unfinished shard can be claimed again",
+    )
+
+    merge_parser = subparsers.add_parser("merge", help="merge the shard results")
+    merge_parser.add_argument("json_path", help="user input JSON file")
+    merge_parser.add_argument("--shard-dir", required=True)
+    args = parser.parse_args(argv)
+
+    log_list = []
+    user_input, log_list = read.read_json_file(args.json_path, log_list)
+
+    if args.command == "run":
+        projected, log_list = run_shards(
+            user_input, args.shard_dir, args.shards, log_list, args.stale_after
+        )
+    else:
+        aggregate, pv_results, log_list = merge_shards(
+            user_input, args.shard_dir, log_list
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+worker.py
+
+This module contains the warm Python worker of the local job service (`job_server.js`). A worker is started once
+(`python main.py --worker`, or `cf_proj.exe --worker` for the packaged executable) and runs the jobs sent by the job
+server one after the other, so that the modules are imported only once and the pricing model data is shared by the
+jobs on the same workbook (see `batch.run_input`).
+
+The worker reads one job per line on stdin:
+
+    {"id": "<job id>", "jsonPath": "<path to the user input JSON file>"}
+
+and writes one message per line on stdout:
+
+    {"id": ..., "event": "started"}
+    {"id": ..., "event": "log", "message": "<log entry>"}
+    {"id": ..., "event": "progress", "batch": ..., "batches": ..., "policies": ..., "etaSeconds": ..., ...}
+    {"id": ..., "event": "completed", "pvResults": [...], "equivalence": {...}, "stages": {...}, "wallTime": ..., ...}
+    {"id": ..., "event": "cancelled", ...}   (same fields as "completed", for the batches completed before the cancellation)
+    {"id": ..., "event": "equivalence_failed", "error": "<check summary>", ...}   (same fields as "completed")
+    {"id": ..., "event": "failed", "error": "<error message>"}
+
+"equivalence" is the summary of the check against the reference model (None if not run, see `equivalence.py`). A run
+failing the check has written its output files, so its results are sent with the "equivalence_failed" event.
+
+A running job is cancelled by the job server with its cancel file (the JSON path + ".cancel", see `progress.py`). The
+worker does not trap SIGINT / SIGTERM, so that the job server can still kill it when the job does not reach a batch
+boundary.
+
+The worker stops at the end of stdin or when it receives {"command": "stop"}.
+"""
+
+import json
+import sys
+import batch
+
+# Event sent for each status of a run with results (see `batch.run_input`)
+RESULT_EVENTS = {
+    "ok": "completed",
+    "cancelled": "cancelled",
+    "equivalence_failed": "equivalence_failed",
+}
+
+
+class JobLog(list):
+    """
+    Log list of a job, which sends every log entry to the job server as it is appended.
+
+    Parameters
+    ----------
+    job_id : str
+        The job id.
+
+    channel : file
+        The stream of the messages to the job server.
+    """
+
+    def __init__(self, job_id, channel):
+        super().__init__()
+        self.job_id = job_id
+        self.channel = channel
+
+    def append(self, log_entry):
+        super().append(log_entry)
+        send_message(self.channel, self.job_id, "log", message=log_entry)
+
+
+def send_message(channel, job_id, event, **fields):
+    """
+    Write a message to the job server (one JSON object per line).
+    """
+
+    channel.write(json.dumps({"id": job_id, "event": event, **fields}, default=str))
+    channel.write("\n")
+    channel.flush()
+
+
+def run_job(job, channel):
+    """
+    Run a job and send its events to the job server.
+
+    Parameters
+    ----------
+    job : dict
+        The job, with keys "id" and "jsonPath".
+
+    channel : file
+        The stream of the messages to the job server.
+    """
+
+    job_id = job["id"]
+    send_message(channel, job_id, "started")
+
+    # The run log is sent as "log" events, the printed log is discarded (stdout is the message channel)
+    summary = batch.run_input(
+        job["jsonPath"],
+        delete_json=True,
+        log_list=JobLog(job_id, channel),
+        progress_callback=lambda event: send_message(channel, job_id, **event),
+        handle_signals=False,
+    )
+
+    if summary["status"] in RESULT_EVENTS:
+        fields = {"error": summary["error"]} if summary["error"] else {}
+        send_message(
+            channel,
+            job_id,
+            RESULT_EVENTS[summary["status"]],
+            **fields,
+            pvResults=summary["pv_results"].to_dict("records"),
+            equivalence=summary["equivalence"],
+            stages=summary["stages"],
+            workbookCached=summary["workbook_cached"],
+            wallTime=summary["wall_time_s"],
+            cpuTime=summary["cpu_time_s"],
+        )
+    else:
+        send_message(channel, job_id, "failed", error=summary["error"])
+
+
+def serve(stdin=None, stdout=None):
+    """
+    Run the jobs received on stdin until the end of stdin or a stop command.
+
+    Returns
+    -------
+    int
+        The exit code of the worker.
+    """
+
+    stdin = stdin or sys.stdin
+    channel = stdout or sys.stdout
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        if job.get("command") == "stop":
+            break
+        run_job(job, channel)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(serve())
@@ -0,0 +1,90 @@
+"""
+conftest.py
+
+Shared fixtures of the test suite. The modules of scripts/ are flat modules (imported by name, as in main.py), so the
+scripts directory is put on the import path.
+"""
+
+import os
+import sys
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT_DIR, "scripts")
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+# The user input of the pricing model in resources/ (the workbook named cells of each parameter and table)
+USER_INPUT = {
+    "filePath": os.path.join(ROOT_DIR, "resources", "pricing_model.xlsx"),
+    "age": "Age",
+    "gender": "Gender",
+    "polYear": "Pol_Year",
+    "sumAssured": "SumAssured",
+    "contributionPerYear": "Contribution_perYear",
+    "surplusShareToParticipant": "SurplusShare_toParticipant",
+    "surplusShareToShf": "SurplusShare_toSHF",
+    "tabWakalahFee": "Tab_WakalahFee",
+    "wakalahFmc": "Wakalah_Thrarawat",
+    "coiLoading": "COI_Loading",
+    "expensePerContributionPerYear": "Expense_perContribution_perYear",
+    "expensePerFundPerYear": "Expense_perFund_perYear",
+    "tabMortalityRates": "Tab_MortalityRates",
+    "tabLapseRate": "Tab_LapseRate",
+    "tabRiskFreeRates": "Tab_RiskFreeRates",
+    "outputFileName": "pricing_model_py_output",
+    "outputFormat": "pickle",
+    "generateRunLog": False,
+}
+
+
+@pytest.fixture
+def user_input(tmp_path):
+    """
+    The user input of the pricing model in resources/, with its output written in a temporary directory.
+    """
+
+    return dict(USER_INPUT, outputFilePath=str(tmp_path))
+
+
+@pytest.fixture(scope="session")
+def pricing_model_data():
+    """
+    The data of the pricing model in resources/ (read once for the whole test session).
+    """
+
+    import data_read as read
+
+    data, _ = read.read_pricing_model_data(dict(USER_INPUT), [])
+    return data
+
+
+def write_model_point_file(path, n_policies, seed=0):
+    """
+    Write a model point file of n_policies random policies (terms of 5 to 20 years, to keep the projections short).
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    pd.DataFrame(
+        {
+            "Age": rng.integers(20, 60, n_policies),
+            "Gender": rng.choice(["Male", "Female"], n_policies),
+            "Pol_Year": rng.integers(5, 21, n_policies),
+            "SumAssured": rng.integers(10, 100, n_policies) * 10000.0,
+            "Contribution_perYear": rng.integers(10, 100, n_policies) * 100.0,
+        }
+    ).to_csv(path, index=False)
+
+    return str(path)
+
+
+@pytest.fixture
+def model_point_file(tmp_path):
+    """
+    A model point file of 2,500 policies (three reduction blocks, the last one partial).
+    """
+
+    return write_model_point_file(tmp_path / "model_points.csv", 2500)
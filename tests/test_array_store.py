@@ -0,0 +1,219 @@
+"""
+Tests of the result stores (array_store.py).
+"""
+
+import json
+import sys
+import numpy as np
+import pytest
+import array_store as arr
+import main as mn
+from conftest import write_model_point_file
+from proj_result import ProjectionResult, RaggedResult
+
+LENGTHS = np.array([6, 0, 3, 10, 1])
+
+
+@pytest.fixture
+def ragged():
+    rng = np.random.default_rng(0)
+    result = ProjectionResult(["Profit_IF", "No_Pols_IF"], n_policies=5, n_months=10)
+    result["Profit_IF"] = rng.normal(size=(5, 10))
+    result["No_Pols_IF"] = rng.random(size=(5, 10))
+    return RaggedResult.from_padded(result, LENGTHS)
+
+
+@pytest.fixture
+def ragged_store(ragged, tmp_path):
+    store = arr.create_ragged_store(
+        str(tmp_path / "store"), LENGTHS, ragged.columns, 10
+    )
+    # Written in two ranges of policies, as by the batches of a run
+    for start, stop in [(0, 2), (2, 5)]:
+        part = RaggedResult(ragged.columns, LENGTHS[start:stop], n_months=10)
+        rows = slice(ragged.offsets[start], ragged.offsets[stop])
+        for col in ragged.columns:
+            part[col] = ragged[col][rows]
+        arr.write_ragged_policies(store, part, start)
+    return store
+
+
+def test_array_store_round_trip(tmp_path):
+    values = np.arange(4 * 6 * 3, dtype=np.float64).reshape(4, 6, 3)
+    group_columns = {
+        "decrement": ["No_Pol_Start"],
+        "inforce": ["Profit_IF", "Expenses_IF"],
+    }
+    store = arr.create_array_store(str(tmp_path / "store"), 4, 6, group_columns)
+
+    # A block of policies, a single policy, and a batch projected over fewer months than the store
+    arr.write_policy_slice(store, "decrement", 0, values[:, :, :1])
+    arr.write_policy_slice(store, "inforce", 0, values[:2, :, 1:])
+    arr.write_policy_slice(store, "inforce", 2, values[2, :, 1:])
+    arr.write_policy_slice(store, "inforce", 3, values[3:, :4, 1:])
+    arr.flush_array_store(store)
+
+    store = arr.open_array_store(str(tmp_path / "store"))
+    assert store["index"]["groups"]["inforce"]["columns"] == [
+        "Profit_IF",
+        "Expenses_IF",
+    ]
+    np.testing.assert_array_equal(
+        arr.get_column(store, "No_Pol_Start"), values[:, :, 0]
+    )
+    np.testing.assert_array_equal(
+        arr.get_column(store, "Expenses_IF", slice(1, 3)), values[1:3, :, 2]
+    )
+    np.testing.assert_array_equal(
+        arr.get_column(store, "Profit_IF", 2), values[2, :, 1]
+    )
+    np.testing.assert_array_equal(
+        arr.get_column(store, "Profit_IF", 3), np.r_[values[3, :4, 1], 0, 0]
+    )
+    assert isinstance(arr.get_column(store, "Profit_IF"), np.memmap)
+    with pytest.raises(KeyError, match="Age"):
+        arr.get_column(store, "Age")
+
+
+def test_array_store_reused(tmp_path):
+    group_columns = {"inforce": ["Profit_IF"]}
+    store = arr.create_array_store(str(tmp_path / "store"), 2, 3, group_columns)
+    arr.write_policy_slice(store, "inforce", 0, np.ones((2, 3, 1)))
+    arr.flush_array_store(store)
+
+    store = arr.create_array_store(
+        str(tmp_path / "store"), 2, 3, group_columns, reuse=True
+    )
+    assert arr.get_column(store, "Profit_IF").all()
+
+    # Another layout is created again
+    store = arr.create_array_store(
+        str(tmp_path / "store"), 3, 3, group_columns, reuse=True
+    )
+    assert not arr.get_column(store, "Profit_IF").any()
+
+
+def test_model_point_file_run_store(user_input, tmp_path):
+    # The dense store written batch by batch holds the same per-policy values as the ragged store
+    model_point_file = write_model_point_file(tmp_path / "model_points.csv", 2100)
+    json_file = tmp_path / "input.json"
+    json_file.write_text(
+        json.dumps(
+            dict(
+                user_input,
+                modelPointFile=model_point_file,
+                modelPointBatchSize=1000,
+                timeStep="annual",
+                arrayStorePath=str(tmp_path / "dense"),
+                policyResultsPath=str(tmp_path / "ragged"),
+            )
+        )
+    )
+    mn.run(str(json_file), [], handle_signals=False)
+
+    dense = arr.open_array_store(str(tmp_path / "dense"))
+    ragged = arr.open_ragged_store(str(tmp_path / "ragged"))
+    assert dense["index"]["n_policies"] == 2100 and dense["index"]["n_months"] == 100
+    for col in ragged["index"]["columns"]:
+        np.testing.assert_array_equal(
+            arr.get_column(dense, col), arr.get_policy_values(ragged, col, padded=True)
+        )
+
+
+@pytest.mark.parametrize(
+    "inputs, message",
+    [
+        ({"salesVolumeFile": "sales.csv"}, "new business cohort runs"),
+        (
+            {"modelPointFile": "model_points.csv", "resultLayout": "ragged"},
+            "policyResultsPath",
+        ),
+    ],
+)
+def test_array_store_rejected(user_input, tmp_path, inputs, message):
+    json_file = tmp_path / "input.json"
+    json_file.write_text(
+        json.dumps(dict(user_input, arrayStorePath=str(tmp_path / "dense"), **inputs))
+    )
+    with pytest.raises(ValueError, match=message):
+        mn.run(str(json_file), [], handle_signals=False)
+
+
+def test_policy_lengths():
+    np.testing.assert_array_equal(
+        arr.get_policy_lengths([5, 120, 1], n_months=1200), [60, 1200, 12]
+    )
+    np.testing.assert_array_equal(
+        arr.get_policy_lengths([5, 120], n_months=1200, time_step="annual"), [5, 100]
+    )
+
+
+def test_ragged_store_round_trip(ragged, ragged_store):
+    store = arr.open_ragged_store(ragged_store["dir"])
+    padded = ragged.to_padded()
+
+    np.testing.assert_array_equal(store["lengths"], LENGTHS)
+    np.testing.assert_array_equal(store["offsets"], ragged.offsets)
+    for col in ragged.columns:
+        np.testing.assert_array_equal(arr.get_policy_values(store, col), ragged[col])
+        np.testing.assert_array_equal(
+            arr.get_policy_values(store, col, padded=True), padded[col]
+        )
+
+    # A range of policies, and a single policy
+    np.testing.assert_array_equal(
+        arr.get_policy_values(store, "Profit_IF", slice(2, 4)),
+        ragged["Profit_IF"][6:19],
+    )
+    np.testing.assert_array_equal(
+        arr.get_policy_values(store, "Profit_IF", 3, padded=True),
+        padded["Profit_IF"][3],
+    )
+    assert arr.get_policy_values(store, "Profit_IF", 1).size == 0
+
+
+def test_ragged_store_errors(ragged, ragged_store):
+    with pytest.raises(KeyError, match="Age"):
+        arr.get_policy_values(ragged_store, "Age")
+    with pytest.raises(ValueError, match="contiguous range"):
+        arr.get_policy_values(ragged_store, "Profit_IF", slice(0, 5, 2))
+    with pytest.raises(ValueError, match="number of periods"):
+        arr.write_ragged_policies(ragged_store, ragged, 1)
+
+
+def test_ragged_store_reused(ragged, ragged_store):
+    store = arr.create_ragged_store(
+        ragged_store["dir"], LENGTHS, ragged.columns, 10, reuse=True
+    )
+    np.testing.assert_array_equal(
+        arr.get_policy_values(store, "Profit_IF"), ragged["Profit_IF"]
+    )
+
+    # Another layout is created again
+    store = arr.create_ragged_store(
+        ragged_store["dir"], LENGTHS + 1, ragged.columns, 11, reuse=True
+    )
+    assert not arr.get_policy_values(store, "Profit_IF").any()
+
+
+def test_parquet_export(ragged, ragged_store, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    file_path = str(tmp_path / "policies.parquet")
+    log_list = arr.export_ragged_parquet(ragged_store, file_path, [], row_group_size=2)
+    assert "5 policies exported to Parquet" in log_list[0]
+
+    table = pq.read_table(file_path)
+    assert table.column_names == ["Policy_ID", "Profit_IF", "No_Pols_IF"]
+    assert table["Policy_ID"].to_pylist() == list(range(5))
+    for p in range(5):
+        np.testing.assert_array_equal(
+            table["Profit_IF"][p].as_py(),
+            ragged["Profit_IF"][ragged.offsets[p] : ragged.offsets[p + 1]],
+        )
+
+
+def test_parquet_export_without_pyarrow(ragged_store, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ImportError, match="requires the pyarrow package"):
+        arr.export_ragged_parquet(ragged_store, str(tmp_path / "policies.parquet"), [])
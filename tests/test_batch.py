@@ -0,0 +1,70 @@
+"""
+Tests of the headless batch runner (batch.py).
+"""
+
+import json
+import os
+import batch
+
+
+def _write_inputs(tmp_path, user_input, **inputs):
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    for name, settings in inputs.items():
+        (input_dir / f"{name}.json").write_text(
+            json.dumps(dict(user_input, outputFileName=name, **settings))
+        )
+    return batch.collect_input_files([str(input_dir)])
+
+
+def test_batch_runs_equivalence_gate(user_input, tmp_path):
+    json_paths = _write_inputs(
+        tmp_path,
+        user_input,
+        a_monthly={},
+        b_annual={"timeStep": "annual"},
+        c_tight={
+            "precisionMode": "single",
+            "equivalenceAtol": 1e-9,
+            "equivalenceRtol": 1e-12,
+        },
+    )
+    runs, _ = batch.run_batch(json_paths, [])
+    monthly, annual, tight = runs
+
+    assert monthly["status"] == "ok" and monthly["equivalence"]["passed"]
+    # The reference model cannot check annual runs
+    assert annual["status"] == "ok" and annual["equivalence"] is None
+    assert tight["status"] == "equivalence_failed"
+    assert not tight["equivalence"]["passed"]
+    assert tight["error"].startswith("Equivalence check failed")
+    assert tight["pv_results"] is not None
+
+    summary_dir = str(tmp_path / "summary")
+    batch.write_batch_summary(runs, summary_dir, [])
+    with open(os.path.join(summary_dir, batch.SUMMARY_FILE_NAME)) as f:
+        summary = json.load(f)
+    assert summary["failed"] == 1 and summary["equivalence_failed"] == 1
+    assert [run["status"] for run in summary["run_summaries"]] == [
+        "ok",
+        "ok",
+        "equivalence_failed",
+    ]
+    assert summary["run_summaries"][0]["equivalence"]["passed"] is True
+
+
+def test_batch_without_equivalence_gate(user_input, tmp_path):
+    json_paths = _write_inputs(
+        tmp_path,
+        user_input,
+        tight={
+            "precisionMode": "single",
+            "equivalenceAtol": 1e-9,
+            "equivalenceRtol": 1e-12,
+        },
+    )
+    assert batch.main([*json_paths, "--summary", str(tmp_path)]) == 1
+    assert (
+        batch.main([*json_paths, "--summary", str(tmp_path), "--no-equivalence-check"])
+        == 0
+    )
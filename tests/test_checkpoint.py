@@ -0,0 +1,84 @@
+"""
+Tests of the checkpoints of model point file runs (checkpoint.py).
+"""
+
+import numpy as np
+import checkpoint as ckp
+import data_read as read
+import engine as eng
+from conftest import write_model_point_file
+
+
+class _CancelAfter:
+    """
+    Cancellation signal set after a number of checks (one check per batch).
+    """
+
+    def __init__(self, n_checks):
+        self.n_checks = n_checks
+
+    def is_set(self):
+        self.n_checks -= 1
+        return self.n_checks < 0
+
+
+def test_resumed_run_matches_uninterrupted_run(
+    user_input, pricing_model_data, model_point_file, tmp_path
+):
+    user_input = dict(user_input, modelPointFile=model_point_file)
+    model_points, _ = read.read_model_points(model_point_file, [])
+    checkpoint_dir = str(tmp_path / "checkpoints")
+
+    # First run: cancelled after its first batch (of 3)
+    checkpoint, _ = ckp.open_checkpoint(checkpoint_dir, user_input, 3, [])
+    _, pv_results, _, cancelled, _ = eng.run_model_point_batches(
+        pricing_model_data,
+        [],
+        model_points,
+        1000,
+        cancel=_CancelAfter(1),
+        checkpoint=checkpoint,
+    )
+    assert cancelled and pv_results["Policy_ID"].nunique() == 1000
+    assert checkpoint.completed == {1}
+
+    # Restarted run: the first batch is read back from the checkpoint
+    checkpoint, log_list = ckp.open_checkpoint(checkpoint_dir, user_input, 3, [])
+    assert "Resuming from checkpoint" in log_list[0] and "1/3 batches" in log_list[0]
+    resumed, resumed_pv, _, cancelled, _ = eng.run_model_point_batches(
+        pricing_model_data, [], model_points, 1000, checkpoint=checkpoint
+    )
+    assert not cancelled and checkpoint.completed == {1, 2, 3}
+
+    expected, expected_pv, _, _, _ = eng.run_model_point_batches(
+        pricing_model_data, [], model_points, 1000
+    )
+    for col in eng.get_aggregate_columns()[1:]:
+        np.testing.assert_array_equal(resumed[col], expected[col])
+    assert resumed_pv.equals(expected_pv)
+
+
+def test_checkpoint_of_other_batches_not_resumed(user_input, tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    checkpoint, _ = ckp.open_checkpoint(checkpoint_dir, user_input, 3, [])
+    checkpoint.save(1, [], None)
+
+    checkpoint, _ = ckp.open_checkpoint(checkpoint_dir, user_input, 4, [])
+    assert checkpoint.completed == set()
+    assert checkpoint.load(1) is None
+
+
+def test_input_hash(user_input, tmp_path):
+    model_point_file = write_model_point_file(tmp_path / "model_points.csv", 10)
+    user_input = dict(user_input, modelPointFile=model_point_file)
+    input_hash = ckp.compute_input_hash(user_input)
+
+    # Settings that do not change the results
+    for key in ckp.NON_RESULT_KEYS:
+        assert ckp.compute_input_hash(dict(user_input, **{key: "other"})) == input_hash
+
+    # Settings and files that change the results
+    assert ckp.compute_input_hash(dict(user_input, timeStep="annual")) != input_hash
+    assert ckp.compute_input_hash(dict(user_input, batchSize=2000)) != input_hash
+    write_model_point_file(tmp_path / "model_points.csv", 10, seed=1)
+    assert ckp.compute_input_hash(user_input) != input_hash
@@ -0,0 +1,90 @@
+"""
+Tests of the new business cohort projection (cohorts.py).
+"""
+
+import numpy as np
+import pytest
+import cohorts as coh
+import engine as eng
+
+MODEL_POINT = {
+    "Age": [35],
+    "Gender": ["Male"],
+    "Pol_Year": [10],
+    "SumAssured": [300000.0],
+    "Contribution_perYear": [2400.0],
+}
+
+
+def _shift_and_add(profiles, sales, n_periods):
+    # Reference: each month of sale adds the profile of its cell, shifted by the month of sale
+    n_cells, n_columns, n_profile = profiles.shape
+    calendar = np.zeros((n_columns, n_periods + n_profile + sales.shape[1]))
+    for cell in range(n_cells):
+        for month, volume in enumerate(sales[cell]):
+            calendar[:, month : month + n_profile] += volume * profiles[cell]
+    return calendar[:, :n_periods]
+
+
+@pytest.fixture
+def profiles_and_sales():
+    rng = np.random.default_rng(0)
+    profiles = rng.normal(size=(3, 2, 150)) * 1e3
+    profiles[:, :, 120:] = 0.0  # policies of 10 years
+    profiles[2, :, 60:] = 0.0  # policies of 5 years
+    sales = rng.integers(0, 50, size=(3, 90)).astype(np.float64)
+    sales[0, 70:] = 0.0
+    sales[1, :] = 0.0  # cell without sales
+    return profiles, sales
+
+
+@pytest.mark.parametrize("method", ["direct", "fft", "auto"])
+def test_methods_match_shift_and_add(profiles_and_sales, method):
+    profiles, sales = profiles_and_sales
+    expected = _shift_and_add(profiles, sales, 300)
+
+    calendar, n_support = coh.convolve_sales(profiles, sales, 300, method)
+    # Last sales: month 70 for the 10-year cell (cashflows up to month 189), month 90 for the 5-year cell (up to 149)
+    assert n_support == 70 + 120 - 1
+    assert not calendar[:, n_support:].any()
+    if method == "direct":
+        np.testing.assert_allclose(calendar, expected, rtol=1e-12, atol=1e-6)
+    else:
+        np.testing.assert_allclose(
+            calendar, expected, rtol=0, atol=1e-9 * np.abs(expected).max()
+        )
+
+
+def test_output_truncated_to_periods(profiles_and_sales):
+    profiles, sales = profiles_and_sales
+    calendar, n_support = coh.convolve_sales(profiles, sales, 100, "fft")
+    assert calendar.shape == (2, 100) and n_support == 189
+    full, _ = coh.convolve_sales(profiles, sales, 300, "fft")
+    np.testing.assert_array_equal(calendar, full[:, :100])
+
+
+def test_unsupported_method(profiles_and_sales):
+    with pytest.raises(ValueError, match="Unsupported convolution method"):
+        coh.convolve_sales(*profiles_and_sales, 100, "fast")
+
+
+def test_sales_reproduce_single_policy(pricing_model_data):
+    profile, _, _ = eng.run_projection(
+        pricing_model_data, [], MODEL_POINT, columns=eng.get_aggregate_columns()
+    )
+
+    # One policy sold in the first month of the plan, then three in the fifth month
+    sales = np.zeros((1, 12))
+    sales[0, 0] = 1.0
+    aggregate, _, _, _ = coh.run_cohort_projection(
+        pricing_model_data, [], MODEL_POINT, sales, method="direct"
+    )
+    sales[0, 0], sales[0, 4] = 0.0, 3.0
+    shifted, _, _, _ = coh.run_cohort_projection(
+        pricing_model_data, [], MODEL_POINT, sales, method="direct"
+    )
+
+    for col in eng.get_aggregate_columns()[1:]:
+        np.testing.assert_array_equal(aggregate[col][0], profile[col][0])
+        np.testing.assert_allclose(shifted[col][0, 4:], 3 * profile[col][0, :-4])
+        assert not shifted[col][0, :4].any()
@@ -0,0 +1,169 @@
+"""
+Tests of the vectorized projection engine (engine.py).
+"""
+
+import numpy as np
+import pytest
+import engine as eng
+from proj_result import ProjectionResult
+
+
+def _pv(pv_results, cashflow):
+    return pv_results.loc[pv_results["Cashflow"] == cashflow, "Present_Value"].iloc[0]
+
+
+@pytest.fixture(scope="module")
+def monthly_and_annual(pricing_model_data):
+    _, monthly, _ = eng.run_projection(pricing_model_data, [], time_step="monthly")
+    _, annual, _ = eng.run_projection(pricing_model_data, [], time_step="annual")
+    return monthly, annual
+
+
+def test_annual_expenses_on_monthly_basis(monthly_and_annual):
+    # Expenses are a fixed share of each contribution: the annual step must charge the same share as the monthly one
+    monthly, annual = monthly_and_annual
+    monthly_share = _pv(monthly, "PV_Expenses_IF") / _pv(monthly, "PV_Contribution_IF")
+    annual_share = _pv(annual, "PV_Expenses_IF") / _pv(annual, "PV_Contribution_IF")
+    assert annual_share == pytest.approx(monthly_share, rel=1e-12)
+
+
+def test_annual_pvs_close_to_monthly(monthly_and_annual):
+    monthly, annual = monthly_and_annual
+    for cashflow in ["PV_Contribution_IF", "PV_Expenses_IF", "PV_Fund_Expenses_IF"]:
+        assert _pv(annual, cashflow) == pytest.approx(_pv(monthly, cashflow), rel=0.1)
+    assert _pv(annual, "PV_Profit_IF") == pytest.approx(
+        _pv(monthly, "PV_Profit_IF"), rel=0.1
+    )
+
+
+def test_annual_expenses_per_step(pricing_model_data):
+    result, _, _ = eng.run_projection(
+        pricing_model_data, [], time_step="annual", columns=eng.get_aggregate_columns()
+    )
+    rate = pricing_model_data["Expense_perContribution_perYear"]
+    np.testing.assert_allclose(
+        result["Expenses_PP"], result["Contribution_PP"] * rate / 12, rtol=1e-15
+    )
+
+
+def _profit_result(profits, steps_per_year=12):
+    profits = np.asarray(profits, dtype=np.float64)
+    result = ProjectionResult(
+        ["Profit_IF", "disc_factor_eop"],
+        n_policies=profits.shape[0],
+        n_months=profits.shape[1],
+        steps_per_year=steps_per_year,
+    )
+    result["Profit_IF"] = profits
+    result["disc_factor_eop"] = 1.0
+    return result
+
+
+def test_solve_irr_matches_known_rates():
+    times = np.arange(1, 11, dtype=np.float64)
+    rates = np.array([-0.5, 0.0, 0.05, 0.25, 3.0])
+    # An outlay of 100 at time 1 repaid by level payments at times 2 to 10, priced at each rate
+    discount = (1 + rates[:, np.newaxis]) ** -times
+    payment = 100 * discount[:, 0] / discount[:, 1:].sum(axis=1)
+    cashflows = np.repeat(payment[:, np.newaxis], 10, axis=1)
+    cashflows[:, 0] = -100.0
+
+    irr = eng.solve_irr(cashflows, times)
+    np.testing.assert_allclose(irr, rates, atol=1e-10)
+
+
+def test_solve_irr_without_sign_change():
+    times = np.arange(1, 6, dtype=np.float64)
+    irr = eng.solve_irr(np.array([[1.0] * 5, [-1.0] * 5, [0.0] * 5]), times)
+    assert np.isnan(irr).all()
+
+
+def test_break_even_year_conventions():
+    profits = [
+        [5.0] * 24,  # profitable from the first period: no break-even
+        [-10.0] + [2.0] * 23,  # breaks even in month 6 (year 1)
+        [-30.0] + [2.0] * 23,  # breaks even in month 16 (year 2)
+        [-100.0] + [2.0] * 23,  # ends negative
+    ]
+    metrics = eng.generate_profit_metrics(
+        _profit_result(profits), np.ones(4), np.ones(4)
+    )
+    np.testing.assert_array_equal(metrics[:, 1], [0.0, 1.0, 2.0, np.nan])
+    assert np.isnan(metrics[0, 0]) and np.isfinite(metrics[1, 0])
+
+
+def test_break_even_year_annual_steps():
+    metrics = eng.generate_profit_metrics(
+        _profit_result([[-10.0, 4.0, 4.0, 4.0, 4.0]], steps_per_year=1),
+        np.array([6.0]),
+        np.array([12.0]),
+    )
+    np.testing.assert_array_equal(metrics[0, 1:], [4.0, 0.5])
+
+
+def test_inforce_rates_follow_attained_age(pricing_model_data):
+    elapsed = 37
+    model_points = {
+        "Age": [40, 40],
+        "Gender": ["Female", "Female"],
+        "Pol_Year": [20, 20],
+        "SumAssured": [200000.0, 200000.0],
+        "Contribution_perYear": [3000.0, 3000.0],
+        "Elapsed_Months": [0, elapsed],
+    }
+    result, _, _ = eng.run_projection(
+        pricing_model_data, [], model_points, columns=eng.PROJECTION_COLUMNS
+    )
+
+    # The in-force policy starts at the attained age of its duration, not at its age at entry
+    assert result["Age"][1, 0] == 40 + elapsed // 12
+    assert result["Pol_Year"][1, 0] == elapsed // 12 + 1
+
+    # Its rates are those of the same policy from issue, shifted by the elapsed months
+    n_cover = 20 * 12 - elapsed
+    for col in [
+        "Age",
+        "Pol_Year",
+        "Mortality_Rate_perYear",
+        "Mortality_Rate_perMonth",
+        "Lapse_Rate_perYear",
+        "Lapse_Rate_perMonth",
+    ]:
+        np.testing.assert_array_equal(
+            result[col][1, :n_cover], result[col][0, elapsed : elapsed + n_cover]
+        )
+
+
+def test_profit_metrics_table(pricing_model_data, model_point_file):
+    import data_read as read
+
+    model_points, _ = read.read_model_points(model_point_file, [])
+    _, pv_results, profit_results, _, _ = eng.run_model_point_batches(
+        pricing_model_data, [], model_points, 1000, profit_metrics=True
+    )
+
+    # The PV results only hold present values, the metrics are in their own table (one row per policy)
+    assert pv_results["Cashflow"].str.startswith("PV_").all()
+    assert list(profit_results.columns) == ["Policy_ID"] + eng.PROFIT_METRICS
+    np.testing.assert_array_equal(profit_results["Policy_ID"], np.arange(2500))
+
+    # The same metrics as for a single batch of all the policies
+    result, pv_single, _ = eng.run_projection(
+        pricing_model_data, [], model_points, horizon=20 * 12
+    )
+    expected = eng.generate_profit_table(result, pv_single)
+    np.testing.assert_allclose(
+        profit_results[eng.PROFIT_METRICS], expected[eng.PROFIT_METRICS], rtol=1e-9
+    )
+    pv_profit = pv_results.loc[pv_results["Cashflow"] == "PV_Profit_IF"]
+    pv_contribution = pv_results.loc[pv_results["Cashflow"] == "PV_Contribution_IF"]
+    np.testing.assert_allclose(
+        profit_results["NBV_Margin"],
+        pv_profit["Present_Value"].to_numpy()
+        / pv_contribution["Present_Value"].to_numpy(),
+    )
+
+    _, _, profit_results, _, _ = eng.run_model_point_batches(
+        pricing_model_data, [], model_points, 1000
+    )
+    assert profit_results is None
@@ -0,0 +1,31 @@
+"""
+Tests of the equivalence gate against the reference model (equivalence.py).
+"""
+
+import json
+import pytest
+import equivalence as eq
+
+
+def test_monthly_run_passes(pricing_model_data):
+    report, _ = eq.check_equivalence(pricing_model_data, [], max_policies=1)
+    assert report["passed"]
+    assert len(report["columns"]) and len(report["pv"])
+
+
+def test_annual_run_rejected(pricing_model_data):
+    with pytest.raises(ValueError, match="monthly"):
+        eq.check_equivalence(pricing_model_data, [], time_step="annual")
+
+
+def test_annual_run_skipped_by_main(user_input, tmp_path):
+    import main
+
+    json_file = tmp_path / "input.json"
+    json_file.write_text(
+        json.dumps(dict(user_input, timeStep="annual", equivalenceCheck=True))
+    )
+    _, _, log_list = main.run(str(json_file), [], delete_json=False)
+    log = "\n".join(log_list)
+    assert "Equivalence check skipped" in log
+    assert "Checking failed" not in log
@@ -0,0 +1,76 @@
+"""
+Tests of the output column selection and output files (output.py).
+"""
+
+import os
+import pandas as pd
+import pytest
+import engine as eng
+import output as out
+
+
+def test_output_columns_in_projection_order():
+    columns = out.get_output_columns({"outputColumns": "Profit_IF, No_Pol_Start"})
+    assert columns == ["T_Index", "No_Pol_Start", "Profit_IF"]
+    assert out.get_output_columns({}) is None
+
+    with pytest.raises(ValueError, match="Unknown output column"):
+        out.get_output_columns({"outputColumns": "Profit"})
+
+
+def test_aggregate_output_columns_warn_ignored():
+    columns = out.get_output_columns(
+        {"outputColumns": "Age,Unit_Fund_EOP_PP,No_Pol_Start,Profit_IF"}
+    )
+    aggregate_columns, log_list = out.get_aggregate_output_columns(columns, [])
+    assert aggregate_columns == ["T_Index", "No_Pol_Start", "Profit_IF"]
+    assert len(log_list) == 1
+    assert "WARNING!" in log_list[0] and "Age, Unit_Fund_EOP_PP" in log_list[0]
+
+
+def test_aggregate_output_columns_without_warning():
+    aggregate_columns, log_list = out.get_aggregate_output_columns(None, [])
+    assert aggregate_columns == eng.get_aggregate_columns()
+    assert log_list == []
+
+    columns = out.get_output_columns({"outputColumns": "Profit_IF"})
+    _, log_list = out.get_aggregate_output_columns(columns, [])
+    assert log_list == []
+
+
+@pytest.mark.parametrize(
+    "output_format, suffix",
+    [("csv", "_profit_metrics.csv"), ("pickle", "_profit_metrics.pkl")],
+)
+def test_profit_metrics_written_next_to_pv_results(
+    output_format, suffix, tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    user_input = {
+        "outputFilePath": "out",
+        "outputFileName": "run",
+        "outputFormat": output_format,
+    }
+    cf_proj_table = pd.DataFrame({"T_Index": [1, 2], "Profit_IF": [1.0, 2.0]})
+    pv_results = pd.DataFrame(
+        {"Cashflow": ["PV_Profit_IF"], "Timing": ["EOP"], "Present_Value": [2.9]}
+    )
+    profit_results = pd.DataFrame(
+        {"Policy_ID": [0], "IRR_Profit_IF": [0.1], "Break_Even_Year": [0.0]}
+    )
+
+    log_list = out.write_output_files(cf_proj_table, pv_results, user_input, [])
+    assert not any(suffix in entry for entry in log_list)
+
+    log_list = out.write_output_files(
+        cf_proj_table, pv_results, user_input, [], profit_results
+    )
+    # output_path + "\\" + name: a file in the output directory on Windows
+    profit_file = os.path.join(tmp_path, "out\\run" + suffix)
+    assert suffix in log_list[-1] and os.path.exists(profit_file)
+    read_back = (
+        pd.read_csv(profit_file)
+        if output_format == "csv"
+        else pd.read_pickle(profit_file)
+    )
+    assert read_back.equals(profit_results)
@@ -0,0 +1,67 @@
+"""
+Tests of the profiler hooks of a run (profiler.py).
+"""
+
+import pstats
+import engine as eng
+import profiler as prof
+
+
+def _profile_input(functions):
+    return {"profile": "cprofile", "profileFunctions": functions}
+
+
+def _profiled_calls(profiler, name):
+    stats = pstats.Stats(profiler._profile).stats
+    return sum(calls for (_, _, func), (calls, *_) in stats.items() if func == name)
+
+
+def test_functions_restored_on_stop():
+    original = eng.get_aggregate_columns
+    profiler, log_list = prof.start_profiler(
+        _profile_input("get_aggregate_columns, not_a_function"), []
+    )
+    try:
+        assert eng.get_aggregate_columns is not original
+        assert "WARNING! Function 'not_a_function' not found" in log_list[0]
+        eng.get_aggregate_columns()
+    finally:
+        profiler.stop()
+
+    assert eng.get_aggregate_columns is original
+    assert _profiled_calls(profiler, "get_aggregate_columns") == 1
+
+    # Stopping again does nothing
+    profiler.stop()
+    assert eng.get_aggregate_columns is original
+
+
+def test_second_run_profiled_on_its_own():
+    original = eng.get_aggregate_columns
+    first, _ = prof.start_profiler(_profile_input("get_aggregate_columns"), [])
+    eng.get_aggregate_columns()
+    first.stop()
+
+    # Calls between the runs are not profiled
+    eng.get_aggregate_columns()
+
+    second, _ = prof.start_profiler(_profile_input("get_aggregate_columns"), [])
+    eng.get_aggregate_columns()
+    eng.get_aggregate_columns()
+    second.stop()
+
+    assert _profiled_calls(first, "get_aggregate_columns") == 1
+    assert _profiled_calls(second, "get_aggregate_columns") == 2
+    assert eng.get_aggregate_columns is original
+
+
+def test_profiler_of_failed_run_stopped():
+    original = eng.get_aggregate_columns
+    # A failed run does not stop its profiler: the next profiled run (or the batch runner) does
+    prof.start_profiler(_profile_input("get_aggregate_columns"), [])
+    profiler, _ = prof.start_profiler(_profile_input("get_aggregate_columns"), [])
+    assert eng.get_aggregate_columns.__wrapped__ is original
+
+    prof.stop_active_profiler()
+    assert eng.get_aggregate_columns is original
+    assert prof._active_profiler is None
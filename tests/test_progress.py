@@ -0,0 +1,74 @@
+"""
+Tests of the progress events and cancellation of model point file runs (progress.py).
+"""
+
+import os
+import signal
+import progress as prg
+
+
+def test_cancel_file(tmp_path):
+    cancel_file = str(tmp_path / "input.json.cancel")
+    cancel = prg.CancelToken(cancel_file, handle_signals=False)
+    assert not cancel.is_set()
+    open(cancel_file, "w").close()
+    assert cancel.is_set()
+    cancel.close()
+    assert not os.path.exists(cancel_file)
+
+
+def test_cancel_file_written_before_token(tmp_path):
+    # A cancel sent while the inputs are read, before the run creates its token, is not lost
+    cancel_file = str(tmp_path / "input.json.cancel")
+    open(cancel_file, "w").close()
+    cancel = prg.CancelToken(cancel_file, handle_signals=False)
+    assert cancel.is_set()
+    cancel.close()
+    assert not os.path.exists(cancel_file)
+
+
+def test_run_cancelled_before_first_batch(user_input, model_point_file, tmp_path):
+    import json
+    import main as mn
+
+    json_file = tmp_path / "input.json"
+    json_file.write_text(json.dumps(dict(user_input, modelPointFile=model_point_file)))
+    open(f"{json_file}.cancel", "w").close()
+
+    pv_results, metrics, log_list = mn.run(str(json_file), [], handle_signals=False)
+    assert metrics["cancelled"] and pv_results.empty
+    assert any("Run cancelled after 0/1 batches" in entry for entry in log_list)
+    assert not os.path.exists(f"{json_file}.cancel")
+
+
+def test_first_signal_cancels_second_stops():
+    previous = signal.getsignal(signal.SIGTERM)
+    cancel = prg.CancelToken()
+    try:
+        assert signal.getsignal(signal.SIGTERM) == cancel._handle
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert cancel.is_set()
+        # The next SIGTERM is handled as before the run (the process stops)
+        assert signal.getsignal(signal.SIGTERM) == previous
+        assert signal.getsignal(signal.SIGINT) == cancel._handle
+    finally:
+        cancel.close()
+    assert signal.getsignal(signal.SIGINT) == signal.default_int_handler
+
+
+def test_signals_not_trapped():
+    previous = signal.getsignal(signal.SIGTERM)
+    cancel = prg.CancelToken(handle_signals=False)
+    assert signal.getsignal(signal.SIGTERM) == previous
+    cancel.close()
+
+
+def test_progress_events_throttled():
+    events = []
+    progress = prg.ProgressReporter(3, 3000, interval=3600, callback=events.append)
+    for batch in range(1, 4):
+        progress.update(batch, batch * 1000, [])
+
+    # The first event, then the last batch only
+    assert [event["batch"] for event in events] == [1, 3]
+    assert events[-1]["policies"] == 3000
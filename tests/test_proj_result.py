@@ -0,0 +1,77 @@
+"""
+Tests of the padded and ragged containers of the projection results (proj_result.py).
+"""
+
+import numpy as np
+import pytest
+from proj_result import ProjectionResult, RaggedResult
+
+LENGTHS = np.array([6, 0, 3, 10, 1])
+
+
+@pytest.fixture
+def padded():
+    rng = np.random.default_rng(0)
+    result = ProjectionResult(
+        ["T_Index", "Profit_IF", "No_Pols_IF"],
+        n_policies=5,
+        n_months=10,
+        int_columns=["T_Index"],
+        column_dtypes={"No_Pols_IF": np.float32},
+    )
+    result["T_Index"] = np.arange(1, 11)
+    result["Profit_IF"] = rng.normal(size=(5, 10))
+    result["No_Pols_IF"] = rng.random(size=(5, 10))
+    # Nil after the periods of each policy, as in a projection
+    for col in ["Profit_IF", "No_Pols_IF"]:
+        result[col][np.arange(10) >= LENGTHS[:, np.newaxis]] = 0.0
+    return result
+
+
+def test_padding_mask():
+    ragged = RaggedResult(["Profit_IF"], LENGTHS, n_months=10)
+    mask = ragged.padding_mask()
+    np.testing.assert_array_equal(mask.sum(axis=1), LENGTHS)
+    assert mask[0, :6].all() and not mask[0, 6:].any()
+    np.testing.assert_array_equal(ragged.offsets, [0, 6, 6, 9, 19, 20])
+    assert ragged.n_rows == 20
+
+    with pytest.raises(ValueError, match="between 0 and 10"):
+        RaggedResult(["Profit_IF"], [11], n_months=10)
+
+
+def test_round_trip(padded):
+    ragged = RaggedResult.from_padded(padded, LENGTHS)
+    assert ragged["No_Pols_IF"].dtype == np.float32
+    np.testing.assert_array_equal(ragged.policy(3)[:, 1], padded["Profit_IF"][3])
+    assert ragged.policy(1).shape == (0, 2)
+
+    round_trip = ragged.to_padded()
+    assert round_trip.steps_per_year == padded.steps_per_year
+    for col in ["Profit_IF", "No_Pols_IF"]:
+        assert round_trip[col].dtype == padded[col].dtype
+        np.testing.assert_array_equal(round_trip[col], padded[col])
+    # Columns defined beyond the periods of each policy are zero-filled
+    np.testing.assert_array_equal(
+        round_trip["T_Index"], np.where(ragged.padding_mask(), padded["T_Index"], 0)
+    )
+
+
+def test_sums_match_padded(padded):
+    ragged = RaggedResult.from_padded(padded, LENGTHS)
+    values = ragged["Profit_IF"]
+
+    np.testing.assert_array_equal(
+        ragged.sum_by_policy(values), padded["Profit_IF"].sum(axis=1)
+    )
+    np.testing.assert_allclose(
+        ragged.sum_by_period(values), padded["Profit_IF"].sum(axis=0), rtol=1e-15
+    )
+    np.testing.assert_allclose(
+        ragged.sum_by_period(values, 2, 4, n_periods=12)[:10],
+        padded["Profit_IF"][2:4].sum(axis=0),
+        rtol=1e-15,
+    )
+    np.testing.assert_array_equal(
+        ragged.period_index(2, 4), np.concatenate([np.arange(3), np.arange(10)])
+    )
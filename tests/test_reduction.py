@@ -0,0 +1,121 @@
+"""
+Tests of the deterministic reduction of the aggregates of model point file runs (reduction.py).
+"""
+
+import numpy as np
+import pytest
+import data_read as read
+import engine as eng
+import reduction as red
+from proj_result import ProjectionResult, RaggedResult
+
+
+def _values(n_policies, n_months=24, seed=0):
+    rng = np.random.default_rng(seed)
+    return {"Profit_IF": rng.normal(size=(n_policies, n_months)) * 1e3}
+
+
+def _total(reduction):
+    return reduction.total()["Profit_IF"]
+
+
+def test_block_aligned_size():
+    assert red.get_block_aligned_size(1) == 1000
+    assert red.get_block_aligned_size(1000) == 1000
+    assert red.get_block_aligned_size(2500) == 3000
+    assert red.get_block_aligned_size(0) == 1000
+
+
+def test_total_independent_of_split():
+    values = _values(10, seed=1)
+    whole = red.BlockReduction(block_size=2)
+    whole.add_policies(values, 0)
+
+    # The same blocks added in ranges of various sizes, or merged from separate reductions (shards)
+    for sizes in [[2] * 5, [4, 6], [6, 2, 2], [10]]:
+        start = 0
+        merged = red.BlockReduction(block_size=2)
+        for size in sizes:
+            part = red.BlockReduction(block_size=2)
+            part.add_policies(
+                {"Profit_IF": values["Profit_IF"][start : start + size]}, start
+            )
+            merged.merge(part.nodes)
+            start += size
+        np.testing.assert_array_equal(_total(merged), _total(whole))
+
+    np.testing.assert_allclose(
+        _total(whole), values["Profit_IF"].sum(axis=0), rtol=1e-12
+    )
+
+
+def test_tree_order():
+    # The blocks are summed along the tree, (b0 + b1) + (b2 + b3), not as a running sum ((b0 + b1) + b2) + b3 = 1
+    values = {"Profit_IF": np.array([[1.0], [1e16], [-1e16], [1.0]])}
+    reduction = red.BlockReduction(block_size=1)
+    reduction.add_policies(values, 0)
+    assert reduction.total()["Profit_IF"][0] == 0.0
+
+
+def test_policies_start_on_block_boundary():
+    with pytest.raises(ValueError, match="block boundary"):
+        red.BlockReduction(block_size=2).add_policies(_values(2), 1)
+
+
+def test_zero_filled_periods():
+    reduction = red.BlockReduction(block_size=2)
+    reduction.add_policies(_values(3, n_months=5), 0, n_periods=8)
+    total = _total(reduction)
+    assert total.shape == (8,)
+    assert not total[5:].any()
+
+
+def test_ragged_policies_match_padded():
+    values = _values(5, n_months=12, seed=2)
+    lengths = np.array([12, 3, 0, 7, 12])
+    values["Profit_IF"][np.arange(12) >= lengths[:, np.newaxis]] = 0.0
+
+    padded = red.BlockReduction(block_size=2)
+    padded.add_policies(values, 0, n_periods=20)
+
+    result = ProjectionResult(["Profit_IF"], n_policies=5, n_months=12)
+    result["Profit_IF"] = values["Profit_IF"]
+    ragged = red.BlockReduction(block_size=2)
+    ragged.add_ragged_policies(
+        RaggedResult.from_padded(result, lengths), ["Profit_IF"], 0, n_periods=20
+    )
+    np.testing.assert_array_equal(_total(ragged), _total(padded))
+
+
+def test_batch_size_invariance(pricing_model_data, model_point_file):
+    model_points, _ = read.read_model_points(model_point_file, [])
+    aggregates = []
+    for batch_size in [1000, 2000, 3000]:
+        aggregate, _, _, _, _ = eng.run_model_point_batches(
+            pricing_model_data, [], model_points, batch_size
+        )
+        aggregates.append(aggregate)
+
+    for aggregate in aggregates[1:]:
+        for col in eng.get_aggregate_columns()[1:]:
+            np.testing.assert_array_equal(aggregate[col], aggregates[0][col])
+
+    # Ragged layout: same aggregates
+    aggregate, _, _, _, _ = eng.run_model_point_batches(
+        pricing_model_data, [], model_points, 2000, layout="ragged"
+    )
+    for col in eng.get_aggregate_columns()[1:]:
+        np.testing.assert_array_equal(aggregate[col], aggregates[0][col])
+
+
+def test_batch_size_rounded_to_blocks():
+    batch_size, log_list = eng.get_batch_size({"modelPointBatchSize": 2500}, [])
+    assert batch_size == 3000
+    assert (
+        "WARNING!" in log_list[0]
+        and "2,500 policies is rounded up to 3,000" in log_list[0]
+    )
+
+    for user_input in [{"modelPointBatchSize": 2000}, {}]:
+        batch_size, log_list = eng.get_batch_size(user_input, [])
+        assert batch_size % red.REDUCTION_BLOCK_SIZE == 0 and log_list == []
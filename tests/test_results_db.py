@@ -0,0 +1,171 @@
+"""
+Tests of the SQLite results store (results_db.py).
+"""
+
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+import main as mn
+import results_db as rdb
+from conftest import write_model_point_file
+
+MODEL_POINTS = {
+    "Age": [35, 50],
+    "Gender": ["Male", "Female"],
+    "Pol_Year": [10, 20],
+    "SumAssured": [100000.0, 200000.0],
+    "Contribution_perYear": [1200.0, 2400.0],
+}
+
+
+def _query(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def _pv_table(values, policy_ids=None):
+    pv_results = pd.DataFrame(
+        {
+            "Cashflow": ["PV_Contribution_IF", "PV_Profit_IF"] * len(values),
+            "Timing": ["BOP", "EOP"] * len(values),
+            "Present_Value": np.ravel(values),
+        }
+    )
+    if policy_ids is not None:
+        pv_results.insert(0, "Policy_ID", np.repeat(policy_ids, 2))
+    return pv_results
+
+
+def _cf_table(n_months=3):
+    return pd.DataFrame(
+        {
+            "T_Index": np.arange(1, n_months + 1),
+            "Age": 35,
+            "Profit_IF": np.arange(n_months) * 1.5,
+        }
+    )
+
+
+def test_round_trip(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    user_input = {"outputFileName": "run_a", "filePath": "model.xlsx"}
+
+    # A run of two policies, then a run of the first model point on its own
+    run_a, log_list = rdb.write_run_results(
+        db_path,
+        user_input,
+        MODEL_POINTS,
+        _cf_table(),
+        _pv_table([[1000.0, 10.0], [2000.0, 30.0]], [0, 1]),
+        [],
+        aggregated=True,
+    )
+    assert f"run_id = {run_a}" in log_list[0]
+    run_b, _ = rdb.write_run_results(
+        db_path,
+        dict(user_input, outputFileName="run_b"),
+        {key: values[:1] for key, values in MODEL_POINTS.items()},
+        _cf_table(),
+        _pv_table([[1000.0, 10.0]]),
+        [],
+    )
+
+    assert _query(db_path, "SELECT * FROM model_points ORDER BY run_id, policy_id") == [
+        (run_a, 1, 35, "Male", 10, 100000.0, 1200.0),
+        (run_a, 2, 50, "Female", 20, 200000.0, 2400.0),
+        (run_b, 1, 35, "Male", 10, 100000.0, 1200.0),
+    ]
+    assert _query(
+        db_path,
+        "SELECT run_id, policy_id, present_value FROM pv_results WHERE cashflow = 'PV_Profit_IF' "
+        "ORDER BY run_id, policy_id",
+    ) == [(run_a, 1, 10.0), (run_a, 2, 30.0), (run_b, 1, 10.0)]
+
+    # Only the inforce cashflows, summed over the policies (policy 0) or of the single policy (policy 1)
+    assert _query(
+        db_path,
+        "SELECT run_id, policy_id, cashflow, t_index, value FROM monthly_cashflows ORDER BY run_id, t_index",
+    ) == [
+        (run_a, 0, "Profit_IF", 1, 0.0),
+        (run_a, 0, "Profit_IF", 2, 1.5),
+        (run_a, 0, "Profit_IF", 3, 3.0),
+        (run_b, 1, "Profit_IF", 1, 0.0),
+        (run_b, 1, "Profit_IF", 2, 1.5),
+        (run_b, 1, "Profit_IF", 3, 3.0),
+    ]
+    assert json.loads(_query(db_path, "SELECT user_input FROM runs")[1][0]) == dict(
+        user_input, outputFileName="run_b"
+    )
+
+    # Queries by model point profile
+    female = rdb.query_pv_by_run(db_path, "PV_Profit_IF", gender="Female")
+    assert female[["run_name", "policy_id", "present_value"]].values.tolist() == [
+        ["run_a", 2, 30.0]
+    ]
+    male = rdb.query_pv_by_run(db_path, "PV_Profit_IF", gender="Male", pol_year=10)
+    assert male["run_name"].tolist() == ["run_a", "run_b"]
+    with pytest.raises(ValueError, match="Unsupported model point filter"):
+        rdb.query_pv_by_run(db_path, "PV_Profit_IF", term=10)
+
+
+def test_cohort_pvs_summed_over_policies(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    rdb.write_run_results(
+        db_path,
+        {"outputFileName": "plan"},
+        None,
+        _cf_table(),
+        _pv_table([[5000.0, 50.0]]),
+        [],
+        aggregated=True,
+    )
+
+    assert _query(db_path, "SELECT COUNT(*) FROM model_points") == [(0,)]
+    plan = rdb.query_pv_by_run(db_path, "PV_Profit_IF")
+    assert plan[["policy_id", "present_value"]].values.tolist() == [[0, 50.0]]
+    assert rdb.query_pv_by_run(db_path, "PV_Profit_IF", gender="Male").empty
+
+
+def test_model_point_file_run(user_input, tmp_path):
+    db_path = str(tmp_path / "results.db")
+    model_point_file = write_model_point_file(tmp_path / "model_points.csv", 1500)
+    json_file = tmp_path / "input.json"
+    json_file.write_text(
+        json.dumps(
+            dict(
+                user_input,
+                modelPointFile=model_point_file,
+                resultsDbPath=db_path,
+                outputGranularity="annual",
+            )
+        )
+    )
+    pv_results, _, _ = mn.run(str(json_file), [])
+
+    model_points = pd.read_csv(model_point_file)
+    assert _query(db_path, "SELECT COUNT(*) FROM model_points") == [(1500,)]
+    assert _query(
+        db_path, "SELECT COUNT(DISTINCT policy_id), MIN(policy_id) FROM pv_results"
+    ) == [(1500, 1)]
+
+    # The PVs of the female policies, by their row in the model point file
+    female = rdb.query_pv_by_run(db_path, "PV_Profit_IF", gender="Female")
+    female_ids = np.flatnonzero(model_points["Gender"] == "Female")
+    np.testing.assert_array_equal(female["policy_id"], female_ids + 1)
+    expected = pv_results.loc[
+        (pv_results["Cashflow"] == "PV_Profit_IF")
+        & pv_results["Policy_ID"].isin(female_ids),
+        "Present_Value",
+    ]
+    np.testing.assert_array_equal(female["present_value"], expected)
+
+    # The cashflows summed over the policies, monthly (not rolled up to the annual output)
+    assert _query(
+        db_path,
+        "SELECT DISTINCT policy_id, MAX(t_index) FROM monthly_cashflows GROUP BY policy_id",
+    ) == [(0, 1200)]
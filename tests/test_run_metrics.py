@@ -0,0 +1,87 @@
+"""
+Tests of the run instrumentation (run_metrics.py).
+"""
+
+import json
+import time
+import tracemalloc
+import numpy as np
+import pytest
+import run_metrics as rm
+
+
+def _read_metrics_file(output_path):
+    with open(output_path + "\\" + rm.METRICS_FILE_NAME) as f:
+        return json.load(f)
+
+
+def test_run_metrics_file(tmp_path):
+    log_list = []
+    metrics = rm.start_run_metrics()
+    log_list = rm.import_modules(["json", "numpy"], metrics, log_list)
+    assert tracemalloc.is_tracing()
+
+    with rm.measure_stage(
+        "project", metrics, log_list, n_policies=1000, n_rows=1200000
+    ):
+        values = np.ones(1000000)
+        time.sleep(0.01)
+    with rm.measure_stage("export", metrics, log_list):
+        del values
+
+    log_list = rm.write_run_metrics(metrics, str(tmp_path), log_list)
+    assert not tracemalloc.is_tracing()
+
+    run_metrics = _read_metrics_file(str(tmp_path))
+    assert list(run_metrics["import_times"]) == ["json", "numpy"]
+    assert run_metrics["trace_memory"] and not run_metrics["cancelled"]
+    project, export = run_metrics["stages"]
+    assert [project["stage"], export["stage"]] == ["project", "export"]
+
+    # Throughputs from the wall time of the stage, None without counts
+    assert project["wall_time_s"] >= 0.01
+    assert project["policies_per_second"] == pytest.approx(
+        1000 / project["wall_time_s"]
+    )
+    assert project["rows_per_second"] == pytest.approx(1200000 / project["wall_time_s"])
+    assert export["policies_per_second"] is None and export["rows_per_second"] is None
+
+    # The array of 8 MB is allocated in the first stage and freed in the second
+    assert project["stage_peak_memory_mb"] >= 7.6
+    assert project["memory_increase_mb"] >= 7.6
+    assert export["memory_increase_mb"] <= -7.6
+    assert run_metrics["peak_memory_mb"] == max(
+        stage["peak_memory_mb"] for stage in run_metrics["stages"]
+    )
+    assert run_metrics["total_wall_time_s"] >= project["wall_time_s"]
+
+    assert log_list[0].endswith("s).") and "Start-up: modules imported" in log_list[0]
+    assert "rows/s" in log_list[1] and "peak memory" in log_list[1]
+    assert "Run metrics file has been created" in log_list[-1]
+
+
+def test_run_metrics_without_memory_tracing(tmp_path):
+    log_list = []
+    metrics = rm.start_run_metrics(trace_memory=False)
+    assert not tracemalloc.is_tracing()
+
+    with rm.measure_stage("project", metrics, log_list, n_policies=10):
+        pass
+    log_list = rm.write_run_metrics(metrics, str(tmp_path), log_list)
+
+    run_metrics = _read_metrics_file(str(tmp_path))
+    assert run_metrics["peak_memory_mb"] is None
+    for field in ["peak_memory_mb", "stage_peak_memory_mb", "memory_increase_mb"]:
+        assert run_metrics["stages"][0][field] is None
+    assert not any("memory" in log_entry for log_entry in log_list)
+
+
+def test_without_metrics():
+    log_list = []
+    with rm.measure_stage("project", None, log_list, n_policies=10):
+        pass
+    assert log_list == []
+
+    # The modules are still imported and logged
+    log_list = rm.import_modules(["json"], None, log_list)
+    assert "json" in log_list[0]
@@ -0,0 +1,154 @@
+"""
+Tests of the sharded execution of model point file runs (shards.py): shard ranges, lock claims and merge.
+"""
+
+import os
+import pickle
+import time
+import numpy as np
+import pytest
+import engine as eng
+import reduction as red
+import shards
+
+
+def _age_lock(shard_dir, shard, seconds):
+    lock_file = shards._shard_file(shard_dir, shard, "lock")
+    past = time.time() - seconds
+    os.utime(lock_file, (past, past))
+
+
+def test_shard_ranges_cover_whole_blocks():
+    ranges = shards.get_shard_ranges(5500, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == 5500
+    assert all(
+        stop == next_start for (_, stop), (next_start, _) in zip(ranges, ranges[1:])
+    )
+    assert all(start % red.REDUCTION_BLOCK_SIZE == 0 for start, _ in ranges)
+    assert shards.get_shard_ranges(1000, 3) == [(0, 1000), (1000, 1000), (1000, 1000)]
+
+
+def test_claim_is_exclusive(tmp_path):
+    token = shards.claim_shard(str(tmp_path), 0)
+    assert token is not None
+    assert shards.claim_shard(str(tmp_path), 0) is None
+    assert shards.claim_shard(str(tmp_path), 0, stale_after=60) is None
+
+    shards.release_lock(str(tmp_path), 0, token)
+    assert shards.claim_shard(str(tmp_path), 0) is not None
+
+
+def test_stale_lock_taken_over_once(tmp_path):
+    shard_dir = str(tmp_path)
+    first = shards.claim_shard(shard_dir, 0)
+    _age_lock(shard_dir, 0, 120)
+
+    second = shards.claim_shard(shard_dir, 0, stale_after=60)
+    assert second is not None and second != first
+    # The new lock is fresh: it cannot be taken over again
+    assert shards.claim_shard(shard_dir, 0, stale_after=60) is None
+    assert not [name for name in os.listdir(shard_dir) if name.endswith(".stale")]
+
+    # The first worker notices at its next heartbeat, and does not remove the new lock
+    with pytest.raises(shards.ShardLockLost):
+        shards.refresh_lock(shard_dir, 0, first)
+    shards.release_lock(shard_dir, 0, first)
+    assert shards._read_lock_token(shards._shard_file(shard_dir, 0, "lock")) == second
+
+
+def test_heartbeat_keeps_lock_fresh(tmp_path):
+    shard_dir = str(tmp_path)
+    token = shards.claim_shard(shard_dir, 0)
+    _age_lock(shard_dir, 0, 120)
+    shards.refresh_lock(shard_dir, 0, token)
+    assert shards.claim_shard(shard_dir, 0, stale_after=60) is None
+
+
+def test_stale_check_does_not_remove_new_lock(tmp_path, monkeypatch):
+    # A lock replaced between the age check and the rename of another worker is put back
+    shard_dir = str(tmp_path)
+    lock_file = shards._shard_file(shard_dir, 0, "lock")
+    token = shards.claim_shard(shard_dir, 0)
+    getmtime = os.path.getmtime
+    calls = []
+
+    def getmtime_stale_once(path):
+        calls.append(path)
+        return 0.0 if len(calls) == 1 else getmtime(path)
+
+    monkeypatch.setattr(os.path, "getmtime", getmtime_stale_once)
+    shards._remove_stale_lock(lock_file, 60)
+    monkeypatch.undo()
+
+    assert shards._read_lock_token(lock_file) == token
+    assert os.listdir(shard_dir) == [os.path.basename(lock_file)]
+
+
+def test_run_and_merge_match_single_run(
+    user_input, model_point_file, pricing_model_data, tmp_path
+):
+    user_input = dict(user_input, modelPointFile=model_point_file)
+    shard_dir = str(tmp_path / "shards")
+
+    projected, _ = shards.run_shards(user_input, shard_dir, 4, [], stale_after=60)
+    assert projected == [0, 1, 2, 3]
+    assert sorted(os.listdir(shard_dir)) == [
+        "shard_00000.pkl",
+        "shard_00001.pkl",
+        "shard_00002.pkl",
+        "shard_00003.pkl",
+        "shards.json",
+    ]
+
+    aggregate, pv_results, _ = shards.merge_shards(user_input, shard_dir, [])
+
+    import data_read as read
+
+    model_points, _ = read.read_model_points(model_point_file, [])
+    expected, expected_pv, _, _, _ = eng.run_model_point_batches(
+        pricing_model_data, [], model_points, 3000
+    )
+    for col in eng.get_aggregate_columns()[1:]:
+        np.testing.assert_array_equal(aggregate[col], expected[col])
+    assert pv_results.equals(expected_pv)
+
+
+def test_merge_rejects_other_inputs(user_input, model_point_file, tmp_path):
+    user_input = dict(user_input, modelPointFile=model_point_file)
+    shard_dir = str(tmp_path / "shards")
+    shards.run_shards(user_input, shard_dir, 2, [])
+
+    with pytest.raises(ValueError, match="another run"):
+        shards.merge_shards(dict(user_input, precisionMode="single"), shard_dir, [])
+
+    # A shard result left over from other inputs
+    result_file = shards._shard_file(shard_dir, 1, "pkl")
+    with open(result_file, "rb") as f:
+        shard_result = pickle.load(f)
+    shard_result["input_hash"] = "other"
+    with open(result_file, "wb") as f:
+        pickle.dump(shard_result, f)
+    with pytest.raises(ValueError, match="other inputs"):
+        shards.merge_shards(user_input, shard_dir, [])
+
+
+def test_merge_without_pv_results(user_input, model_point_file, tmp_path):
+    user_input = dict(user_input, modelPointFile=model_point_file)
+    shard_dir = str(tmp_path / "shards")
+    shards.run_shards(user_input, shard_dir, 2, [])
+    for shard in range(2):
+        result_file = shards._shard_file(shard_dir, shard, "pkl")
+        with open(result_file, "rb") as f:
+            shard_result = pickle.load(f)
+        shard_result["pv_results"] = shard_result["pv_results"].iloc[:0]
+        with open(result_file, "wb") as f:
+            pickle.dump(shard_result, f)
+
+    _, pv_results, _ = shards.merge_shards(user_input, shard_dir, [])
+    assert len(pv_results) == 0
+    assert list(pv_results.columns) == [
+        "Policy_ID",
+        "Cashflow",
+        "Timing",
+        "Present_Value",
+    ]
@@ -0,0 +1,104 @@
+"""
+Tests of the message protocol of the warm Python worker (worker.py).
+"""
+
+import io
+import json
+import worker
+from conftest import write_model_point_file
+
+
+def _write_job(tmp_path, job_id, user_input, **inputs):
+    json_file = tmp_path / f"{job_id}.json"
+    json_file.write_text(json.dumps(dict(user_input, outputFileName=job_id, **inputs)))
+    return json.dumps({"id": job_id, "jsonPath": str(json_file)}) + "\n"
+
+
+def _serve(lines):
+    channel = io.StringIO()
+    assert worker.serve(io.StringIO("".join(lines)), channel) == 0
+    messages = [json.loads(line) for line in channel.getvalue().splitlines()]
+    events = {}
+    for message in messages:
+        events.setdefault(message["id"], []).append(message)
+    return events
+
+
+def test_jobs_until_stop(user_input, tmp_path):
+    model_point_file = write_model_point_file(tmp_path / "model_points.csv", 2100)
+    events = _serve(
+        [
+            _write_job(tmp_path, "single", user_input),
+            "\n",
+            _write_job(
+                tmp_path,
+                "batches",
+                user_input,
+                modelPointFile=model_point_file,
+                modelPointBatchSize=1000,
+                timeStep="annual",
+                progressInterval=1e-6,
+            ),
+            _write_job(tmp_path, "missing", user_input, filePath="missing.xlsx"),
+            json.dumps({"command": "stop"}) + "\n",
+            _write_job(tmp_path, "after_stop", user_input),
+        ]
+    )
+    assert list(events) == ["single", "batches", "missing"]
+
+    single = events["single"]
+    assert single[0]["event"] == "started"
+    assert {message["event"] for message in single[1:-1]} == {"log"}
+    completed = single[-1]
+    assert completed["event"] == "completed"
+    assert {row["Cashflow"] for row in completed["pvResults"]} >= {"PV_Profit_IF"}
+    assert completed["equivalence"] is None and "error" not in completed
+    assert completed["wallTime"] > 0 and completed["stages"]
+    assert completed["workbookCached"] == (
+        "read_pricing_model_data" not in completed["stages"]
+    )
+    # The job log is sent as it is written, and the JSON file is deleted after the run
+    assert any("Output file has been created" in m["message"] for m in single[1:-1])
+    assert not (tmp_path / "single.json").exists()
+
+    progress = [m for m in events["batches"] if m["event"] == "progress"]
+    assert [m["batch"] for m in progress] == [1, 2, 3]
+    assert progress[-1]["policies"] == 2100 and progress[-1]["batches"] == 3
+    assert events["batches"][-1]["event"] == "completed"
+    assert {row["Policy_ID"] for row in events["batches"][-1]["pvResults"]} == set(
+        range(2100)
+    )
+
+    failed = events["missing"][-1]
+    assert failed["event"] == "failed" and "missing.xlsx" in failed["error"]
+    assert "pvResults" not in failed
+
+
+def test_cancelled_job(user_input, tmp_path):
+    model_point_file = write_model_point_file(tmp_path / "model_points.csv", 300)
+    job = _write_job(tmp_path, "batches", user_input, modelPointFile=model_point_file)
+    open(tmp_path / "batches.json.cancel", "w").close()
+
+    cancelled = _serve([job])["batches"][-1]
+    assert cancelled["event"] == "cancelled" and cancelled["pvResults"] == []
+
+
+def test_equivalence_failed_job(user_input, tmp_path):
+    job = _write_job(
+        tmp_path,
+        "tight",
+        user_input,
+        precisionMode="single",
+        equivalenceCheck=True,
+        equivalenceAtol=1e-9,
+        equivalenceRtol=1e-12,
+    )
+
+    # The run has written its output: its results are sent with the summary of the check
+    events = _serve([job])["tight"]
+    assert any("Output file has been created" in m.get("message", "") for m in events)
+    message = events[-1]
+    assert message["event"] == "equivalence_failed"
+    assert message["error"].startswith("Equivalence check failed")
+    assert message["equivalence"]["passed"] is False
+    assert message["pvResults"] and message["stages"]